@@ -82,7 +82,8 @@ export async function PUT(
 
     const updatedProject = await projectsCollection.findOneAndUpdate(
       { _id: new ObjectId(id) },
-      { $set: updates },
+      // updated_at lets the call processing service detect vocabulary changes
+      { $set: { ...updates, updated_at: new Date() } },
       { returnDocument: "after" }
     );
 
@@ -2,6 +2,7 @@ from pymongo import MongoClient
 import os
 from dotenv import load_dotenv
 import logging
+from datetime import datetime
 
 # Configurarea logging-ului
 logging.basicConfig(level=logging.INFO,
@@ -48,6 +49,9 @@ def add_words_to_project(project_name, words_dict):
                 else:
                     cuvinte_existente[category] += 1
 
+        # Semnalează serviciului de procesare că vocabularul proiectului s-a schimbat
+        project["updated_at"] = datetime.utcnow()
+
         projects_collection.update_one(
             {"project_name": project_name},
             {"$set": project},
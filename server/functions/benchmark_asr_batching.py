@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+import argparse
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.config import ASR_MODEL_ID
+from modules.models import load_asr_model, configure_asr_pipeline
+from modules.audio_processing import load_and_preprocess_audio
+from modules.call_processing import collect_windows, transcribe_windows
+
+DEFAULT_AUDIO = os.path.join(os.path.dirname(__file__), "..", "..", "calls",
+                             "E_mirabela.ivan_D_2024-06-06_H_093412_240_CLID_770596525_Full Experience.wav")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure ASR throughput for different batch sizes.")
+    parser.add_argument("--audio", default=DEFAULT_AUDIO)
+    parser.add_argument("--model", default=ASR_MODEL_ID, help="Use a smaller Whisper checkpoint for quick CPU runs.")
+    parser.add_argument("--batch-sizes", default="1,2,4,8,16")
+    parser.add_argument("--max-windows", type=int, default=32)
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    asr_model, processor = load_asr_model(args.model, device)
+    asr_pipe = configure_asr_pipeline(asr_model, processor, device, None)
+
+    audio, sample_rate = load_and_preprocess_audio(args.audio)
+    windows = collect_windows(audio, sample_rate)[:args.max_windows]
+    audio_seconds = sum(end - start for _, _, start, end in windows)
+
+    # Warm up so the first measured batch size does not pay for lazy initialisation
+    transcribe_windows(asr_pipe, audio, sample_rate, windows[:1], 1)
+
+    print(f"Windows: {len(windows)} ({audio_seconds:.0f}s of audio), model: {args.model}, device: {device}")
+    for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+        start = time.perf_counter()
+        transcribe_windows(asr_pipe, audio, sample_rate, windows, batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"batch_size={batch_size:<3} {len(windows) / elapsed:6.2f} segments/s  {audio_seconds / elapsed:6.2f}x real time")
+
+
+if __name__ == "__main__":
+    main()
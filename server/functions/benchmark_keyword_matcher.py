@@ -0,0 +1,83 @@
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.keyword_matcher import KeywordMatcher
+
+ALPHABET = "abcdefghijklmnoprstuvăâîșț"
+CATEGORIES = ["Greetings", "Companies", "Goodbyes", "Availability", "Company Inquiry", "Positive", "Negative", "Common"]
+
+
+def random_word(rng):
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(2, 9)))
+
+
+def build_vocabulary(rng, words_per_category):
+    vocabulary = {}
+    for name in CATEGORIES:
+        words = set()
+        while len(words) < words_per_category:
+            # Mix single words and short phrases, as the project word lists do
+            words.add(" ".join(random_word(rng) for _ in range(rng.randint(1, 3))))
+        vocabulary[name] = words
+    return vocabulary
+
+
+def build_text(rng, vocabulary, word_count):
+    known = [word for words in vocabulary.values() for word in words]
+    tokens = [rng.choice(known) if rng.random() < 0.05 else random_word(rng) for _ in range(word_count)]
+    return " ".join(tokens) + "."
+
+
+def naive_scan(text, vocabulary):
+    """The per-word regex search previously done by check_for_words."""
+    return {
+        name: [word for word in words if re.search(r'\b' + re.escape(word) + r'\b', text)]
+        for name, words in vocabulary.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-word regex search with the single-pass keyword matcher.")
+    parser.add_argument("--words-per-category", type=int, default=300)
+    parser.add_argument("--text-words", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = build_vocabulary(rng, args.words_per_category)
+    text = build_text(rng, vocabulary, args.text_words)
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher(vocabulary)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        expected = naive_scan(text, vocabulary)
+    naive_seconds = (time.perf_counter() - start) / args.repeat
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        actual = matcher.scan(text, vocabulary)
+    matcher_seconds = (time.perf_counter() - start) / args.repeat
+
+    if actual != expected:
+        raise SystemExit("Matcher results differ from the regex search")
+
+    total_hits = sum(len(words) for words in actual.values())
+    print(f"{len(CATEGORIES)} categories x {args.words_per_category} words, text of {len(text)} characters, {total_hits} hits")
+    print(f"Matcher build:     {build_seconds * 1000:8.1f} ms (once per vocabulary)")
+    print(f"Per-word regex:    {naive_seconds * 1000:8.1f} ms per transcript")
+    print(f"Single-pass scan:  {matcher_seconds * 1000:8.1f} ms per transcript")
+    print(f"Speed-up:          {naive_seconds / matcher_seconds:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import torch
+from scipy.io import wavfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.config import ASR_MODEL_ID
+from modules.models import load_asr_model, configure_asr_pipeline
+from modules.audio_processing import load_and_preprocess_audio, extract_segment, to_pipeline_input
+
+DEFAULT_AUDIO = os.path.join(os.path.dirname(__file__), "..", "..", "calls",
+                             "E_mirabela.ivan_D_2024-06-06_H_093412_240_CLID_770596525_Full Experience.wav")
+
+
+def transcribe_via_temp_file(asr_pipe, audio_segment, sample_rate):
+    """Previous behaviour: write the segment to a temporary WAV and let the pipeline decode it again."""
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_segment_file:
+        wavfile.write(temp_segment_file.name, sample_rate, audio_segment.float().numpy())
+    try:
+        return asr_pipe(temp_segment_file.name)
+    finally:
+        os.remove(temp_segment_file.name)
+
+
+def transcribe_in_memory(asr_pipe, audio_segment, sample_rate):
+    """Current behaviour: hand the buffer straight to the pipeline."""
+    return asr_pipe(to_pipeline_input(audio_segment, sample_rate))
+
+
+def run(asr_pipe, channel, sample_rate, segment_count, segment_length, transcribe):
+    start = time.perf_counter()
+    for i in range(segment_count):
+        audio_segment = extract_segment(channel, i * segment_length, (i + 1) * segment_length, sample_rate)
+        transcribe(asr_pipe, audio_segment, sample_rate)
+    elapsed = time.perf_counter() - start
+    return segment_count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare temp-file and in-memory segment feeding for the ASR pipeline.")
+    parser.add_argument("--audio", default=DEFAULT_AUDIO)
+    parser.add_argument("--model", default=ASR_MODEL_ID, help="Use a smaller Whisper checkpoint for quick CPU runs.")
+    parser.add_argument("--segments", type=int, default=10)
+    parser.add_argument("--segment-length", type=float, default=5.0)
+    args = parser.parse_args()
+
+    device = torch.device("cpu")
+    asr_model, processor = load_asr_model(args.model, device)
+    asr_pipe = configure_asr_pipeline(asr_model, processor, device, None)
+
+    audio, sample_rate = load_and_preprocess_audio(args.audio)
+    channel = audio[0]
+    available = int(len(channel) / sample_rate / args.segment_length)
+    segment_count = min(args.segments, available)
+
+    # Warm up so the first measured run does not pay for lazy initialisation
+    transcribe_in_memory(asr_pipe, extract_segment(channel, 0, args.segment_length, sample_rate), sample_rate)
+
+    temp_rate = run(asr_pipe, channel, sample_rate, segment_count, args.segment_length, transcribe_via_temp_file)
+    memory_rate = run(asr_pipe, channel, sample_rate, segment_count, args.segment_length, transcribe_in_memory)
+
+    print(f"Segments: {segment_count} x {args.segment_length}s, model: {args.model}, threads: {torch.get_num_threads()}")
+    print(f"Temp WAV files: {temp_rate:.2f} segments/s")
+    print(f"In-memory:      {memory_rate:.2f} segments/s")
+    print(f"Speed-up:       {memory_rate / temp_rate:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
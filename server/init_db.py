@@ -1,11 +1,146 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING
+from pymongo.errors import OperationFailure
 import os
+import argparse
+from datetime import datetime
 from dotenv import load_dotenv
 import time
 
 load_dotenv()
 
-def init_db():
+# Indexes of the access paths used by the server: collection -> [(name, keys, options)]
+INDEXES = {
+    'calls': [
+        # check_for_to_process_files polls for status "to_process"
+        ('status_1', [('status', ASCENDING)], {}),
+        # register_call upserts by filename within a project
+        ('filename_1_agent_info.project_1', [('filename', ASCENDING), ('agent_info.project', ASCENDING)], {'unique': True}),
+        # rescore_project walks the calls of a project in _id order
+        ('agent_info.project_1__id_1', [('agent_info.project', ASCENDING), ('_id', ASCENDING)], {}),
+    ],
+    'agents': [
+        # Agent upserts by username within a project
+        ('username_1_project_1', [('username', ASCENDING), ('project', ASCENDING)], {'unique': True}),
+    ],
+    'projects': [
+        # Vocabulary and word list lookups by project name
+        ('project_name_1', [('project_name', ASCENDING)], {'unique': True}),
+    ],
+}
+
+
+def claim_query():
+    """The filter claim_calls polls with right now, taken from the server code so the two cannot drift apart."""
+    # Imported here: the server modules load the models and are only needed by --check
+    from modules.job_queue import claimable_filter
+    from modules.config import JOB_MAX_ATTEMPTS
+    return claimable_filter(datetime.utcnow(), JOB_MAX_ATTEMPTS)
+
+
+# Representative queries of modules/database.py, modules/job_queue.py, modules/persistence.py and
+# modules/vocabulary.py: (name, collection, filter) or (name, collection, filter, sort); a callable filter
+# is built when the check runs
+HOT_QUERIES = [
+    # claim_calls polls with job_queue.claimable_filter, oldest call first
+    ('claim_calls', 'calls', claim_query, [('_id', ASCENDING)]),
+    ('check_for_to_process_files', 'calls', {'status': 'to_process'}),
+    ('register_call', 'calls', {'filename': 'example.wav', 'agent_info.project': 'example'}),
+    ('rescore_project', 'calls', {'agent_info.project': 'example', 'status': 'processed'}),
+    ('insert_agent_info / agent_upsert', 'agents', {'username': 'example', 'project': 'example'}),
+    ('load_words_from_mongodb / fetch_project_document', 'projects', {'project_name': 'example'}),
+]
+
+
+def find_duplicates(collection, keys):
+    """Returns up to 10 key combinations that occur more than once and would block a unique index."""
+    group_id = {field.replace('.', '_'): f'${field}' for field, _ in keys}
+    pipeline = [
+        {'$group': {'_id': group_id, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}},
+        {'$limit': 10},
+    ]
+    return list(collection.aggregate(pipeline, allowDiskUse=True))
+
+
+def ensure_indexes(db):
+    """Creates the missing indexes and checks that existing ones have the expected keys and options."""
+    ok = True
+    for collection_name, indexes in INDEXES.items():
+        collection = db[collection_name]
+        existing = collection.index_information()
+        for name, keys, options in indexes:
+            if name in existing:
+                index = existing[name]
+                if [(field, int(direction)) for field, direction in index['key']] != keys or bool(index.get('unique')) != bool(options.get('unique')):
+                    print(f"Index {collection_name}.{name} exists with different keys or options: {index}")
+                    ok = False
+                continue
+            try:
+                collection.create_index(keys, name=name, **options)
+                print(f"Created index {collection_name}.{name}")
+            except OperationFailure as e:
+                ok = False
+                print(f"Could not create index {collection_name}.{name}: {e}")
+                if e.code == 11000:
+                    for duplicate in find_duplicates(collection, keys):
+                        print(f"  Duplicate {duplicate['_id']} occurs {duplicate['count']} times")
+    return ok
+
+
+def plan_stages(plan):
+    """Yields the stage names of an explain plan tree."""
+    yield plan.get('stage')
+    for child in ('inputStage', 'queryPlan'):
+        if child in plan:
+            yield from plan_stages(plan[child])
+    for stage in plan.get('inputStages', []):
+        yield from plan_stages(stage)
+    # Sharded clusters explain the plan of every shard
+    for shard in plan.get('shards', []):
+        yield from plan_stages(shard.get('winningPlan', {}))
+
+
+def plan_index_names(plan):
+    """Yields the names of the indexes scanned in an explain plan tree."""
+    if plan.get('indexName'):
+        yield plan['indexName']
+    for child in ('inputStage', 'queryPlan'):
+        if child in plan:
+            yield from plan_index_names(plan[child])
+    for stage in plan.get('inputStages', []):
+        yield from plan_index_names(stage)
+    for shard in plan.get('shards', []):
+        yield from plan_index_names(shard.get('winningPlan', {}))
+
+
+def check_queries(db):
+    """
+    Explains the hot queries and reports the ones that still scan their collection.
+
+    A plan that only walks the _id index scans the whole collection as well, in _id order, so it
+    is reported like a COLLSCAN.
+    """
+    scanning = []
+    for name, collection_name, query, *sort in HOT_QUERIES:
+        if callable(query):
+            query = query()
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort[0])
+        plan = cursor.explain()['queryPlanner']['winningPlan']
+        stages = set(plan_stages(plan))
+        index_names = set(plan_index_names(plan))
+        if 'COLLSCAN' in stages:
+            scanning.append(name)
+            print(f"COLLSCAN  {name}: {collection_name}.find({query})")
+        elif index_names == {'_id_'}:
+            scanning.append(name)
+            print(f"_id scan  {name}: {collection_name}.find({query})")
+        else:
+            print(f"indexed   {name}: {collection_name}.find({query}) via {', '.join(sorted(s for s in stages if s))}")
+    return scanning
+
+def init_db(check=False):
     max_retries = 5
     retry_interval = 5  # seconds
 
@@ -35,8 +170,12 @@ def init_db():
                     if collection not in word_db.list_collection_names():
                         word_db.create_collection(collection)
 
-            print("Database initialized successfully")
-            return
+            indexes_ok = ensure_indexes(db)
+            if check and check_queries(db):
+                indexes_ok = False
+
+            print("Database initialized successfully" if indexes_ok else "Database initialized with index problems")
+            return indexes_ok
         except Exception as e:
             print(f"Attempt {attempt + 1} failed: {str(e)}")
             if attempt < max_retries - 1:
@@ -47,4 +186,8 @@ def init_db():
                 raise
 
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Create the collections and indexes used by the server.")
+    parser.add_argument('--check', action='store_true', help="Explain the hot queries and report the ones that scan a collection.")
+    args = parser.parse_args()
+    if not init_db(check=args.check):
+        raise SystemExit(1)
\ No newline at end of file
@@ -1,22 +1,23 @@
-import os
-import time
 import logging
 import signal
-from datetime import datetime
-from typing import Set, Tuple, List, Dict, Any
+import argparse
+from typing import Tuple, Any
 from modules import (
-    ASR_MODEL_ID,
-    ASSISTANT_MODEL_ID,
-    SPACY_MODEL,
-    SENTIMENT_MODEL,
-    AUDIO_PATH,
-    CHECK_INTERVAL,
+    WORKER_COUNT,
+    WORKER_THREADS,
+    RESCORE_PROCESSES,
 )
-from modules.rating_projection import project_customer_rating
-from modules.utils import get_device
-from modules.database import load_words_from_mongodb, check_for_to_process_files, check_database_connection
-from modules.call_processing import process_files
-from modules.models import load_asr_model, load_assistant_model, load_spacy_model, configure_sentiment_pipeline
+from modules.database import check_database_connection
+from modules.job_queue import claim_calls
+from modules.persistence import ensure_required_indexes
+from modules.local_state import ProcessedFiles
+from modules.ingestion import Ingestion
+from modules.call_pipeline import process_calls
+from modules.model_registry import get_asr_pipeline, get_sentiment_pipeline, get_spacy_model, log_model_stats
+from modules.workers import run_worker_fleet
+from modules.rescoring import rescore_calls
+from modules.upload_manifest import reconcile_uploads
+from modules.summarization import close_summarization_service
 
 def configure_logging():
     logging.basicConfig(
@@ -32,97 +33,84 @@ def signal_handler(sig: int, frame: Any):
     logging.info('Exiting...')
     exit(0)
 
-def initialize_models() -> Tuple[Any, Any, Any, Any, Any]:
-    device = get_device()
-    asr_model, processor = load_asr_model(ASR_MODEL_ID, device)
-    assistant_model = load_assistant_model(ASSISTANT_MODEL_ID, device)
-    nlp = load_spacy_model(SPACY_MODEL)
-    sentiment_pipeline = configure_sentiment_pipeline(SENTIMENT_MODEL)
-    return asr_model, processor, assistant_model, nlp, sentiment_pipeline
+def initialize_models() -> Tuple[Any, Any, Any]:
+    asr_pipe = get_asr_pipeline()
+    sentiment_pipe = get_sentiment_pipeline()
+    nlp = get_spacy_model()
+    log_model_stats()
+    return asr_pipe, sentiment_pipe, nlp
 
-def process_files_in_directory(
-    project_name: str,
-    processed_files: Set[str],
-    asr_model: Any,
-    processor: Any,
-    assistant_model: Any,
-    sentiment_pipeline: Any,
-    nlp: Any
-) -> None:
-    project_path = os.path.join(AUDIO_PATH, project_name)
-    audio_files = [f for f in os.listdir(project_path) if f not in processed_files]
-    
-    if not audio_files:
-        logging.info(f"No new files to process in {project_name}.")
-        return
-
-    files_to_process = [
-        {"filename": f, "file_path": os.path.join(project_path, f)}
-        for f in audio_files
-    ]
-    process_files(
-        project_name,
-        files_to_process,
-        asr_model,
-        processor,
-        assistant_model,
-        sentiment_pipeline,
-        nlp,
-        processed_files
-    )
+def parse_args():
+    parser = argparse.ArgumentParser(description="Call processing service.")
+    parser.add_argument("--workers", type=int, default=WORKER_COUNT,
+                        help="Number of worker processes; 0 processes calls in this process.")
+    parser.add_argument("--threads-per-worker", type=int, default=WORKER_THREADS,
+                        help="Torch threads per worker (default: CPU cores / workers).")
+    parser.add_argument("--rescore", action="store_true",
+                        help="Recompute the scores of processed calls from their stored segments, then exit.")
+    parser.add_argument("--project", action="append", dest="projects",
+                        help="Project to rescore; repeat for several (default: every project).")
+    parser.add_argument("--rescore-processes", type=int, default=RESCORE_PROCESSES,
+                        help="Rescoring processes (default: one per CPU core).")
+    parser.add_argument("--restart", action="store_true",
+                        help="Rescore from the first call instead of resuming the previous run.")
+    parser.add_argument("--reconcile-uploads", action="store_true",
+                        help="Upload the files under AUDIO_PATH that are not in the upload manifest yet, then exit.")
+    return parser.parse_args()
 
 def main():
     try:
+        args = parse_args()
         configure_logging()
         signal.signal(signal.SIGINT, signal_handler)
 
+        if args.reconcile_uploads:
+            # Only talks to Firebase Storage, so it does not need MongoDB
+            reconcile_uploads()
+            return
+
         if not check_database_connection():
             logging.error("Failed to connect to MongoDB. Exiting...")
             return
 
-        processed_files: Set[str] = set()
-        asr_model, processor, assistant_model, nlp, sentiment_pipeline = initialize_models()
-        
+        # Without the unique call index two workers can register the same call
+        if not ensure_required_indexes():
+            logging.error("Required MongoDB indexes are missing. Exiting...")
+            return
+
+        if args.rescore:
+            rescore_calls(args.projects, args.rescore_processes, restart=args.restart)
+            return
+
+        if args.workers > 0:
+            run_worker_fleet(args.workers, args.threads_per_worker)
+            return
+
+        processed_files = ProcessedFiles()
+        asr_pipe, sentiment_pipe, nlp = initialize_models()
+        ingestion = Ingestion(processed_files)
+        ingestion.start()
 
         while True:
-            to_process_files = check_for_to_process_files()
+            to_process_files = claim_calls()
 
             if to_process_files:
-                for file_info in to_process_files:
-                    project_name = file_info["agent_info"]["project"]
-                    load_words_from_mongodb(project_name)
-                    process_files(
-                        project_name,
-                        [file_info],
-                        asr_model,
-                        processor,
-                        assistant_model,
-                        sentiment_pipeline,
-                        nlp,
-                        processed_files,
-                        force_process=True
-                    )
-                    processed_files.add(file_info["filename"])
-            else:
-                project_dirs = [
-                    d for d in os.listdir(AUDIO_PATH)
-                    if os.path.isdir(os.path.join(AUDIO_PATH, d))
+                calls = [
+                    (file_info, file_info["agent_info"]["project"], True)
+                    for file_info in to_process_files
                 ]
-                for project_name in project_dirs:
-                    load_words_from_mongodb(project_name)
-                    process_files_in_directory(
-                        project_name,
-                        processed_files,
-                        asr_model,
-                        processor,
-                        assistant_model,
-                        sentiment_pipeline,
-                        nlp
-                    )
+            else:
+                calls = ingestion.collect_local_calls()
 
-            time.sleep(CHECK_INTERVAL)
+            started = process_calls(calls, asr_pipe, sentiment_pipe, nlp, processed_files) if calls else 0
+            # Look again right away while there is work, otherwise wait for an event or the next poll;
+            # local files that were skipped or failed before they started do not count as work
+            ingestion.wait(found_work=bool(to_process_files) or started > 0)
     except Exception as e:
         logging.exception(f"An error occurred: {e}")
+    finally:
+        # Summaries still being generated are written before the process exits
+        close_summarization_service()
 
 if __name__ == "__main__":
     main()
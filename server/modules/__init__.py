@@ -1,15 +1,31 @@
 from .config import *
 from .utils import *
 from .database import *
+from .job_queue import *
+from .persistence import *
 from .models import *
+from .model_registry import *
 from .audio_processing import *
 from .text_processing import *
 from .call_info import *
+from .conversation_metrics import *
 from .call_processing import *
+from .call_pipeline import *
+from .keyword_matcher import *
+from .vocabulary import *
 from .evaluation import *
 from .firebase_config import *
+from .local_bucket import *
 from .firebase_storage import *
 from .impact import *
 from .rating_projection import *
 from .satisfaction import *
 from .gemini_ai import *
+from .prompt_preparation import *
+from .summarization import *
+from .local_state import *
+from .result_cache import *
+from .upload_manifest import *
+from .rescoring import *
+from .ingestion import *
+from .workers import *
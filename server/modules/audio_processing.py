@@ -1,17 +1,183 @@
 import torchaudio
-import tempfile
-from scipy.io import wavfile
 from pydub import AudioSegment
+import os
+import math
+import struct
 import torch
 import numpy as np
 import logging
+from functools import lru_cache
+from .config import (
+    TARGET_SAMPLE_RATE, AUDIO_BUFFER_DTYPE, STREAMING_MIN_DURATION, STREAMING_CHUNK_DURATION, RESAMPLE_BLOCK_DURATION, VAD_FRAME_DURATION, VAD_ENERGY_THRESHOLD_DB, VAD_NOISE_MARGIN_DB, VAD_NOISE_FLOOR_CAP_DB, VAD_MIN_SPEECH_DURATION,
+    VAD_MAX_SEGMENT_DURATION, VAD_MERGE_GAP, VAD_PADDING
+)
 
-def load_and_preprocess_audio(audio_path):
-    # Load the audio file
-    audio, sample_rate = torchaudio.load(audio_path)
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
 
-    # Normalize the audio to the range [-1, 1]
-    audio = audio / torch.max(torch.abs(audio))
+# Sample layouts that can be memory-mapped directly: (format tag, bits per sample) -> dtype
+MEMMAP_DTYPES = {
+    (WAVE_FORMAT_PCM, 8): np.dtype("u1"),
+    (WAVE_FORMAT_PCM, 16): np.dtype("<i2"),
+    (WAVE_FORMAT_PCM, 32): np.dtype("<i4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): np.dtype("<f4"),
+}
+
+def probe_wav(audio_path):
+    """
+    Reads the format of a RIFF/WAVE file from its header without decoding any samples.
+
+    Returns a dict with sample_rate, num_channels, bits_per_sample, format_tag, data_offset,
+    num_frames and duration, or None if the file is not a WAV file.
+    """
+    file_size = os.path.getsize(audio_path)
+    with open(audio_path, "rb") as audio_file:
+        header = audio_file.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            return None
+
+        fmt = None
+        while True:
+            chunk_header = audio_file.read(8)
+            if len(chunk_header) < 8:
+                return None
+            chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+            if chunk_id == b"fmt ":
+                fmt_data = audio_file.read(chunk_size)
+                format_tag, num_channels, sample_rate, _, block_align, bits_per_sample = struct.unpack("<HHIIHH", fmt_data[:16])
+                if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt_data) >= 26:
+                    # The real format is the first two bytes of the sub-format GUID
+                    format_tag = struct.unpack("<H", fmt_data[24:26])[0]
+                fmt = (format_tag, num_channels, sample_rate, block_align, bits_per_sample)
+                if chunk_size % 2:
+                    audio_file.seek(1, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    return None
+                format_tag, num_channels, sample_rate, block_align, bits_per_sample = fmt
+                data_offset = audio_file.tell()
+                # Recorders that stream to disk may leave the size unset; trust the file size instead
+                data_size = min(chunk_size, file_size - data_offset)
+                num_frames = data_size // block_align if block_align else 0
+                return {
+                    "format_tag": format_tag,
+                    "num_channels": num_channels,
+                    "sample_rate": sample_rate,
+                    "bits_per_sample": bits_per_sample,
+                    "data_offset": data_offset,
+                    "num_frames": num_frames,
+                    "duration": num_frames / sample_rate if sample_rate else 0.0,
+                }
+            else:
+                audio_file.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+def probe_audio(audio_path):
+    """Returns the audio format and duration, reading only the header whenever the container allows it."""
+    info = probe_wav(audio_path)
+    if info is not None:
+        return info
+
+    if hasattr(torchaudio, "info"):
+        try:
+            metadata = torchaudio.info(audio_path)
+            return {
+                "format_tag": None,
+                "num_channels": metadata.num_channels,
+                "sample_rate": metadata.sample_rate,
+                "bits_per_sample": metadata.bits_per_sample,
+                "data_offset": None,
+                "num_frames": metadata.num_frames,
+                "duration": metadata.num_frames / metadata.sample_rate,
+            }
+        except Exception as e:
+            logging.warning(f"Could not read the header of {audio_path}: {e}. Decoding it to get the duration.")
+
+    # Last resort: decode the whole file
+    audio = AudioSegment.from_file(audio_path)
+    return {
+        "format_tag": None,
+        "num_channels": audio.channels,
+        "sample_rate": audio.frame_rate,
+        "bits_per_sample": audio.sample_width * 8,
+        "data_offset": None,
+        "num_frames": int(audio.frame_count()),
+        "duration": len(audio) / 1000,
+    }
+
+def memmap_wav(audio_path, info):
+    """Memory-maps the samples of an uncompressed WAV file as a (frames, channels) array, or returns None."""
+    dtype = MEMMAP_DTYPES.get((info.get("format_tag"), info.get("bits_per_sample")))
+    if dtype is None or not info["num_frames"]:
+        return None
+    return np.memmap(audio_path, dtype=dtype, mode="r", offset=info["data_offset"],
+                     shape=(info["num_frames"], info["num_channels"]))
+
+def sample_center(dtype):
+    """Value of silence for a sample type: 8-bit PCM is unsigned around 128."""
+    return 128.0 if dtype == np.uint8 else 0.0
+
+def normalize_samples(samples, center, scale):
+    """Converts (frames, channels) samples to float32 (channels, frames) rows, shifted by center and scaled."""
+    channels = np.empty((samples.shape[1], samples.shape[0]), dtype=np.float32)
+    for channel_index in range(samples.shape[1]):
+        channel = channels[channel_index]
+        channel[:] = samples[:, channel_index]
+        if center:
+            channel -= center
+        channel *= scale
+    return channels
+
+def load_normalized_wav(samples):
+    """Converts memory-mapped samples to peak-normalized float32 channels without an intermediate full copy."""
+    center = sample_center(samples.dtype)
+    peak = max(abs(float(samples.max()) - center), abs(float(samples.min()) - center))
+    scale = 1.0 / peak if peak else 1.0
+    return torch.from_numpy(normalize_samples(samples, center, scale))
+
+@lru_cache(maxsize=8)
+def get_resampler(orig_freq, new_freq):
+    """Returns a resampler whose sinc kernel is computed once per pair of rates."""
+    return torchaudio.transforms.Resample(orig_freq, new_freq)
+
+def resample_audio(audio, sample_rate, target_sample_rate=TARGET_SAMPLE_RATE):
+    """Resamples all channels of a (channels, frames) tensor in one call."""
+    if sample_rate == target_sample_rate:
+        return audio
+    with torch.no_grad():
+        return get_resampler(sample_rate, target_sample_rate)(audio)
+
+def load_and_preprocess_audio(audio_path, info=None, target_sample_rate=TARGET_SAMPLE_RATE, buffer_dtype=AUDIO_BUFFER_DTYPE):
+    """
+    Decodes the file once and returns its peak-normalized channels and sample rate.
+
+    The channels are resampled to target_sample_rate here, so the ASR feature extractor never
+    resamples again, and kept as rows of one contiguous buffer_dtype tensor; segments are
+    views into it.
+    """
+    if info is None:
+        info = probe_audio(audio_path)
+
+    samples = memmap_wav(audio_path, info) if info.get("data_offset") is not None else None
+    if samples is not None and info["sample_rate"] != target_sample_rate:
+        # Resampled in the same blocks as a streamed decode, so both give the same samples
+        del samples
+        audio = StreamingAudio(audio_path, info, target_sample_rate, buffer_dtype).decode()
+    else:
+        if samples is not None:
+            audio = load_normalized_wav(samples)
+            sample_rate = info["sample_rate"]
+            del samples
+        else:
+            # Load the audio file
+            audio, sample_rate = torchaudio.load(audio_path)
+
+            # Normalize the audio to the range [-1, 1] in place, without an absolute-value copy
+            audio /= torch.max(audio.max(), -audio.min())
+
+        audio = resample_audio(audio, sample_rate, target_sample_rate)
+        audio = audio.to(getattr(torch, buffer_dtype)).contiguous()
+    sample_rate = target_sample_rate
 
     # Split the audio into two channels
     audio_channel_1 = audio[0]
@@ -26,15 +192,256 @@ def load_and_preprocess_audio(audio_path):
 
     return (audio_channel_1, audio_channel_2), sample_rate
 
+class StreamingAudio:
+    """
+    Peak-normalized, resampled channels of an uncompressed WAV file, decoded from disk on demand.
+
+    The peak is found in a first pass over bounded chunks; afterwards every slice of a channel
+    reads only the frames it needs, plus the resampling filter context around them, so memory
+    stays bounded by the largest slice rather than by the length of the call. Resampling works on
+    fixed blocks of output, normalized and resampled in float32 and cast to buffer_dtype once, and
+    load_and_preprocess_audio decodes WAV files through the same blocks, so slices are identical to
+    the same slices of the buffers it returns.
+    """
+
+    def __init__(self, audio_path, info, target_sample_rate=TARGET_SAMPLE_RATE, buffer_dtype=AUDIO_BUFFER_DTYPE,
+                 chunk_duration=STREAMING_CHUNK_DURATION, block_duration=RESAMPLE_BLOCK_DURATION):
+        self.audio_path = audio_path
+        self.info = info
+        self.dtype = MEMMAP_DTYPES[(info["format_tag"], info["bits_per_sample"])]
+        self.sample_rate = info["sample_rate"]
+        self.target_sample_rate = target_sample_rate
+        self.buffer_dtype = getattr(torch, buffer_dtype)
+        self.center = sample_center(self.dtype)
+
+        self.finite = True
+        maximum, minimum = -math.inf, math.inf
+        chunk_frames = max(1, int(chunk_duration * self.sample_rate))
+        for first_frame in range(0, info["num_frames"], chunk_frames):
+            samples = self.read_frames(first_frame, min(info["num_frames"], first_frame + chunk_frames))
+            if self.dtype.kind == "f" and not np.isfinite(samples).all():
+                self.finite = False
+            maximum = max(maximum, float(samples.max()))
+            minimum = min(minimum, float(samples.min()))
+        peak = max(abs(maximum - self.center), abs(minimum - self.center))
+        self.scale = 1.0 / peak if peak else 1.0
+
+        if self.sample_rate == target_sample_rate:
+            self.resampler = None
+            self.length = info["num_frames"]
+        else:
+            self.resampler = get_resampler(self.sample_rate, target_sample_rate)
+            self.orig_step = self.sample_rate // self.resampler.gcd
+            self.new_step = target_sample_rate // self.resampler.gcd
+            # Input frames of filter context on each side, rounded up to whole filter strides
+            self.context = -(-self.resampler.width // self.orig_step) * self.orig_step
+            self.length = math.ceil(self.new_step * info["num_frames"] / self.orig_step)
+            # Output samples per block, a whole number of filter strides
+            self.block = max(1, int(block_duration * target_sample_rate) // self.new_step) * self.new_step
+
+        self.channels = tuple(StreamingChannel(self, index) for index in range(info["num_channels"]))
+
+    def read_frames(self, first_frame, last_frame):
+        """Reads frames [first_frame, last_frame) of the file as a (frames, channels) array."""
+        num_channels = self.info["num_channels"]
+        samples = np.fromfile(
+            self.audio_path, dtype=self.dtype, count=(last_frame - first_frame) * num_channels,
+            offset=self.info["data_offset"] + first_frame * num_channels * self.dtype.itemsize
+        )
+        return samples.reshape(-1, num_channels)
+
+    def read(self, start, stop, channel_index):
+        """Returns output samples [start, stop) of one channel at the target sample rate."""
+        if stop <= start:
+            return torch.empty(0, dtype=self.buffer_dtype)
+
+        if self.resampler is None:
+            samples = self.read_frames(start, stop)[:, channel_index:channel_index + 1]
+            return torch.from_numpy(normalize_samples(samples, self.center, self.scale)[0]).to(self.buffer_dtype)
+
+        # Whole blocks are resampled even for a short slice: the conv result depends on the length of
+        # its input, so only the same input window gives the same samples as the full buffer
+        first_block, last_block = start // self.block, -(-stop // self.block)
+        channel = slice(channel_index, channel_index + 1)
+        blocks = [self.resample_block(index, channel)[0] for index in range(first_block, last_block)]
+        resampled = blocks[0] if len(blocks) == 1 else torch.cat(blocks)
+        offset = start - first_block * self.block
+        return resampled[offset:offset + stop - start].to(self.buffer_dtype)
+
+    def resample_block(self, block_index, channels=slice(None)):
+        """Returns the float32 output samples of one block as (channels, samples), for the channels selected by a slice."""
+        start = block_index * self.block
+        stop = min(self.length, start + self.block)
+        # The resampler maps every orig_step input frames to new_step output samples; reading from a
+        # stride boundary with enough context on both sides reproduces the full-signal output exactly
+        first_stride, last_stride = start // self.new_step, -(-stop // self.new_step)
+        first_frame = first_stride * self.orig_step - self.context
+        last_frame = min(self.info["num_frames"], last_stride * self.orig_step + self.context)
+        samples = self.read_frames(max(0, first_frame), last_frame)[:, channels]
+        normalized = normalize_samples(samples, self.center, self.scale)
+        if first_frame < 0:
+            # Frames before the start of the file are the zero padding the resampler adds anyway
+            normalized = np.pad(normalized, ((0, 0), (-first_frame, 0)))
+
+        with torch.no_grad():
+            resampled = self.resampler(torch.from_numpy(normalized))
+        offset = self.context // self.orig_step * self.new_step + start - first_stride * self.new_step
+        return resampled[:, offset:offset + stop - start]
+
+    def decode(self):
+        """Decodes every channel into one contiguous buffer_dtype tensor, a block at a time; each block is read once for all channels."""
+        audio = torch.empty((self.info["num_channels"], self.length), dtype=self.buffer_dtype)
+        for start in range(0, self.length, self.block):
+            audio[:, start:start + self.block] = self.resample_block(start // self.block)
+        return audio
+
+
+class StreamingChannel:
+    """One channel of a StreamingAudio; supports len() and contiguous slicing like a channel tensor."""
+
+    def __init__(self, stream, channel_index):
+        self.stream = stream
+        self.channel_index = channel_index
+
+    def __len__(self):
+        return self.stream.length
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("Streaming channels only support contiguous slices")
+        start, stop, _ = key.indices(len(self))
+        return self.stream.read(start, stop, self.channel_index)
+
+    @property
+    def finite(self):
+        return self.stream.finite
+
+def open_streaming_audio(audio_path, info, target_sample_rate=TARGET_SAMPLE_RATE, buffer_dtype=AUDIO_BUFFER_DTYPE):
+    """Returns the streaming channels and sample rate of a call, or None if its format cannot be streamed."""
+    if info.get("data_offset") is None or (info.get("format_tag"), info.get("bits_per_sample")) not in MEMMAP_DTYPES:
+        return None
+    if not info["num_frames"] or info["num_channels"] < 2:
+        return None
+    stream = StreamingAudio(audio_path, info, target_sample_rate, buffer_dtype)
+    return stream.channels[:2], target_sample_rate
+
+def load_call_audio(audio_path, info=None, streaming_min_duration=STREAMING_MIN_DURATION):
+    """
+    Returns the normalized channels and sample rate of a call.
+
+    Calls of at least streaming_min_duration seconds are streamed from disk when their format
+    allows it; shorter calls, and formats that need a full decode, are loaded into memory.
+    """
+    if info is None:
+        info = probe_audio(audio_path)
+    if streaming_min_duration is not None and info["duration"] >= streaming_min_duration:
+        streamed = open_streaming_audio(audio_path, info)
+        if streamed is not None:
+            logging.info(f"Streaming {audio_path} ({info['duration']:.0f}s) from disk in bounded chunks")
+            return streamed
+        logging.warning(f"{audio_path} cannot be streamed; loading all {info['duration']:.0f}s into memory")
+    return load_and_preprocess_audio(audio_path, info)
+
 def extract_segment(audio, start_time, end_time, sample_rate):
     start_sample = int(start_time * sample_rate)
     end_sample = int(end_time * sample_rate)
     return audio[start_sample:end_sample]
 
+def compute_frame_energies(audio, sample_rate, frame_duration=VAD_FRAME_DURATION, frames_per_block=4096):
+    """Computes the energy of consecutive frames of a channel in dBFS, including the trailing partial frame."""
+    frame_size = max(1, int(sample_rate * frame_duration))
+    full_frames = len(audio) // frame_size
+    energies = []
+    # Work in blocks so compact buffers are only widened to float32 a block at a time
+    for first_frame in range(0, full_frames, frames_per_block):
+        last_frame = min(full_frames, first_frame + frames_per_block)
+        frames = audio[first_frame * frame_size:last_frame * frame_size].unfold(0, frame_size, frame_size)
+        energies.append(frames.float().pow(2).mean(dim=1))
+    if len(audio) > full_frames * frame_size:
+        energies.append(audio[full_frames * frame_size:].float().pow(2).mean().reshape(1))
+    if not energies:
+        return np.empty(0, dtype=np.float32)
+    return (10 * torch.log10(torch.cat(energies) + 1e-10)).numpy()
+
+def detect_speech_regions(energies_db, frame_duration, total_duration,
+                          threshold_db=VAD_ENERGY_THRESHOLD_DB, noise_margin_db=VAD_NOISE_MARGIN_DB,
+                          min_speech=VAD_MIN_SPEECH_DURATION, max_segment=VAD_MAX_SEGMENT_DURATION,
+                          merge_gap=VAD_MERGE_GAP, padding=VAD_PADDING, noise_floor_cap_db=VAD_NOISE_FLOOR_CAP_DB):
+    """Turns frame energies into (start, end) speech regions in seconds."""
+    if len(energies_db) == 0:
+        return []
+
+    # Adapt to the line noise of the recording but never go below the absolute threshold. On a
+    # channel that is speech nearly all the time the 10th percentile is speech, not noise, so the
+    # estimate is capped to keep the threshold below the speech it would otherwise hide.
+    noise_floor = min(float(np.percentile(energies_db, 10)), threshold_db + noise_floor_cap_db)
+    threshold = max(threshold_db, noise_floor + noise_margin_db)
+    is_speech = np.concatenate(([False], energies_db > threshold, [False]))
+    edges = np.flatnonzero(np.diff(is_speech.astype(np.int8)))
+    run_starts, run_ends = edges[0::2], edges[1::2]
+
+    # [start, end, seconds of speech before padding] per region
+    regions = []
+    for first_frame, last_frame in zip(run_starts, run_ends):
+        speech = float(last_frame - first_frame) * frame_duration
+        start = max(0.0, float(first_frame) * frame_duration - padding)
+        end = min(total_duration, float(last_frame) * frame_duration + padding)
+        if regions and start - regions[-1][1] <= merge_gap:
+            regions[-1][1] = max(regions[-1][1], end)
+            regions[-1][2] += speech
+        else:
+            regions.append([start, end, speech])
+
+    speech_regions = []
+    for start, end, speech in regions:
+        # Judged on the detected speech, since the padding alone would make every blip long enough
+        if speech < min_speech:
+            continue
+        speech_regions.extend(
+            (round(piece_start, 3), round(piece_end, 3))
+            for piece_start, piece_end in split_long_region(energies_db, frame_duration, start, end, max_segment)
+        )
+    return speech_regions
+
+def split_long_region(energies_db, frame_duration, start, end, max_segment=VAD_MAX_SEGMENT_DURATION):
+    """Splits a region longer than max_segment at its quietest frames so words are not cut mid-way."""
+    pieces = []
+    while end - start > max_segment:
+        # Look for the quietest frame in the second half of the allowed window
+        search_from = int(math.ceil((start + max_segment / 2) / frame_duration))
+        search_to = int((start + max_segment) / frame_duration)
+        if search_to > search_from:
+            cut_frame = search_from + int(np.argmin(energies_db[search_from:search_to]))
+            cut = cut_frame * frame_duration
+        else:
+            cut = start + max_segment
+        pieces.append((start, cut))
+        start = cut
+    pieces.append((start, end))
+    return pieces
+
+def detect_speech_segments(audio, sample_rate, frame_duration=VAD_FRAME_DURATION):
+    """Detects the speech regions of a normalized channel tensor."""
+    energies_db = compute_frame_energies(audio, sample_rate, frame_duration)
+    frame_size = max(1, int(sample_rate * frame_duration))
+    return detect_speech_regions(energies_db, frame_size / sample_rate, len(audio) / sample_rate)
+
+def to_pipeline_input(audio_segment, sample_rate):
+    """Wraps an in-memory segment in the dict input accepted by the transformers ASR pipeline."""
+    if isinstance(audio_segment, torch.Tensor):
+        # A view of the call buffer; only compact (float16) buffers are widened, per segment
+        audio_segment = audio_segment.numpy()
+    # The pipeline pops keys from the dict it receives, so a fresh one is built per call
+    return {"raw": np.ascontiguousarray(audio_segment, dtype=np.float32), "sampling_rate": sample_rate}
+
 def get_audio_duration(file_path):
-    audio = AudioSegment.from_file(file_path)
-    return len(audio) / 1000
+    return probe_audio(file_path)["duration"]
 
 def validate_audio(audio):
-    if not np.isfinite(audio).all():
+    if isinstance(audio, StreamingChannel):
+        # Checked once, by the peak scan
+        finite = audio.finite
+    else:
+        finite = bool(torch.isfinite(audio).all())
+    if not finite:
         raise ValueError("Audio buffer is not finite everywhere")
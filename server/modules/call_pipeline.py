@@ -0,0 +1,137 @@
+# modules/call_pipeline.py
+import time
+import queue
+import logging
+import threading
+from .config import PIPELINE_QUEUE_DEPTH
+from .call_processing import new_call_job, fetch_call, decode_call, infer_call, persist_call, cleanup_call, call_started
+from .persistence import BulkWriter
+from .result_cache import get_result_cache
+
+_STOP = object()
+
+STAGES = ("fetch", "decode", "infer", "persist")
+
+
+class CallPipeline:
+    """
+    Runs calls through fetch -> decode -> infer -> persist stages, one thread per stage.
+
+    Stages are connected by bounded queues, so the next call is downloaded and decoded
+    while the current one is on the model, without reading ahead more than
+    queue_depth calls per stage. Agent upserts and call results are batched by a BulkWriter
+    that is flushed when the pipeline is closed.
+    """
+
+    def __init__(self, asr_pipe, sentiment_pipe, nlp, processed_files, queue_depth=PIPELINE_QUEUE_DEPTH):
+        self.processed_files = processed_files
+        self.queues = {stage: queue.Queue(maxsize=queue_depth) for stage in STAGES}
+        self.timings = {stage: {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0} for stage in STAGES}
+        self.started = 0
+        self._timings_lock = threading.Lock()
+        self.writer = BulkWriter()
+
+        handlers = {
+            "fetch": fetch_call,
+            "decode": lambda job: decode_call(job, self.writer),
+            "infer": lambda job: infer_call(job, asr_pipe, sentiment_pipe, nlp),
+            "persist": self._persist,
+        }
+        self.threads = []
+        for index, stage in enumerate(STAGES):
+            next_stage = STAGES[index + 1] if index + 1 < len(STAGES) else None
+            thread = threading.Thread(
+                target=self._run_stage, args=(stage, handlers[stage], next_stage),
+                name=f"pipeline-{stage}", daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def _persist(self, job):
+        persist_call(job, self.processed_files, self.writer)
+        # Last stage: returning None releases the job
+        return None
+
+    def _run_stage(self, stage, handler, next_stage):
+        input_queue = self.queues[stage]
+        while True:
+            job = input_queue.get()
+            if job is _STOP:
+                if next_stage:
+                    self.queues[next_stage].put(_STOP)
+                return
+
+            start_time = time.perf_counter()
+            result, error = None, None
+            try:
+                result = handler(job)
+            except Exception as e:
+                error = e
+                logging.error(f"An error occurred in the {stage} stage for file {job['filename']}: {e}")
+            self._record_timing(stage, time.perf_counter() - start_time)
+
+            if result is None:
+                # Skipped, failed or finished: nothing is passed on, so settle the claim and release the local copy here
+                cleanup_call(job, error, self.processed_files)
+                if call_started(job):
+                    with self._timings_lock:
+                        self.started += 1
+            elif next_stage:
+                self.queues[next_stage].put(result)
+
+    def _record_timing(self, stage, seconds):
+        with self._timings_lock:
+            timing = self.timings[stage]
+            timing["count"] += 1
+            timing["total_seconds"] += seconds
+            timing["max_seconds"] = max(timing["max_seconds"], seconds)
+
+    def submit(self, file_info, project_name, force_process=False):
+        """Queues a call; blocks while the fetch stage already has queue_depth calls waiting."""
+        self.queues["fetch"].put(new_call_job(file_info, project_name, force_process))
+
+    def close(self):
+        """Waits for every submitted call to finish, stops the stage threads and writes the pending results."""
+        self.queues["fetch"].put(_STOP)
+        for thread in self.threads:
+            thread.join()
+        self.writer.close()
+        self.log_stats()
+
+    def stats(self):
+        """Returns the current queue depths and the per-stage timings."""
+        with self._timings_lock:
+            timings = {stage: dict(timing) for stage, timing in self.timings.items()}
+        for timing in timings.values():
+            timing["average_seconds"] = timing["total_seconds"] / timing["count"] if timing["count"] else 0.0
+        return {
+            "queue_depths": {stage: self.queues[stage].qsize() for stage in STAGES},
+            "timings": timings,
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        for stage in STAGES:
+            timing = stats["timings"][stage]
+            logging.info(
+                f"Pipeline stage {stage}: {timing['count']} calls, average {timing['average_seconds']:.2f}s, "
+                f"max {timing['max_seconds']:.2f}s, queued {stats['queue_depths'][stage]}"
+            )
+        cache = get_result_cache()
+        if cache is not None:
+            cache.log_stats()
+
+
+def process_calls(calls, asr_pipe, sentiment_pipe, nlp, processed_files):
+    """
+    Processes (file_info, project_name, force_process) calls through the staged pipeline.
+
+    Returns how many of them were started, i.e. not skipped or failed before their document was registered.
+    """
+    pipeline = CallPipeline(asr_pipe, sentiment_pipe, nlp, processed_files)
+    try:
+        for file_info, project_name, force_process in calls:
+            pipeline.submit(file_info, project_name, force_process)
+    finally:
+        pipeline.close()
+    return pipeline.started
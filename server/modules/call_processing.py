@@ -1,29 +1,28 @@
 import os
+import math
 import time
 import re
 import logging
 import tempfile
-from datetime import datetime
-from scipy.io import wavfile
-from modules.audio_processing import extract_segment, load_and_preprocess_audio, get_audio_duration, validate_audio
-from modules.models import configure_asr_pipeline, configure_sentiment_pipeline
-from modules.utils import get_device
+from modules.audio_processing import extract_segment, load_call_audio, probe_audio, validate_audio, to_pipeline_input, detect_speech_segments
 from modules.impact import calculate_impact
 from modules.satisfaction import predict_satisfaction_score
 from modules.rating_projection import project_customer_rating
-from modules.evaluation import evaluate_agent_performance
-from modules.firebase_storage import download_file_from_firebase, upload_file_to_firebase
+from modules.evaluation import collect_agent_text, score_agent_text
+from modules.conversation_metrics import SPEAKERS, compute_conversation_metrics
+from modules.vocabulary import get_project_vocabulary
+from modules.firebase_storage import blob_path, download_blob, download_file_from_firebase, upload_file_to_firebase
 from modules.call_info import extract_call_info
 from modules.database import get_collection, insert_agent_info
-from modules.text_processing import extract_and_combine_words, lemmatize_text, extract_key_phrases, extract_entities
-from bson import ObjectId
-from modules.config import AI_MODEL, SENTIMENT_MODEL, TRACK_PROCESSED_FILES, GREETINGS_WORDS, COMPANIES_NAMES, DYNAMIC_FLAGS
-from modules.gemini_ai import generate_call_summary
-from concurrent.futures import ThreadPoolExecutor
+from modules.persistence import register_call, results_update
+from modules.job_queue import WORKER_ID, fail_call, get_lease_keeper
+from modules.result_cache import get_result_cache, result_key
+from modules.upload_manifest import upload_local_file
+from modules.summarization import get_summarization_service
+from modules.text_processing import extract_key_phrases_batch, extract_call_key_phrases, analyze_texts, classify_sentiments
+from modules.config import ASR_BATCH_SIZE, SEGMENTATION_MODE, SEGMENT_LENGTH, KEY_PHRASE_MODE, TRACK_PROCESSED_FILES, UPLOAD_MANIFEST_ENABLED
 from typing import Optional
-
-if AI_MODEL == "Gemini":
-    from modules.gemini_ai import generate_call_summary
+from pymongo import UpdateOne
 
 COMMON_ERRORS = [
     "Să vă mulțumim pentru vizionare!", "Nu uitați să vă abonați la canal!", "La revedere!", "Ai revedere!", "Nu uitați să dați like, să lăsați un comentariu și să distribuiți acest material video pe alte rețele sociale", "MULȚUMIT PENTRU VIZIONARE!", "Nu uitați să dați like, să lăsați un comentariu și să distribuiți acest material video pe alte rețele sociale", "Să vă mulțumim pentru vizionare!", "Să vă mulțumim pentru vizionare.", "Până la următoarea mea rețetă!"
@@ -46,121 +45,147 @@ def is_valid_transcription(transcription, previous_transcription=None):
         return False
     return True
 
-def process_segments(asr_pipe, sentiment_pipe, nlp, audio, sample_rate, segment_length=5.0):
+def process_segments(asr_pipe, sentiment_pipe, nlp, audio, sample_rate, vocabulary=None, segment_length=SEGMENT_LENGTH, batch_size=ASR_BATCH_SIZE):
     """Processes audio segments with ASR and sentiment pipelines."""
-    segments = []
-    sentiment_scores, speaker_durations, crosstalk_duration, dead_air_duration, previous_turn_end, agent_all_text = initialize_metrics()
+    segments, call_key_phrases = transcribe_and_analyze(asr_pipe, sentiment_pipe, nlp, audio, sample_rate, segment_length, batch_size)
+    return summarize_segments(segments, call_key_phrases, vocabulary)
+
+def transcribe_and_analyze(asr_pipe, sentiment_pipe, nlp, audio, sample_rate, segment_length=SEGMENT_LENGTH, batch_size=ASR_BATCH_SIZE):
+    """Transcribes the windows of a call and analyzes the text; returns the segments in window order and the call key phrases."""
     previous_transcription = None
 
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        future_segments = []
-        future_segments.extend([
-            executor.submit(process_single_segment, audio[0], start_time, end_time, sample_rate,
-                            "SPEAKER_00", asr_pipe, nlp, sentiment_pipe, previous_transcription)
-            for start_time, end_time in detect_segments(audio[0], sample_rate, segment_length)
-        ])
-        future_segments.extend([
-            executor.submit(process_single_segment, audio[1], start_time, end_time, sample_rate,
-                            "SPEAKER_01", asr_pipe, nlp, sentiment_pipe, previous_transcription)
-            for start_time, end_time in detect_segments(audio[1], sample_rate, segment_length)
-        ])
-
-        for future in future_segments:
-            segment = future.result()
-            if segment:
-                segments.append(segment)
-                if segment["type_speaker"] == "agent":
-                    agent_all_text += segment["transcription"] + " "
-                sentiment_scores.append(segment["sentiment_score"])
-                speaker_durations[segment["speaker"]] += segment["time_range"]["end"] - segment["time_range"]["start"]
-                update_dead_air_duration(segment["time_range"]["start"], previous_turn_end, segment["speaker"], dead_air_duration)
-                update_crosstalk_duration(segment["time_range"]["start"], segment["time_range"]["end"], previous_turn_end, segment["speaker"], crosstalk_duration)
-                previous_turn_end[segment["speaker"]] = segment["time_range"]["end"]
-                previous_transcription = segment["transcription"]
-
-    segments.sort(key=lambda x: x["time_range"]["start"])
-
-    return finalize_segment_processing(sentiment_scores, speaker_durations, dead_air_duration, crosstalk_duration, agent_all_text, segments)
-
-def detect_segments(audio, sample_rate, segment_length=5.0):
-    """Detects segments of the given length in the audio."""
+    windows = collect_windows(audio, sample_rate, segment_length)
+    results = transcribe_windows(asr_pipe, audio, sample_rate, windows, batch_size)
+
+    transcribed = []
+    for (speaker, channel_index, start_time, end_time), result in zip(windows, results):
+        transcription = extract_transcription(result, previous_transcription)
+        if transcription:
+            transcribed.append((speaker, start_time, end_time, transcription))
+            previous_transcription = transcription
+
+    return analyze_segments(transcribed, nlp, sentiment_pipe)
+
+def summarize_segments(segments, call_key_phrases=None, vocabulary=None):
+    """Computes the metrics and score of analyzed segments."""
+    sentiment_scores = [segment["sentiment_score"] for segment in segments]
+    agent_all_text = collect_agent_text(segments)
+    metrics = compute_conversation_metrics(segments)
+
+    ordered_segments = sorted(segments, key=lambda x: x["time_range"]["start"])
+
+    segments_info = finalize_segment_processing(sentiment_scores, metrics, agent_all_text, ordered_segments, vocabulary)
+    if call_key_phrases is not None:
+        segments_info["key_phrases"] = call_key_phrases
+    return segments_info
+
+def collect_windows(audio, sample_rate, segment_length=SEGMENT_LENGTH, mode=SEGMENTATION_MODE):
+    """Collects the (speaker, channel index, start, end) windows of both channels."""
+    windows = []
+    for channel_index, speaker in enumerate(SPEAKERS):
+        if mode == "vad":
+            channel_segments = detect_speech_segments(audio[channel_index], sample_rate)
+        else:
+            channel_segments = detect_segments(audio[channel_index], sample_rate, segment_length)
+        logging.info(f"{speaker}: {len(channel_segments)} segments to transcribe")
+        windows.extend((speaker, channel_index, start_time, end_time) for start_time, end_time in channel_segments)
+    return windows
+
+def transcribe_windows(asr_pipe, audio, sample_rate, windows, batch_size=ASR_BATCH_SIZE):
+    """Runs the ASR pipeline over the windows in batches, returning one result per window in the same order."""
+    results = []
+    for batch_start in range(0, len(windows), batch_size):
+        batch = windows[batch_start:batch_start + batch_size]
+        inputs = [
+            to_pipeline_input(extract_segment(audio[channel_index], start_time, end_time, sample_rate), sample_rate)
+            for _, channel_index, start_time, end_time in batch
+        ]
+        try:
+            results.extend(asr_pipe(inputs, batch_size=len(inputs)))
+        except Exception as e:
+            logging.error(f"Error transcribing batch of {len(batch)} segments starting at window {batch_start}: {e}")
+            results.extend(transcribe_batch_items(asr_pipe, audio, sample_rate, batch))
+    return results
+
+def transcribe_batch_items(asr_pipe, audio, sample_rate, batch):
+    """Falls back to one pipeline call per window so a single bad clip does not drop the whole batch."""
+    results = []
+    for speaker, channel_index, start_time, end_time in batch:
+        try:
+            audio_segment = extract_segment(audio[channel_index], start_time, end_time, sample_rate)
+            results.append(asr_pipe(to_pipeline_input(audio_segment, sample_rate)))
+        except Exception as e:
+            logging.error(f"Error transcribing segment {start_time}-{end_time} for speaker {speaker}: {e}")
+            results.append(None)
+    return results
+
+def detect_segments(audio, sample_rate, segment_length=SEGMENT_LENGTH):
+    """Detects segments of the given length in the audio, keeping the trailing remainder."""
     total_duration = len(audio) / sample_rate
-    segments = [(i * segment_length, min((i + 1) * segment_length, total_duration)) for i in range(int(total_duration / segment_length))]
+    segment_count = math.ceil(total_duration / segment_length)
+    segments = [(i * segment_length, min((i + 1) * segment_length, total_duration)) for i in range(segment_count)]
     return segments
 
-def initialize_metrics():
-    """Initializes metrics for processing."""
-    sentiment_scores = []
-    speaker_durations = {"SPEAKER_00": 0, "SPEAKER_01": 0}
-    crosstalk_duration = 0
-    dead_air_duration = {"SPEAKER_00": 0, "SPEAKER_01": 0}
-    previous_turn_end = {"SPEAKER_00": 0, "SPEAKER_01": 0}
-    agent_all_text = ""
-    return sentiment_scores, speaker_durations, crosstalk_duration, dead_air_duration, previous_turn_end, agent_all_text
-
-def update_dead_air_duration(start_time, previous_turn_end, speaker, dead_air_duration):
-    """Updates the dead air duration metric."""
-    if start_time > previous_turn_end[speaker]:
-        dead_air_duration[speaker] += start_time - previous_turn_end[speaker]
-
-def update_crosstalk_duration(start_time, end_time, previous_turn_end, speaker, crosstalk_duration):
-    """Updates the crosstalk duration metric."""
-    for other_speaker, end in previous_turn_end.items():
-        if other_speaker != speaker and start_time < end:
-            overlap = min(end_time, end) - start_time
-            if overlap > 0:
-                crosstalk_duration += overlap
-
-def process_single_segment(audio, start_time, end_time, sample_rate, speaker, asr_pipe, nlp, sentiment_pipe, previous_transcription=None, min_confidence=0.5):
-    """Processes a single audio segment."""
-    try:
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_segment_file:
-            audio_segment = extract_segment(audio, start_time, end_time, sample_rate)
-            wavfile.write(temp_segment_file.name, sample_rate, audio_segment.numpy())
-            temp_segment_file.close()
-
-            result = asr_pipe(temp_segment_file.name)
-            transcription = result['text'] if result and isinstance(result, dict) and 'text' in result else "[Transcription error]"
-            confidence = result.get('confidence', 1.0)
-
-            if confidence < min_confidence or not is_valid_transcription(transcription, previous_transcription):
-                logging.warning(f"Low confidence or invalid transcription: {transcription}")
-                return None
-
-            lemmatized_text = lemmatize_text(nlp, transcription)
-            key_phrases = extract_key_phrases(lemmatized_text)
-            sentiment = sentiment_pipe(lemmatized_text)[0]
-            entities = extract_entities(nlp, lemmatized_text)
-
-            sentiment_score = int(sentiment['label'][0])
-            type_speaker = "agent" if speaker == "SPEAKER_00" else "client"
-
-            logging.info(f"Speaker: {speaker}")
-            logging.info(f"Time: {start_time:.1f}s to {end_time:.1f}s")
-            logging.info(f"Transcription: {transcription}")
-            logging.info(f"Sentiment: {sentiment['label']}")
-
-            return {
-                "speaker": speaker,
-                "time_range": {
-                    "start": start_time,
-                    "end": end_time
-                },
-                "transcription": transcription,
-                "sentiment": sentiment['label'],
-                "key_phrases": key_phrases,
-                "entities": entities,
-                "sentiment_score": sentiment_score,
-                "type_speaker": type_speaker
-            }
-    except Exception as e:
-        logging.error(f"Error processing segment {start_time}-{end_time} for speaker {speaker}: {e}")
-    finally:
-        if os.path.exists(temp_segment_file.name):
-            os.remove(temp_segment_file.name)
-    return None
+def extract_transcription(result, previous_transcription=None, min_confidence=0.5):
+    """Returns the transcription of an ASR result, or None if it should be discarded."""
+    transcription = result['text'] if result and isinstance(result, dict) and 'text' in result else "[Transcription error]"
+    confidence = result.get('confidence', 1.0) if isinstance(result, dict) else 0.0
+
+    if confidence < min_confidence or not is_valid_transcription(transcription, previous_transcription):
+        logging.warning(f"Low confidence or invalid transcription: {transcription}")
+        return None
+    return transcription
+
+def analyze_segments(transcribed, nlp, sentiment_pipe, key_phrase_mode=KEY_PHRASE_MODE):
+    """Runs the text analysis of all valid transcriptions of a call in batches.
+
+    Returns the segments and, in "call" key phrase mode, the key phrases of the whole call.
+    """
+    texts = [transcription for _, _, _, transcription in transcribed]
+    analyses = analyze_texts(nlp, texts)
+    lemmatized_texts = [lemmatized_text for lemmatized_text, _ in analyses]
+    sentiments = classify_sentiments(sentiment_pipe, lemmatized_texts)
+
+    if key_phrase_mode == "call":
+        call_key_phrases = extract_call_key_phrases(lemmatized_texts) if lemmatized_texts else []
+        segment_key_phrases = [[] for _ in lemmatized_texts]
+    else:
+        call_key_phrases = None
+        segment_key_phrases = extract_key_phrases_batch(lemmatized_texts)
 
-def finalize_segment_processing(sentiment_scores, speaker_durations, dead_air_duration, crosstalk_duration, agent_all_text, segments):
+    segments = []
+    for (speaker, start_time, end_time, transcription), (_, entities), sentiment, key_phrases in zip(transcribed, analyses, sentiments, segment_key_phrases):
+        try:
+            segments.append(build_segment(speaker, start_time, end_time, transcription, key_phrases, entities, sentiment))
+        except Exception as e:
+            logging.error(f"Error processing segment {start_time}-{end_time} for speaker {speaker}: {e}")
+    return segments, call_key_phrases
+
+def build_segment(speaker, start_time, end_time, transcription, key_phrases, entities, sentiment):
+    """Builds the stored representation of a single audio segment."""
+    sentiment_score = int(sentiment['label'][0])
+    type_speaker = "agent" if speaker == "SPEAKER_00" else "client"
+
+    logging.info(f"Speaker: {speaker}")
+    logging.info(f"Time: {start_time:.1f}s to {end_time:.1f}s")
+    logging.info(f"Transcription: {transcription}")
+    logging.info(f"Sentiment: {sentiment['label']}")
+
+    return {
+        "speaker": speaker,
+        "time_range": {
+            "start": start_time,
+            "end": end_time
+        },
+        "transcription": transcription,
+        "sentiment": sentiment['label'],
+        "key_phrases": key_phrases,
+        "entities": entities,
+        "sentiment_score": sentiment_score,
+        "type_speaker": type_speaker
+    }
+
+def finalize_segment_processing(sentiment_scores, metrics, agent_all_text, segments, vocabulary=None):
     """Finalizes the processing of segments and computes various metrics."""
     average_sentiment, impact_result, satisfaction_score, projected_rating = None, None, None, None
 
@@ -180,108 +205,269 @@ def finalize_segment_processing(sentiment_scores, speaker_durations, dead_air_du
         projected_rating = project_customer_rating(average_sentiment, end_sentiment, satisfaction_score)
         logging.info(f"Projected Customer Rating: {projected_rating}")
 
-    for speaker, duration in speaker_durations.items():
+    for speaker, duration in metrics["total_talk_duration"].items():
         logging.info(f"{speaker} Total Talk Duration: {duration:.2f} seconds")
 
-    logging.info(f"Total Crosstalk Duration: {crosstalk_duration:.2f} seconds")
-    for speaker, duration in dead_air_duration.items():
+    logging.info(f"Total Crosstalk Duration: {metrics['crosstalk_duration']:.2f} seconds")
+    for speaker, duration in metrics["total_dead_air_duration"].items():
         logging.info(f"{speaker} Total Dead Air Duration: {duration:.2f} seconds")
+    for speaker, turns in metrics["turn_count"].items():
+        logging.info(f"{speaker} Turns: {turns}")
 
     logging.info(f"Agent's Complete Text: {agent_all_text}")
 
-    score = evaluate_agent_performance(agent_all_text)
-    call_summary = generate_call_summary(agent_all_text)
+    score, flag_deductions = score_agent_text(agent_all_text, vocabulary)
 
     return {
         "average_sentiment": average_sentiment,
-        "total_talk_duration": speaker_durations,
-        "total_dead_air_duration": dead_air_duration,
-        "crosstalk_duration": crosstalk_duration,
+        "total_talk_duration": metrics["total_talk_duration"],
+        "total_dead_air_duration": metrics["total_dead_air_duration"],
+        "crosstalk_duration": metrics["crosstalk_duration"],
+        "turn_count": metrics["turn_count"],
         "score": score,
+        "flag_deductions": flag_deductions,
         "impact_result": impact_result,
         "satisfaction_score": satisfaction_score,
         "projected_rating": projected_rating,
         "segments": segments,
-        "call_summary": call_summary,
     }
 
 def process_single_file(file_info: dict, project_name: str, asr_pipe, sentiment_pipe, nlp, processed_files: set, force_process: bool):
-    """Processes a single audio file."""
-    collection = get_collection("optima_solutions_services", "calls")
-
-    filename = file_info['filename']
-    original_file_path = file_info['file_path']
-
-
-    local_file_path: Optional[str] = None
-
+    """Processes a single audio file by running the pipeline stages one after another; returns its job."""
+    job = new_call_job(file_info, project_name, force_process)
+    error = None
     try:
-        # Download the file if it's a remote URL
-        if original_file_path.startswith(("http://", "https://")):
-            local_file_path = download_remote_file(original_file_path, filename, project_name)
-            if local_file_path is None:
-                logging.error(f"Failed to download file {filename} from Firebase. Skipping processing.")
-                return
-            firebase_url = original_file_path
-        else:
-            local_file_path = original_file_path
-            firebase_url = upload_file_to_firebase(local_file_path, filename, project_name, folder="calls")
+        for stage in (fetch_call, decode_call):
+            if stage(job) is None:
+                return job
+        infer_call(job, asr_pipe, sentiment_pipe, nlp)
+        persist_call(job, processed_files)
+    except Exception as e:
+        error = e
+        logging.error(f"An error occurred while processing file {file_info['filename']}: {e}")
+    finally:
+        cleanup_call(job, error, processed_files)
+    return job
 
-        # Get audio duration
-        audio_duration = get_audio_duration(local_file_path)
-        logging.info(f"Audio Duration: {audio_duration} seconds")
+def new_call_job(file_info: dict, project_name: str, force_process: bool) -> dict:
+    """Creates the state that is handed from one processing stage to the next."""
+    return {
+        "filename": file_info['filename'],
+        "original_file_path": file_info['file_path'],
+        "project_name": project_name,
+        "force_process": force_process,
+        "blob_name": file_info.get("blob_name"),
+        "local_file_path": None,
+        "claim": file_info.get("claim"),
+    }
 
-        # Skip processing if audio duration is less than 5 seconds
-        if audio_duration < 5:
-            logging.info(f"Skipping file {filename} as its duration is less than 5 seconds.")
-            return
+def fetch_call(job: dict) -> Optional[dict]:
+    """Stage 1: downloads a remote call, or uploads a local one, so a local copy and a Firebase URL exist."""
+    filename, project_name = job["filename"], job["project_name"]
+    original_file_path = job["original_file_path"]
+
+    # Download the file if it is already in the bucket: a call processed before records its object,
+    # calls uploaded from the dashboard only have their download URL
+    if job["blob_name"] or original_file_path.startswith(("http://", "https://")):
+        job["local_file_path"] = download_remote_file(filename, project_name, job["blob_name"])
+        if job["local_file_path"] is None:
+            logging.error(f"Failed to download file {filename} from Firebase. Skipping processing.")
+            job["error"] = "Download from Firebase failed"
+            return None
+        job["downloaded"] = True
+        job["blob_name"] = job["blob_name"] or blob_path(project_name, filename, folder="calls")
+        job["firebase_url"] = original_file_path
+    else:
+        job["local_file_path"] = original_file_path
+        if UPLOAD_MANIFEST_ENABLED:
+            # Files uploaded before, or with the same content as an uploaded file, are not sent again;
+            # a duplicate is stored as the object of the first file, so that is what a reprocess downloads
+            job["firebase_url"], job["audio_digest"], job["blob_name"] = upload_local_file(
+                original_file_path, filename, project_name, folder="calls"
+            )
+        else:
+            job["firebase_url"] = upload_file_to_firebase(original_file_path, filename, project_name, folder="calls")
+            job["blob_name"] = blob_path(project_name, filename, folder="calls") if job["firebase_url"] else None
+    return job
+
+def decode_call(job: dict, writer=None) -> Optional[dict]:
+    """Stage 2: checks the duration, registers the call in MongoDB and decodes the audio."""
+    filename, project_name = job["filename"], job["project_name"]
+
+    # Get audio duration from the file header, without decoding the samples
+    audio_info = probe_audio(job["local_file_path"])
+    audio_duration = audio_info["duration"]
+    logging.info(f"Audio Duration: {audio_duration} seconds")
+
+    # Skip processing if audio duration is less than 5 seconds
+    if audio_duration < 5:
+        logging.info(f"Skipping file {filename} as its duration is less than 5 seconds.")
+        job["outcome"] = "skipped"
+        job["error"] = "Audio shorter than 5 seconds"
+        return None
 
-        start_time = time.time()
-        logging.info(f"Processing file: {filename}")
+    job["start_time"] = time.time()
+    job["audio_duration"] = audio_duration
+    logging.info(f"Processing file: {filename}")
 
-        agent_info, day, phone_number, final_status = extract_call_info(filename)
+    agent_info, day, phone_number, final_status = extract_call_info(filename)
 
-        # Insert agent info into the database
+    # Insert agent info into the database; batched with other agents when a writer is given
+    if writer is not None:
+        writer.add_agent(agent_info, project_name)
+    else:
         insert_agent_info(agent_info, project_name)
-        log_call_info(agent_info, project_name, day, phone_number, final_status)
-
-        # Check if the document already exists
-        existing_document = collection.find_one({"filename": filename, "agent_info.project": project_name})
-
-        if existing_document:
-            document_id = existing_document["_id"]
-            # Update existing document
-            update_existing_document(collection, document_id, firebase_url, final_status, day, audio_duration, agent_info, project_name, phone_number)
-        else:
-            # Insert new document
-            document_id = insert_new_document(collection, filename, firebase_url, final_status, day, audio_duration, agent_info, project_name, phone_number)
+    log_call_info(agent_info, project_name, day, phone_number, final_status)
+
+    # Create or refresh the call document and lease it; its _id is needed for the results, so this write is not deferred
+    claim = job.get("claim")
+    registered = register_call(
+        filename, job["firebase_url"], final_status, day, audio_duration, agent_info, project_name, phone_number,
+        worker_id=claim["worker_id"] if claim else WORKER_ID, count_attempt=claim is None, blob_name=job["blob_name"]
+    )
+    if registered is None:
+        logging.info(f"Skipping file {filename} as another worker is processing it.")
+        return None
+    if claim is None:
+        job["claim"] = registered
+    job["document_id"] = registered["document_id"]
 
-        audio, sample_rate = load_and_preprocess_audio(local_file_path)
+    # A call whose audio was already analyzed with the same models skips decoding and inference
+    if lookup_cached_result(job):
+        return job
 
-        try:
-            validate_audio(audio[0])
-            validate_audio(audio[1])
-        except ValueError as e:
-            logging.error(f"Validation error: {e}. Continuing with processing.")
+    # The only decode of the file; the samples are handed to the later stages. Very long calls are
+    # streamed from disk instead, so the local file must stay in place until inference is done.
+    audio, sample_rate = load_call_audio(job["local_file_path"], audio_info)
 
-        segments_info = process_segments(asr_pipe, sentiment_pipe, nlp, audio, sample_rate)
-        update_document_with_results(collection, document_id, segments_info, audio_duration, start_time, processed_files, filename, force_process)
+    try:
+        validate_audio(audio[0])
+        validate_audio(audio[1])
+    except ValueError as e:
+        logging.error(f"Validation error: {e}. Continuing with processing.")
+
+    job["audio"], job["sample_rate"] = audio, sample_rate
+    return job
+
+def lookup_cached_result(job: dict) -> bool:
+    """Attaches the cached results of the call's audio to the job; returns whether there were any."""
+    cache = get_result_cache()
+    if cache is None:
+        return False
+    try:
+        job["result_key"] = result_key(job["local_file_path"], job.get("audio_digest"))
+    except OSError as e:
+        logging.error(f"Could not hash {job['local_file_path']} for the result cache: {e}")
+        return False
+    cached = cache.get(job["result_key"])
+    if cached is None:
+        return False
+    logging.info(f"Reusing the cached transcription of {job['filename']}; only the evaluation is recomputed.")
+    job["cached_result"] = cached
+    return True
 
+def infer_call(job: dict, asr_pipe, sentiment_pipe, nlp) -> dict:
+    """Stage 3: runs the models over the decoded audio, or evaluates the cached results of the same audio."""
+    vocabulary = get_project_vocabulary(job["project_name"])
+    cached = job.pop("cached_result", None)
+    if cached is not None:
+        job["segments_info"] = summarize_segments(cached["segments"], cached["key_phrases"], vocabulary)
+    else:
+        segments, call_key_phrases = transcribe_and_analyze(asr_pipe, sentiment_pipe, nlp, job.pop("audio"), job["sample_rate"])
+        job["segments_info"] = summarize_segments(segments, call_key_phrases, vocabulary)
+        store_cached_result(job, segments, call_key_phrases)
+
+    # The summary and analyses are written to the call document when the model answers; the next call does not wait.
+    # A transcript that was analyzed before is answered from the summary cache.
+    agent_texts = [segment["transcription"] for segment in job["segments_info"]["segments"] if segment["type_speaker"] == "agent"]
+    get_summarization_service().submit(job["document_id"], agent_texts, vocabulary.words_to_remove)
+    return job
+
+def store_cached_result(job: dict, segments, call_key_phrases):
+    """Caches the transcription and NLP output of a call."""
+    cache = get_result_cache()
+    if cache is None or "result_key" not in job:
+        return
+    try:
+        cache.put(job["result_key"], {"segments": segments, "key_phrases": call_key_phrases})
     except Exception as e:
-        logging.error(f"An error occurred while processing file {filename}: {e}")
-    finally:
-        # Clean up the temporary file if it was downloaded
-        if original_file_path.startswith(("http://", "https://")) and local_file_path:
-            if os.path.exists(local_file_path):
-                try:
-                    os.remove(local_file_path)
-                except Exception as e:
-                    logging.error(f"Error removing temporary file {local_file_path}: {e}")
-
-def download_remote_file(file_path, filename, project_name):
-    """Downloads a remote file."""
+        logging.error(f"Could not cache the results of {job['filename']}: {e}")
+
+def persist_call(job: dict, processed_files: set, writer=None) -> dict:
+    """Stage 4: writes the results to MongoDB, or queues them on the writer."""
+    update = results_update(job["segments_info"], job["audio_duration"], job["start_time"])
+    filename, force_process = job["filename"], job["force_process"]
+
+    def mark_processed():
+        if TRACK_PROCESSED_FILES or force_process:
+            processed_files.add((job["project_name"], filename))
+
+    # Only written while this worker still holds the lease; a worker that took the call over owns its results
+    call_filter = {"_id": job["document_id"], "worker_id": job["claim"]["worker_id"]}
+    if writer is not None:
+        writer.add("calls", UpdateOne(call_filter, update), on_written=mark_processed)
+    else:
+        collection = get_collection("optima_solutions_services", "calls")
+        result = collection.update_one(call_filter, update)
+        if not result.matched_count:
+            logging.warning(f"Results of {filename} not stored: call {job['document_id']} is leased by another worker.")
+        mark_processed()
+    job["outcome"] = "processed"
+    return job
+
+def cleanup_call(job: Optional[dict], error=None, processed_files=None) -> None:
+    """Settles the claim on a call and removes the temporary copy of a downloaded call."""
+    if not job:
+        return
+    settle_claim(job, error)
+    if processed_files is not None:
+        record_settled_call(job, processed_files)
+    if not job.get("downloaded"):
+        return
+    local_file_path = job["local_file_path"]
+    if local_file_path and os.path.exists(local_file_path):
+        try:
+            os.remove(local_file_path)
+        except Exception as e:
+            logging.error(f"Error removing temporary file {local_file_path}: {e}")
+
+def settle_claim(job: dict, error=None) -> None:
+    """Stops renewing the lease on a call and, unless it was processed, hands it back to the queue."""
+    claim = job.get("claim")
+    if not claim:
+        return
+    outcome = job.get("outcome")
+    if outcome == "processed":
+        # The results update already removed the lease
+        get_lease_keeper().release(claim)
+    elif outcome == "skipped":
+        fail_call(claim, job.get("error"), retry=False)
+    else:
+        fail_call(claim, error or job.get("error") or "Processing did not finish")
+
+def call_started(job: dict) -> bool:
+    """Whether the call got as far as its document in MongoDB, rather than being skipped or failing before that."""
+    return "document_id" in job
+
+def record_settled_call(job: dict, processed_files: set) -> None:
+    """
+    Records a call that needs no further pass over its file: one too short to process, or one that failed
+    after registration, whose retries are now up to the to_process queue. Processed calls are recorded
+    by persist_call once their results are written.
+    """
+    if not (TRACK_PROCESSED_FILES or job["force_process"]):
+        return
+    outcome = job.get("outcome")
+    if outcome == "skipped" or (outcome != "processed" and call_started(job)):
+        processed_files.add((job["project_name"], job["filename"]))
+
+def download_remote_file(filename, project_name, blob_name=None):
+    """Downloads a call from its object in the bucket, or from the project folder when the object is not known."""
     local_file_path = os.path.join(tempfile.gettempdir(), filename)
-    result = download_file_from_firebase(project_name, filename, local_file_path, folder="calls")
+    if blob_name:
+        result = download_blob(blob_name, local_file_path)
+    else:
+        result = download_file_from_firebase(project_name, filename, local_file_path, folder="calls")
     if result is None:
         logging.error(f"Failed to download file {filename} for project {project_name}")
         return None
@@ -294,78 +480,3 @@ def log_call_info(agent_info, project_name, day, phone_number, final_status):
     logging.info(f"Day: {day}")
     logging.info(f"Phone Number: {phone_number}")
     logging.info(f"Final Status: {final_status}")
-
-def update_existing_document(collection, document_id: ObjectId, firebase_url: Optional[str], final_status: Optional[str], day: Optional[str], audio_duration: float, agent_info: dict, project_name: str, phone_number: Optional[str]):
-    """Updates an existing document in the MongoDB collection."""
-    update_info = {
-        "day_processed": datetime.now().strftime("%Y-%m-%d"),
-        "status": "processing",
-        "file_info": {
-            "duration": audio_duration,
-            "final_status": final_status if final_status else "",
-            "day": day if day else "",
-            "file_path": firebase_url if firebase_url else ""
-        },
-        "phone_number": phone_number if phone_number else "",
-        "agent_info": {
-            "username": agent_info['username'],
-            "first_name": agent_info['first_name'],
-            "last_name": agent_info['last_name'],
-            "project": project_name
-        }
-    }
-    collection.update_one({"_id": document_id}, {"$set": update_info})
-
-def insert_new_document(collection, filename: str, firebase_url: Optional[str], final_status: Optional[str], day: Optional[str], audio_duration: float, agent_info: dict, project_name: str, phone_number: Optional[str]) -> ObjectId:
-    """Inserts a new document into the MongoDB collection."""
-    new_document = {
-        "filename": filename,
-        "day_processed": datetime.now().strftime("%Y-%m-%d"),
-        "status": "processing",
-        "file_info": {
-            "extension": os.path.splitext(filename)[1][1:],
-            "duration": audio_duration,
-            "final_status": final_status if final_status else "",
-            "day": day if day else "",
-            "file_path": firebase_url if firebase_url else ""
-        },
-        "phone_number": phone_number if phone_number else "",
-        "agent_info": {
-            "username": agent_info['username'],
-            "first_name": agent_info['first_name'],
-            "last_name": agent_info['last_name'],
-            "project": project_name
-        }
-    }
-    return collection.insert_one(new_document).inserted_id
-
-def update_document_with_results(collection, document_id, segments_info, audio_duration, start_time, processed_files, filename, force_process):
-    """Updates the MongoDB document with the results of processing."""
-    processing_time = time.time() - start_time
-    updated_info = {
-        "file_info.duration": audio_duration,
-        "status": "processed",
-        "day_processed": datetime.now().strftime("%Y-%m-%d"),
-        "average_sentiment": segments_info["average_sentiment"],
-        "total_talk_duration": segments_info["total_talk_duration"],
-        "total_dead_air_duration": segments_info["total_dead_air_duration"],
-        "crosstalk_duration": segments_info["crosstalk_duration"],
-        "score": segments_info["score"],
-        "impact_result": segments_info["impact_result"],
-        "satisfaction_score": segments_info["satisfaction_score"],
-        "projected_rating": segments_info["projected_rating"],
-        "segments": segments_info["segments"],
-        "processing_time_seconds": processing_time,
-        "call_summary": segments_info["call_summary"],
-    }
-    collection.update_one({"_id": document_id}, {"$set": updated_info})
-    if TRACK_PROCESSED_FILES or force_process:
-        processed_files.add(filename)
-
-def process_files(project_name, files_to_process, asr_model, processor, assistant_model, sentiment_pipeline, nlp, processed_files, force_process=False):
-    """Processes a batch of files."""
-    asr_pipe = configure_asr_pipeline(asr_model, processor, get_device(), assistant_model)
-    sentiment_pipe = configure_sentiment_pipeline(SENTIMENT_MODEL)
-
-    for file_info in files_to_process:
-        process_single_file(file_info, project_name, asr_pipe, sentiment_pipe, nlp, processed_files, force_process)
@@ -9,18 +9,88 @@ DIARIZATION_MODEL_ID = "pyannote/speaker-diarization-3.1"
 SPACY_MODEL = "ro_core_news_lg"
 SENTIMENT_MODEL = "nlptown/bert-base-multilingual-uncased-sentiment"
 ASSISTANT_MODEL_ID = "distil-whisper/distil-large-v3"
-TARGET_SAMPLE_RATE = 16000
-CHECK_INTERVAL = 60  # Time delay between checks in seconds
+TARGET_SAMPLE_RATE = 16000  # Calls are resampled to the Whisper feature extractor's rate once, at load time
+AUDIO_BUFFER_DTYPE = "float16"  # Storage type of the decoded channels; "float32" feeds segments to the ASR without any copy
+STREAMING_MIN_DURATION = 1800.0  # Calls at least this long (seconds) are decoded from disk on demand instead of loaded whole
+STREAMING_CHUNK_DURATION = 60.0  # Seconds of audio read at a time by the streaming peak scan
+RESAMPLE_BLOCK_DURATION = 10.0  # Seconds of output resampled per call; loaded and streamed audio share the blocks, so their samples match
+ASR_BATCH_SIZE = 8  # Number of segments sent to the ASR model per forward pass
+NLP_BATCH_SIZE = 64  # Texts per SpaCy nlp.pipe batch
+SPACY_DISABLED_COMPONENTS = ["parser"]  # Not needed for lemmas or entities
+SENTIMENT_BATCH_SIZE = 32  # Texts per sentiment model forward pass
+KEY_PHRASE_MODE = "segment"  # "segment" extracts key phrases per segment, "call" once from the joined transcript
+KEY_PHRASE_LANGUAGE = "ro"  # YAKE stopword list
+KEY_PHRASE_MAX_NGRAM = 3
+KEY_PHRASE_TOP = 20
+KEY_PHRASE_DEDUP_LIMIT = 0.9
+SEGMENTATION_MODE = "vad"  # "vad" for speech regions, "fixed" for fixed-length windows
+SEGMENT_LENGTH = 5.0  # Window length in seconds when SEGMENTATION_MODE is "fixed"
+VAD_FRAME_DURATION = 0.03  # Seconds per energy frame
+VAD_ENERGY_THRESHOLD_DB = -45.0  # Absolute speech threshold in dBFS on the normalized audio
+VAD_NOISE_MARGIN_DB = 10.0  # Speech must also be this far above the estimated noise floor
+VAD_NOISE_FLOOR_CAP_DB = 5.0  # The noise floor estimate is capped this far above VAD_ENERGY_THRESHOLD_DB; a higher one is speech
+VAD_MIN_SPEECH_DURATION = 0.3  # Shorter regions are dropped
+VAD_MAX_SEGMENT_DURATION = 10.0  # Longer regions are split; keeps transcriptions under the validation length
+VAD_MERGE_GAP = 0.5  # Regions separated by a shorter pause are merged
+VAD_PADDING = 0.2  # Seconds added around each region so word onsets are kept
+METRICS_VECTORIZE_MIN_SEGMENTS = 2000  # Calls with at least this many segments compute conversation metrics with NumPy
+CHECK_INTERVAL = 60  # Longest time between checks in seconds when no event wakes the service up
+POLL_MIN_INTERVAL = 2  # Time between checks in seconds right after work was found; doubles while nothing is found
+POLL_BACKOFF_FACTOR = 2.0
+FULL_RESCAN_INTERVAL = 3600  # Seconds between full scans of AUDIO_PATH when filesystem events are available
+FILE_SETTLE_SECONDS = 5  # A local file must be unmodified this long before it is processed
+CHANGE_STREAMS_ENABLED = True  # Wake up on calls set to to_process; needs a replica set, otherwise polling is used
+FILESYSTEM_EVENTS_ENABLED = True  # Wake up on new files under AUDIO_PATH; needs the watchdog package
+VOCABULARY_CHECK_INTERVAL = 60  # Seconds a project vocabulary is used before its version is checked again
+PIPELINE_QUEUE_DEPTH = 2  # Calls waiting between two pipeline stages
+JOB_CLAIM_BATCH_SIZE = 8  # Calls claimed from the to_process queue per poll
+JOB_LEASE_SECONDS = 300  # A claimed call whose lease is not renewed for this long is reclaimed by another worker
+JOB_HEARTBEAT_INTERVAL = 60  # Seconds between lease renewals of the calls in progress
+JOB_MAX_ATTEMPTS = 3  # Claims of a call before it is marked as failed
+PERSIST_BATCH_SIZE = 50  # Writes per collection sent in one unordered bulk_write
+PERSIST_FLUSH_INTERVAL = 2.0  # Seconds a queued write may wait for its batch to fill
+WORKER_COUNT = 0  # Worker processes for concurrent call processing; 0 processes calls in the main process
+WORKER_THREADS = None  # Torch threads per worker; None splits the CPU cores evenly between workers
+WORKER_SHUTDOWN_TIMEOUT = 600  # Seconds a worker may take to finish its current call on shutdown
+RESCORE_BATCH_SIZE = 500  # Calls per rescoring task and per bulk write of new scores
+RESCORE_PROCESSES = None  # Rescoring processes; None uses one per CPU core
 LANGUAGE = "romanian"
 TASK = "transcribe"
 SCORE = 100
 AUDIO_PATH = './audio'
-TRACK_PROCESSED_FILES = False
+TRACK_PROCESSED_FILES = True  # Processed local files are recorded in LOCAL_STATE_PATH and not processed again
+LOCAL_STATE_PATH = os.getenv('LOCAL_STATE_PATH', './state/service.sqlite3')
+STORAGE_MAX_WORKERS = 8  # Concurrent hashes and uploads of reconcile_uploads (--reconcile-uploads); also the HTTP connection pool size
+STORAGE_CHUNK_SIZE = 8 * 1024 * 1024  # Bytes per request of chunked, resumable transfers; a multiple of 256 KiB
+STORAGE_TRANSFER_ATTEMPTS = 3  # Attempts per download; a retry continues from the bytes already received
+UPLOAD_MANIFEST_ENABLED = True  # Local files are uploaded once per content hash; the uploads are recorded in LOCAL_STATE_PATH
+STORAGE_EMULATOR_PATH = os.getenv('STORAGE_EMULATOR_PATH')  # Directory used as the bucket instead of Firebase Storage, for tests and local runs
+RESULT_CACHE_ENABLED = True  # Re-processed calls reuse the transcripts and NLP output of identical audio
+RESULT_CACHE_PATH = os.getenv('RESULT_CACHE_PATH', './state/results.sqlite3')
+RESULT_CACHE_MAX_BYTES = 2 * 1024 ** 3  # Least recently used entries are evicted beyond this compressed size
+RESULT_CACHE_VERSION = 2  # Bump when transcription or segment analysis changes, so older entries are not reused
 HUGGINGFACE_ACCESS_TOKEN = os.getenv('HUGGINGFACE_ACCESS_TOKEN')
 MONGODB_CONNECTION_STRING = os.getenv('MONGODB_CONNECTION_STRING')
 STATIC_ROOT = r'\\10.203.243.11\Public\Upload Documente ASGARD\NextCallRecords'
 AI_MODEL = "Gemini"
 MODEL_NAME = "gemini-1.5-pro"
+SUMMARY_CONCURRENCY = 4  # Call summaries requested from the model at the same time, shared by all worker processes
+SUMMARY_REQUESTS_PER_MINUTE = 60  # Average rate of summary requests allowed by the token buckets of all worker processes together
+SUMMARY_BURST = 5  # Requests that may be sent at once after an idle period
+SUMMARY_MAX_ATTEMPTS = 5  # Attempts per summary before it is marked as failed
+SUMMARY_BACKOFF_BASE = 1.0  # Seconds; the retry delay is drawn up to base * 2^attempt
+SUMMARY_BACKOFF_MAX = 60.0  # Upper bound of a single retry delay
+SUMMARY_BREAKER_THRESHOLD = 5  # Consecutive failures that pause summarization
+SUMMARY_BREAKER_RESET = 60.0  # Seconds summarization stays paused before a trial request
+SUMMARY_RETRY_INTERVAL = 600.0  # Seconds between passes that queue failed summaries again
+SUMMARY_MAX_REQUEUES = 3  # Times a failed summary is queued again before it is left as failed
+SUMMARY_PROMPT_VERSION = 2  # Bump when the summary prompts change, so cached summaries are not reused
+SUMMARY_TOKEN_BUDGET = 8000  # Estimated input tokens per summary request
+SUMMARY_CHARS_PER_TOKEN = 4  # Used to estimate tokens without asking the API
+SUMMARY_LONG_TRANSCRIPT_MODE = "map_reduce"  # Over the budget: "map_reduce" summarizes chunks then combines them, "truncate" keeps the start and end
+SUMMARY_MAX_OUTPUT_TOKENS = 1024  # Output limit of a summary request
+SUMMARY_CACHE_MAX_BYTES = 256 * 1024 ** 2  # Cached summaries, stored next to the result cache
+CALL_ANALYSES = ["summary"]  # Requested with the summary in one prompt: coaching_tips, performance, knowledge_base_articles, follow_up_email
 
 # Global word sets
 COMMON_WORDS = set()
@@ -0,0 +1,150 @@
+# modules/conversation_metrics.py
+import heapq
+import math
+import numpy as np
+from .config import METRICS_VECTORIZE_MIN_SEGMENTS
+
+SPEAKERS = ("SPEAKER_00", "SPEAKER_01")
+
+
+class ConversationMetrics:
+    """
+    Accumulates talk time, dead air, crosstalk and turns from segments added in start-time order.
+
+    - talk time: summed segment durations per speaker
+    - dead air: per speaker, the silence between the end of their previous segment (or the start
+      of the call) and the start of their next one
+    - crosstalk: time during which more than one speaker is talking
+    - turns: per speaker, how often they take over from another speaker
+    """
+
+    def __init__(self, speakers=SPEAKERS):
+        self.talk_duration = {speaker: 0.0 for speaker in speakers}
+        self.dead_air_duration = {speaker: 0.0 for speaker in speakers}
+        self.turn_count = {speaker: 0 for speaker in speakers}
+        self.crosstalk_duration = 0.0
+        # Furthest end reached so far by each speaker
+        self._speaking_until = {speaker: 0.0 for speaker in speakers}
+        self._last_start = -math.inf
+        self._last_speaker = None
+
+    def add(self, speaker, start_time, end_time):
+        if start_time < self._last_start:
+            raise ValueError(f"Segment starting at {start_time} added after one starting at {self._last_start}")
+        self._last_start = start_time
+        for totals in (self.talk_duration, self.dead_air_duration, self.turn_count, self._speaking_until):
+            totals.setdefault(speaker, 0)
+
+        own_until = self._speaking_until[speaker]
+        self.talk_duration[speaker] += end_time - start_time
+        if start_time > own_until:
+            self.dead_air_duration[speaker] += start_time - own_until
+
+        # Every earlier segment started at or before this one, so from here on each speaker is
+        # talking up to their _speaking_until, and at least two of them up to the second latest
+        # of those. Whatever this segment pushes that point forward by is new crosstalk.
+        crosstalk_until = self._second_latest_end()
+        self._speaking_until[speaker] = max(own_until, end_time)
+        overlap = self._second_latest_end() - max(start_time, crosstalk_until)
+        if overlap > 0:
+            self.crosstalk_duration += overlap
+
+        if speaker != self._last_speaker:
+            self.turn_count[speaker] += 1
+            self._last_speaker = speaker
+
+    def _second_latest_end(self):
+        ends = heapq.nlargest(2, self._speaking_until.values())
+        return ends[1] if len(ends) > 1 else -math.inf
+
+    def result(self):
+        return {
+            "total_talk_duration": dict(self.talk_duration),
+            "total_dead_air_duration": dict(self.dead_air_duration),
+            "crosstalk_duration": self.crosstalk_duration,
+            "turn_count": dict(self.turn_count),
+        }
+
+
+def segment_interval(segment):
+    return segment["speaker"], segment["time_range"]["start"], segment["time_range"]["end"]
+
+
+def iter_in_time_order(segments):
+    """Yields (speaker, start, end) of the segments by start time, heap-merging the per-speaker streams."""
+    streams = {}
+    for segment in segments:
+        streams.setdefault(segment["speaker"], []).append(segment_interval(segment))
+    for intervals in streams.values():
+        # Segments of one channel normally arrive in order already, in which case this is linear
+        intervals.sort(key=lambda interval: interval[1])
+    return heapq.merge(*streams.values(), key=lambda interval: interval[1])
+
+
+def compute_metrics_incremental(segments, speakers=SPEAKERS):
+    metrics = ConversationMetrics(speakers)
+    for speaker, start_time, end_time in iter_in_time_order(segments):
+        metrics.add(speaker, start_time, end_time)
+    return metrics.result()
+
+
+def compute_metrics_vectorized(segments, speakers=SPEAKERS):
+    """Computes the same metrics as ConversationMetrics over interval arrays, for calls with many segments."""
+    names = list(speakers)
+    for speaker, _, _ in map(segment_interval, segments):
+        if speaker not in names:
+            names.append(speaker)
+    speaker_ids = np.array([names.index(segment["speaker"]) for segment in segments], dtype=np.int64)
+    starts = np.array([segment["time_range"]["start"] for segment in segments], dtype=np.float64)
+    ends = np.array([segment["time_range"]["end"] for segment in segments], dtype=np.float64)
+
+    # Same order as the heap merge: by start time, ties broken by speaker stream
+    order = np.lexsort((speaker_ids, starts))
+    speaker_ids, starts, ends = speaker_ids[order], starts[order], ends[order]
+
+    talk = np.bincount(speaker_ids, weights=ends - starts, minlength=len(names))
+    dead_air = np.zeros(len(names))
+    event_times, event_deltas = [], []
+    for speaker_id in range(len(names)):
+        own = speaker_ids == speaker_id
+        own_starts, own_ends = starts[own], ends[own]
+        if not len(own_starts):
+            continue
+        speaking_until = np.concatenate(([0.0], np.maximum.accumulate(np.maximum(own_ends, 0.0))[:-1]))
+        dead_air[speaker_id] = np.clip(own_starts - speaking_until, 0.0, None).sum()
+
+        # Merge the speaker's own intervals so only different speakers can overlap in the sweep
+        new_run = own_starts > speaking_until
+        new_run[0] = True
+        run_starts = own_starts[new_run]
+        run_ends = np.maximum.reduceat(own_ends, np.flatnonzero(new_run))
+        event_times.extend((run_starts, run_ends))
+        event_deltas.extend((np.ones(len(run_starts)), -np.ones(len(run_ends))))
+
+    crosstalk = 0.0
+    if event_times:
+        times = np.concatenate(event_times)
+        deltas = np.concatenate(event_deltas)
+        event_order = np.argsort(times, kind="stable")
+        times, deltas = times[event_order], deltas[event_order]
+        active = np.cumsum(deltas)[:-1]
+        crosstalk = float(np.diff(times)[active > 1].sum())
+
+    turns = np.zeros(len(names), dtype=np.int64)
+    if len(speaker_ids):
+        takes_over = np.concatenate(([True], speaker_ids[1:] != speaker_ids[:-1]))
+        turns = np.bincount(speaker_ids[takes_over], minlength=len(names))
+
+    return {
+        "total_talk_duration": {name: float(talk[index]) for index, name in enumerate(names)},
+        "total_dead_air_duration": {name: float(dead_air[index]) for index, name in enumerate(names)},
+        "crosstalk_duration": crosstalk,
+        "turn_count": {name: int(turns[index]) for index, name in enumerate(names)},
+    }
+
+
+def compute_conversation_metrics(segments, speakers=SPEAKERS, vectorize_min_segments=METRICS_VECTORIZE_MIN_SEGMENTS):
+    """Computes the conversation metrics of a call; long calls use the vectorized path."""
+    if len(segments) >= vectorize_min_segments:
+        return compute_metrics_vectorized(segments, speakers)
+    return compute_metrics_incremental(segments, speakers)
@@ -66,11 +66,11 @@ def extract_words_from_collection(collection):
     words = set()
     try:
         logging.info(f"Accessing collection: {collection.name}")
-        for document in collection.find({}):
+        for document in collection.find({}, {"word": 1, "_id": 0}):
             word = document.get("word")
             if word:
                 words.add(word)
-                logging.info(f"Extracted word: {word} from {collection.name}")
+                logging.debug(f"Extracted word: {word} from {collection.name}")
         logging.info(f"Extracted {len(words)} words from {collection.name} collection.")
     except Exception as e:
         logging.error(f"Error extracting words from collection {collection.name}: {e}", exc_info=True)
@@ -81,6 +81,9 @@ def load_words_from_mongodb(project_name):
     Load words from MongoDB into global variables, first from word_database,
     then add project-specific words from optima_solutions_services.
 
+    The global sets are shared by all projects; call processing uses the per-project
+    snapshots of modules.vocabulary.get_project_vocabulary instead.
+
     Parameters:
     project_name (str): The name of the project to load additional words for.
     """
@@ -134,30 +137,26 @@ def insert_agent_info(agent_info, project_name):
     """
     collection = get_collection("optima_solutions_services", "agents")
     try:
-        logging.info(f"Checking for existing agent with username: {agent_info['username']} and project: {project_name}")
-        existing_agent = collection.find_one({
-            "username": agent_info['username'],
-            "project": project_name
-        })
-
-        if not existing_agent:
-            agent_data = {
-                "username": agent_info['username'],
-                "first_name": agent_info['first_name'],
-                "last_name": agent_info['last_name'],
-                "project": project_name
-            }
-            collection.insert_one(agent_data)
+        # One round trip: the agent is only created if no document matches username and project
+        result = collection.update_one(
+            {"username": agent_info['username'], "project": project_name},
+            {"$setOnInsert": {"first_name": agent_info['first_name'], "last_name": agent_info['last_name']}},
+            upsert=True
+        )
+        if result.upserted_id is not None:
             logging.info(f"Inserted agent {agent_info['username']} into the agents database.")
         else:
             logging.info(f"Agent {agent_info['username']} already exists in the agents database.")
     except Exception as e:
         logging.error(f"Error inserting agent info: {e}", exc_info=True)
 
-def check_for_to_process_files():
+def check_for_to_process_files(limit=None):
+    """Lists calls with status 'to_process' without claiming them; see job_queue.claim_calls for processing."""
     try:
         collection = client["optima_solutions_services"]["calls"]
-        to_process_files = collection.find({"status": "to_process"})
+        to_process_files = collection.find(
+            {"status": "to_process"}, {"filename": 1, "file_info.file_path": 1, "agent_info": 1}
+        ).limit(limit or 0)
         files_info = []
         for file in to_process_files:
             file_info = file.get("file_info", {})
@@ -1,34 +1,73 @@
 import logging
-import re
 from modules.config import SCORE, DYNAMIC_FLAGS
 from modules.database import (
     COMMON_WORDS, POSITIVE_WORDS, NEGATIVE_WORDS, GREETINGS_WORDS,
     COMPANIES_NAMES, AVAILABILITY_WORDS,
     FROM_WHAT_COMPANY, GOOD_BYE_WORDS
 )
-from .text_processing import normalize_text, check_for_words
+from .text_processing import normalize_text
+from .keyword_matcher import get_keyword_matcher
+from .vocabulary import EVALUATION_CATEGORIES, FLAG_PREFIX, DynamicFlag
 
+_LEGACY_WORD_SETS = {
+    "common_words": COMMON_WORDS, "positive_words": POSITIVE_WORDS, "negative_words": NEGATIVE_WORDS,
+    "greetings_words": GREETINGS_WORDS, "companies_names": COMPANIES_NAMES,
+    "availability_words": AVAILABILITY_WORDS, "from_what_company": FROM_WHAT_COMPANY,
+    "good_bye_words": GOOD_BYE_WORDS,
+}
 
 
-def evaluate_dynamic_flags(agent_all_text):
-    agent_all_text = normalize_text(agent_all_text)
+def get_dynamic_flags(vocabulary=None):
+    if vocabulary is not None:
+        return vocabulary.dynamic_flags
+    return tuple(DynamicFlag(flag, data['keywords'], data['score']) for flag, data in DYNAMIC_FLAGS.items())
+
+
+def get_evaluation_categories(vocabulary=None):
+    """Returns every word list used to evaluate an agent, keyed by category."""
+    if vocabulary is not None:
+        return vocabulary.categories()
+    # Without a project snapshot, fall back to the word sets filled by load_words_from_mongodb
+    categories = {name: _LEGACY_WORD_SETS[attribute] for name, attribute in EVALUATION_CATEGORIES.items()}
+    for flag in get_dynamic_flags():
+        categories[FLAG_PREFIX + flag.name] = flag.keywords
+    return categories
+
+
+def scan_agent_text(agent_all_text, vocabulary=None):
+    """Finds the words of all categories and dynamic flags in one pass over the agent's text."""
+    categories = get_evaluation_categories(vocabulary)
+    matcher = vocabulary.matcher if vocabulary is not None else get_keyword_matcher(categories)
+    return matcher.scan(normalize_text(agent_all_text), categories)
+
+
+def collect_agent_text(segments):
+    """Joins the transcriptions of the agent's segments."""
+    return "".join(segment["transcription"] + " " for segment in segments if segment["type_speaker"] == "agent")
+
+
+def evaluate_dynamic_flags(agent_all_text, hits=None, vocabulary=None):
+    if hits is None:
+        hits = scan_agent_text(agent_all_text, vocabulary)
     score_deductions = 0
-    for flag, data in DYNAMIC_FLAGS.items():
-        found_keywords = [word for word in data['keywords'] if re.search(r'\b' + re.escape(word) + r'\b', agent_all_text)]
+    for flag in get_dynamic_flags(vocabulary):
+        found_keywords = hits[FLAG_PREFIX + flag.name]
         if found_keywords:
-            logging.info(f"Agent met flag '{flag}': {', '.join(found_keywords)}")
+            logging.info(f"Agent met flag '{flag.name}': {', '.join(found_keywords)}")
         else:
-            logging.info(f"Agent did not meet flag '{flag}'")
-            score_deductions += data['score']
+            logging.info(f"Agent did not meet flag '{flag.name}'")
+            score_deductions += flag.score
     logging.debug(f"Score deductions from dynamic flags: {score_deductions}")
     return score_deductions
 
-def evaluate_agent_performance(agent_all_text):
+def evaluate_agent_performance(agent_all_text, vocabulary=None, hits=None):
     score = SCORE
     logging.debug(f"Initial score: {score}")
+    if hits is None:
+        hits = scan_agent_text(agent_all_text, vocabulary)
 
     # Check for greetings
-    found_greetings = check_for_words(agent_all_text, GREETINGS_WORDS, "Greetings")
+    found_greetings = hits["Greetings"]
     if found_greetings:
         logging.info(f"Agent used greetings: {', '.join(found_greetings)}")
     else:
@@ -36,7 +75,7 @@ def evaluate_agent_performance(agent_all_text):
         score -= 5
 
     # Check for company names
-    found_companies = check_for_words(agent_all_text, COMPANIES_NAMES, "Companies")
+    found_companies = hits["Companies"]
     if found_companies:
         logging.info(f"Agent mentioned companies: {', '.join(found_companies)}")
     else:
@@ -44,7 +83,7 @@ def evaluate_agent_performance(agent_all_text):
         score -= 5
 
     # Check for goodbye words
-    found_goodbyes = check_for_words(agent_all_text, GOOD_BYE_WORDS, "Goodbyes")
+    found_goodbyes = hits["Goodbyes"]
     if found_goodbyes:
         logging.info(f"Agent used goodbye words: {', '.join(found_goodbyes)}")
     else:
@@ -52,7 +91,7 @@ def evaluate_agent_performance(agent_all_text):
         score -= 5
 
     # Check for availability words
-    found_availability = check_for_words(agent_all_text, AVAILABILITY_WORDS, "Availability")
+    found_availability = hits["Availability"]
     if found_availability:
         logging.info(f"Agent used availability words: {', '.join(found_availability)}")
     else:
@@ -60,7 +99,7 @@ def evaluate_agent_performance(agent_all_text):
         score -= 3
 
     # Check for company inquiry words
-    found_company_inquiry = check_for_words(agent_all_text, FROM_WHAT_COMPANY, "Company Inquiry")
+    found_company_inquiry = hits["Company Inquiry"]
     if found_company_inquiry:
         logging.info(f"Agent inquired about the customer's company: {', '.join(found_company_inquiry)}")
     else:
@@ -68,11 +107,11 @@ def evaluate_agent_performance(agent_all_text):
         score -= 3
 
     # Check for positive words
-    found_positive = check_for_words(agent_all_text, POSITIVE_WORDS, "Positive")
+    found_positive = hits["Positive"]
     logging.info(f"Agent used {len(found_positive)} positive words.")
 
     # Check for negative words
-    found_negative = check_for_words(agent_all_text, NEGATIVE_WORDS, "Negative")
+    found_negative = hits["Negative"]
     logging.info(f"Agent used {len(found_negative)} negative words.")
 
     # Adjust score based on positive/negative ratio
@@ -85,8 +124,14 @@ def evaluate_agent_performance(agent_all_text):
 
 
     # Check for common words (optional, for information only)
-    found_common = check_for_words(agent_all_text, COMMON_WORDS, "Common")
+    found_common = hits["Common"]
     logging.info(f"Agent used {len(found_common)} common words.")
 
     logging.info(f"Final Score: {score}")
-    return score
\ No newline at end of file
+    return score
+
+
+def score_agent_text(agent_all_text, vocabulary=None):
+    """Returns the agent's score and the deductions of the unmet dynamic flags, from a single scan of the text."""
+    hits = scan_agent_text(agent_all_text, vocabulary)
+    return evaluate_agent_performance(agent_all_text, vocabulary, hits), evaluate_dynamic_flags(agent_all_text, hits, vocabulary)
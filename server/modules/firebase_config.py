@@ -1,7 +1,9 @@
 import os
+import threading
 from dotenv import load_dotenv
 import firebase_admin
 from firebase_admin import credentials, storage
+from .config import STORAGE_EMULATOR_PATH, STORAGE_MAX_WORKERS
 
 # Load environment variables from .env file
 load_dotenv()
@@ -10,6 +12,9 @@ load_dotenv()
 SERVICE_ACCOUNT_KEY_PATH = os.getenv("SERVICE_ACCOUNT_KEY_PATH")
 STORAGE_BUCKET = os.getenv("FIREBASE_STORAGE_BUCKET", "next-mind-project.appspot.com")
 
+_bucket = None
+_bucket_lock = threading.Lock()
+
 def initialize_firebase_app():
     if not firebase_admin._apps:
         if not SERVICE_ACCOUNT_KEY_PATH:
@@ -20,6 +25,26 @@ def initialize_firebase_app():
             'storageBucket': STORAGE_BUCKET
         })
 
+def share_connections(bucket, pool_size=STORAGE_MAX_WORKERS):
+    """Sizes the HTTP connection pool of the bucket's client so concurrent transfers reuse connections."""
+    import requests
+
+    session = getattr(bucket.client, "_http", None)
+    if isinstance(session, requests.Session):
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
 def get_storage_bucket():
-    initialize_firebase_app()
-    return storage.bucket()
\ No newline at end of file
+    """Returns the bucket shared by every transfer of this process, or the local bucket of STORAGE_EMULATOR_PATH."""
+    global _bucket
+    with _bucket_lock:
+        if _bucket is None:
+            if STORAGE_EMULATOR_PATH:
+                from .local_bucket import LocalBucket
+                _bucket = LocalBucket(STORAGE_EMULATOR_PATH)
+            else:
+                initialize_firebase_app()
+                _bucket = storage.bucket()
+                share_connections(_bucket)
+        return _bucket
@@ -1,58 +1,84 @@
 from .firebase_config import get_storage_bucket
-import logging
-from google.cloud import exceptions
-import firebase_admin
 import os
-from firebase_admin import credentials, storage
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from google.cloud.storage.retry import DEFAULT_RETRY
+from .config import STORAGE_CHUNK_SIZE, STORAGE_MAX_WORKERS, STORAGE_TRANSFER_ATTEMPTS
 
 
+def blob_path(project_name, filename, folder="calls"):
+    """Name of the object that holds a call in the shared bucket."""
+    return f"{folder}/{project_name}/{filename}"
 
-def initialize_firebase():
-    cred = credentials.Certificate("serviceAccountKey.json")
-    firebase_admin.initialize_app(cred, {
-        'storageBucket': 'next-mind-project.appspot.com'
-    })
 
-def download_file_from_firebase(project_name, filename, local_file_path, folder="calls"):
-    try:
-        if not firebase_admin._apps:
-            initialize_firebase()
-        
-        bucket = storage.bucket()
-        source_blob_name = f"{folder}/{project_name}/{filename}"
-        
-        blob = bucket.blob(source_blob_name)
-        
-        if not blob.exists():
-            logging.error(f"File {filename} does not exist in Firebase Storage for project {project_name}.")
-            return None
-        
-        # Ensure the directory exists
-        os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
-        
-        blob.download_to_filename(local_file_path)
-        logging.info(f"Successfully downloaded {filename} to {local_file_path}")
-        return local_file_path
-    except Exception as e:
-        logging.error(f"Error downloading file from Firebase: {e}", exc_info=True)
-        return None
-    
-    
-def upload_file_to_firebase(local_file_path, remote_file_name, project_name, folder="calls"):
-    try:
-        bucket = get_storage_bucket()
-        blob = bucket.blob(f"{folder}/{project_name}/{remote_file_name}")
+def storage_blob(blob_name, chunk_size=STORAGE_CHUNK_SIZE):
+    """Blob of the shared bucket; a chunk size makes its transfers chunked and resumable."""
+    return get_storage_bucket().blob(blob_name, chunk_size=chunk_size)
+
+
+def download_blob(blob_name, local_file_path, attempts=STORAGE_TRANSFER_ATTEMPTS):
+    """
+    Downloads an object in chunks to local_file_path.
+
+    The data is written to a .part file first; when the connection drops, the next attempt asks
+    only for the bytes that are still missing. A missing object is reported by the download itself,
+    so there is no separate exists() request.
+    """
+    blob = storage_blob(blob_name)
+    os.makedirs(os.path.dirname(local_file_path) or ".", exist_ok=True)
+    partial_path = f"{local_file_path}.part"
+    if os.path.exists(partial_path):
+        # Left over from an earlier run; the object may have changed since
+        os.remove(partial_path)
 
-        # Check if the file already exists
-        if blob.exists():
-            logging.info(f"File {remote_file_name} already exists in Firebase Storage for project {project_name}.")
-            return blob.public_url
+    for attempt in range(attempts):
+        try:
+            with open(partial_path, "ab") as f:
+                blob.download_to_file(f, start=f.tell())
+            os.replace(partial_path, local_file_path)
+            logging.info(f"Successfully downloaded {blob_name} to {local_file_path}")
+            return local_file_path
+        except NotFound:
+            logging.error(f"File {blob_name} does not exist in Firebase Storage.")
+            break
+        except Exception as e:
+            received = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+            logging.warning(f"Download of {blob_name} interrupted after {received} bytes (attempt {attempt + 1}): {e}")
+            if attempt + 1 < attempts:
+                time.sleep(2 ** attempt)
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+    return None
 
-        # Upload the file if it does not exist
-        blob.upload_from_filename(local_file_path)
+
+def download_file_from_firebase(project_name, filename, local_file_path, folder="calls", attempts=STORAGE_TRANSFER_ATTEMPTS):
+    """Downloads the file of a project folder; see download_blob."""
+    return download_blob(blob_path(project_name, filename, folder), local_file_path, attempts)
+
+
+def upload_file_to_firebase(local_file_path, remote_file_name, project_name, folder="calls"):
+    """Uploads a file unless it is already in the bucket, and returns its public URL."""
+    try:
+        blob = storage_blob(blob_path(project_name, remote_file_name, folder))
+        # Generation 0 makes the upload fail instead of overwriting, which replaces the exists() request
+        blob.upload_from_filename(local_file_path, if_generation_match=0, retry=DEFAULT_RETRY)
         blob.make_public()  # Make the file publicly accessible
         logging.info(f"Successfully uploaded {remote_file_name} to Firebase Storage for project {project_name}.")
         return blob.public_url
+    except PreconditionFailed:
+        logging.info(f"File {remote_file_name} already exists in Firebase Storage for project {project_name}.")
+        return blob.public_url
     except Exception as e:
         logging.error(f"Error uploading file to Firebase: {e}", exc_info=True)
-        return None
\ No newline at end of file
+        return None
+
+
+def transfer_files(transfer, items, max_workers=STORAGE_MAX_WORKERS):
+    """Runs transfer(*item) for every item on a thread pool; returns the results in the order of items."""
+    items = list(items)
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix="storage") as executor:
+        return list(executor.map(lambda item: transfer(*item), items))
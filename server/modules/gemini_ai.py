@@ -1,10 +1,11 @@
 import os
+import json
 import time
 import google.generativeai as genai
 from google.generativeai import GenerationConfig
 import logging
 
-from modules.config import MODEL_NAME
+from modules.config import MODEL_NAME, SUMMARY_MAX_OUTPUT_TOKENS, CALL_ANALYSES
 
 # Configure the Gemini API
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
@@ -27,18 +28,92 @@ model = genai.GenerativeModel(
 )
 
 
-def generate_call_summary(transcript: str, retries: int = 3, wait_time: int = 5) -> str:
+def request_call_summary(transcript: str) -> str:
+    """Asks the model for the summary of a call once; raises on failure."""
     # Ensure the prompt is in Romanian
     prompt = f"Generează un rezumat al următoarei transcrieri a apelului: {transcript}"
     chat_session = model.start_chat(history=[])
-    for attempt in range(retries):
+    response = chat_session.send_message(prompt, generation_config={"max_output_tokens": SUMMARY_MAX_OUTPUT_TOKENS})
+    return response.text
+
+
+def _text(value):
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("expected a non-empty text")
+    return value.strip()
+
+
+def _text_list(value):
+    if not isinstance(value, list):
+        raise ValueError("expected a list of texts")
+    return [_text(item) for item in value]
+
+
+def _performance(value):
+    if not isinstance(value, dict):
+        raise ValueError("expected an object")
+    return {key: _text_list(value.get(key)) for key in ("positives", "negatives", "recommendations")}
+
+
+# Analyses analyze_call can request in one prompt: JSON key -> (what to write, expected shape, validator)
+ANALYSIS_TYPES = {
+    "summary": ("un rezumat concis al apelului", "text", _text),
+    "coaching_tips": ("sfaturi de coaching pentru agent", "listă de texte", _text_list),
+    "performance": (
+        "3 aspecte pozitive, 3 aspecte negative și 3 recomandări pentru agent",
+        'obiect cu cheile "positives", "negatives" și "recommendations", fiecare o listă de texte', _performance
+    ),
+    "knowledge_base_articles": ("articole relevante din baza de cunoștințe", "listă de texte", _text_list),
+    "follow_up_email": ("un email de urmărire pentru client", "text", _text),
+}
+
+
+def analysis_prompt(transcript: str, analyses, from_parts=False) -> str:
+    # Ensure the prompt is in Romanian
+    fields = "\n".join(f'- "{name}": {ANALYSIS_TYPES[name][0]} ({ANALYSIS_TYPES[name][1]})' for name in analyses)
+    source = "următoarele rezumate ale părților consecutive ale aceluiași apel" if from_parts else "următoarea transcriere a apelului"
+    return (
+        f"Analizează {source} și răspunde doar cu un obiect JSON cu următoarele chei:\n{fields}\n\n"
+        f"Text: {transcript}"
+    )
+
+
+def parse_call_analysis(text: str, analyses) -> dict:
+    """Parses and validates the JSON answer of analyze_call; the summary is required, other invalid analyses are dropped."""
+    answer = json.loads(text)
+    if not isinstance(answer, dict):
+        raise ValueError("The analysis is not a JSON object")
+    result = {}
+    for name in analyses:
         try:
-            response = chat_session.send_message(prompt)
-            return response.text
-        except Exception as e:
-            logging.error(f"Attempt {attempt + 1} failed: {e}")
-            time.sleep(wait_time)
-    return "Failed to generate call summary after multiple attempts."
+            result[name] = ANALYSIS_TYPES[name][2](answer.get(name))
+        except ValueError as e:
+            if name == "summary":
+                raise ValueError(f"Invalid summary in the analysis: {e}")
+            logging.warning(f"Dropping invalid '{name}' from the call analysis: {e}")
+    return result
+
+
+def analyze_call(transcript: str, analyses=CALL_ANALYSES, from_parts=False) -> dict:
+    """
+    Requests the summary and the other enabled analyses of a call in a single JSON response.
+
+    Returns the validated analyses keyed by name; raises if the request fails or the answer is
+    not valid, so the caller can retry.
+    """
+    analyses = ["summary"] + [name for name in analyses if name != "summary"]
+    unknown = [name for name in analyses if name not in ANALYSIS_TYPES]
+    if unknown:
+        raise ValueError(f"Unknown call analyses: {', '.join(unknown)}")
+    chat_session = model.start_chat(history=[])
+    response = chat_session.send_message(
+        analysis_prompt(transcript, analyses, from_parts),
+        generation_config={
+            "response_mime_type": "application/json",
+            "max_output_tokens": min(8192, SUMMARY_MAX_OUTPUT_TOKENS * len(analyses)),
+        }
+    )
+    return parse_call_analysis(response.text, analyses)
 
 
 def draft_follow_up_email(call_summary: str, customer_name: str) -> str:
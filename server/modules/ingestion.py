@@ -0,0 +1,271 @@
+# modules/ingestion.py
+import os
+import time
+import logging
+import threading
+from pymongo.errors import OperationFailure, PyMongoError
+from .config import (
+    AUDIO_PATH, POLL_MIN_INTERVAL, CHECK_INTERVAL, POLL_BACKOFF_FACTOR, FULL_RESCAN_INTERVAL, FILE_SETTLE_SECONDS,
+    CHANGE_STREAMS_ENABLED, FILESYSTEM_EVENTS_ENABLED, JOB_MAX_ATTEMPTS
+)
+from .database import get_collection
+from .local_state import DirectoryMarks
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# Change stream events that put a call in the to_process queue
+TO_PROCESS_EVENTS = [{
+    "$match": {
+        "$or": [
+            {"operationType": {"$in": ["insert", "replace"]}, "fullDocument.status": "to_process"},
+            {"operationType": "update", "updateDescription.updatedFields.status": "to_process"},
+        ]
+    }
+}]
+
+# Raised by servers that cannot open change streams (standalone mongod)
+CHANGE_STREAMS_UNSUPPORTED = {40573, 136}
+
+
+class PollBackoff:
+    """Poll interval that starts at min_interval and grows by factor after every pass that found nothing."""
+
+    def __init__(self, min_interval=POLL_MIN_INTERVAL, max_interval=CHECK_INTERVAL, factor=POLL_BACKOFF_FACTOR):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.interval = min_interval
+
+    def next_interval(self, found_work):
+        if found_work:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.factor)
+        return self.interval
+
+
+class _AudioEventHandler(FileSystemEventHandler):
+    def __init__(self, ingestion):
+        super().__init__()
+        self.ingestion = ingestion
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.ingestion.file_event(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.ingestion.file_event(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.ingestion.file_event(event.dest_path)
+
+
+class Ingestion:
+    """
+    Decides when and where to look for new calls.
+
+    A MongoDB change stream on calls and filesystem events under audio_path wake the service up
+    as soon as work arrives; when neither is available, or nothing happens, it falls back to
+    polling with an interval that backs off while the queue stays empty. Local files are taken
+    from the filesystem events, with a full rescan every full_rescan_interval seconds to catch
+    anything the events missed; directories that have not changed since they were last found
+    fully processed are not listed again. A file that is handed out max_attempts times without ever
+    being recorded, e.g. one that cannot be decoded, is left alone until the service restarts.
+    """
+
+    def __init__(self, processed_files, audio_path=AUDIO_PATH, backoff=None, full_rescan_interval=FULL_RESCAN_INTERVAL,
+                 settle_seconds=FILE_SETTLE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        self.processed_files = processed_files
+        self.max_attempts = max_attempts
+        self._attempts = {}
+        self.audio_path = audio_path
+        self.backoff = backoff or PollBackoff()
+        self.full_rescan_interval = full_rescan_interval
+        self.settle_seconds = settle_seconds
+        self.directory_marks = DirectoryMarks()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._pending_paths = set()
+        self._pending_lock = threading.Lock()
+        self._last_full_scan = None
+        self._last_pass = None
+        self._observer = None
+        self._change_stream_thread = None
+
+    @property
+    def watching_files(self):
+        return self._observer is not None
+
+    def start(self):
+        if CHANGE_STREAMS_ENABLED:
+            self._change_stream_thread = threading.Thread(target=self._watch_calls, name="calls-change-stream", daemon=True)
+            self._change_stream_thread.start()
+        if FILESYSTEM_EVENTS_ENABLED:
+            self._start_observer()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+
+    def wake_up(self):
+        self._wake.set()
+
+    def wait(self, found_work):
+        """
+        Sleeps until an event arrives or the next poll is due; right away after a pass that started a call.
+
+        Passes are never closer together than the minimum poll interval, so files that are seen on
+        every pass but never started, and a burst of events, cannot keep the loop spinning.
+        """
+        interval = self.backoff.next_interval(found_work)
+        if not found_work:
+            with self._pending_lock:
+                if self._pending_paths:
+                    # Files still being written are looked at again once they have had time to settle
+                    interval = min(interval, self.settle_seconds)
+            self._wake.wait(interval)
+            self._wake.clear()
+        if self._last_pass is not None:
+            remaining = self.backoff.min_interval - (time.monotonic() - self._last_pass)
+            if remaining > 0:
+                self._stopped.wait(remaining)
+        self._last_pass = time.monotonic()
+
+    def file_event(self, path):
+        self._defer(path)
+        self.wake_up()
+
+    def _defer(self, path):
+        with self._pending_lock:
+            self._pending_paths.add(os.path.abspath(path))
+
+    def _start_observer(self):
+        if Observer is None:
+            logging.info("watchdog is not installed; new local files are found by polling.")
+            return
+        if not os.path.isdir(self.audio_path):
+            return
+        try:
+            observer = Observer()
+            observer.schedule(_AudioEventHandler(self), self.audio_path, recursive=True)
+            observer.start()
+            self._observer = observer
+            logging.info(f"Watching {self.audio_path} for new calls.")
+        except Exception as e:
+            logging.warning(f"Could not watch {self.audio_path} for new calls, polling instead: {e}")
+
+    def _watch_calls(self):
+        collection = get_collection("optima_solutions_services", "calls")
+        resume_token = None
+        delay = 1
+        while not self._stopped.is_set():
+            try:
+                with collection.watch(TO_PROCESS_EVENTS, resume_after=resume_token, max_await_time_ms=1000) as stream:
+                    logging.info("Listening for calls queued with status 'to_process'.")
+                    delay = 1
+                    while not self._stopped.is_set() and stream.alive:
+                        change = stream.try_next()
+                        resume_token = stream.resume_token
+                        if change is not None:
+                            self.wake_up()
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    logging.info(f"MongoDB change streams are unavailable ({e}); to_process calls are found by polling.")
+                    return
+                logging.warning(f"Change stream on calls failed: {e}. Reopening in {delay}s.")
+                resume_token = None if e.code == 286 else resume_token  # ChangeStreamHistoryLost
+            except PyMongoError as e:
+                logging.warning(f"Change stream on calls interrupted: {e}. Reopening in {delay}s.")
+            if self._stopped.wait(delay):
+                return
+            # Something may have been queued while the stream was down
+            self.wake_up()
+            delay = min(delay * 2, CHECK_INTERVAL)
+
+    def collect_local_calls(self, in_flight=()):
+        """Returns the (file_info, project_name, force_process) calls of new local files, leaving out the in_flight (project, filename) calls."""
+        now = time.monotonic()
+        full_scan = (
+            not self.watching_files
+            or self._last_full_scan is None
+            or now - self._last_full_scan >= self.full_rescan_interval
+        )
+        if full_scan:
+            self._last_full_scan = now
+            with self._pending_lock:
+                self._pending_paths.clear()
+            candidates = self._scan_all()
+        else:
+            with self._pending_lock:
+                paths, self._pending_paths = self._pending_paths, set()
+            candidates = [candidate for candidate in map(self._event_candidate, paths) if candidate]
+
+        calls = []
+        for project_name, path in candidates:
+            filename = os.path.basename(path)
+            key = (project_name, filename)
+            if key in self.processed_files:
+                self._attempts.pop(key, None)
+                continue
+            if key in in_flight:
+                continue
+            if not self._settled(path):
+                # Still being written; look at it again on the next pass
+                self._defer(path)
+                continue
+            attempts = self._attempts.get(key, 0)
+            if attempts >= self.max_attempts:
+                if attempts == self.max_attempts:
+                    logging.warning(f"Giving up on {path} after {attempts} attempts; it is tried again after a restart.")
+                    self._attempts[key] = attempts + 1
+                continue
+            self._attempts[key] = attempts + 1
+            calls.append(({"filename": filename, "file_path": path}, project_name, False))
+        return calls
+
+    def _event_candidate(self, path):
+        """Maps an event path to (project, path) if it is a file directly inside a project directory."""
+        project_path = os.path.dirname(path)
+        if os.path.dirname(project_path) != os.path.abspath(self.audio_path) or not os.path.isfile(path):
+            return None
+        return os.path.basename(project_path), path
+
+    def _scan_all(self):
+        candidates = []
+        if not os.path.isdir(self.audio_path):
+            return candidates
+        with os.scandir(self.audio_path) as projects:
+            for project in projects:
+                if not project.is_dir():
+                    continue
+                mtime_ns = project.stat().st_mtime_ns
+                if not self.directory_marks.changed(project.path, mtime_ns):
+                    continue
+                with os.scandir(project.path) as entries:
+                    new = [
+                        (project.name, os.path.abspath(entry.path))
+                        for entry in entries
+                        if entry.is_file() and (project.name, entry.name) not in self.processed_files
+                    ]
+                if new:
+                    candidates.extend(new)
+                else:
+                    # Everything in it is processed; skip listing it until a file is added or removed
+                    self.directory_marks.mark(project.path, mtime_ns)
+        return candidates
+
+    def _settled(self, path):
+        try:
+            return time.time() - os.path.getmtime(path) >= self.settle_seconds
+        except OSError:
+            return False
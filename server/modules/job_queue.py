@@ -0,0 +1,223 @@
+# modules/job_queue.py
+import os
+import uuid
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from .config import JOB_LEASE_SECONDS, JOB_HEARTBEAT_INTERVAL, JOB_MAX_ATTEMPTS, JOB_CLAIM_BATCH_SIZE
+from .database import get_collection
+
+# Identifies this process in the worker_id field of the calls it has claimed
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+CLAIM_PROJECTION = {"filename": 1, "file_info.file_path": 1, "file_info.blob_name": 1, "agent_info": 1, "attempts": 1, "worker_id": 1}
+
+# Lease fields removed once a call is finished or handed back
+LEASE_FIELDS = {"worker_id": "", "lease_expires_at": "", "claim_token": ""}
+
+_lease_keeper = None
+_lease_keeper_lock = threading.Lock()
+
+
+def calls_collection():
+    return get_collection("optima_solutions_services", "calls")
+
+
+def claimable_filter(now, max_attempts=JOB_MAX_ATTEMPTS):
+    """Calls waiting to be processed, or whose worker stopped renewing its lease or never had one, with attempts left."""
+    return {
+        "$or": [
+            {"status": "to_process"},
+            {"status": "processing", "lease_expires_at": {"$lt": now}},
+            # Left in processing by a version that did not lease calls
+            {"status": "processing", "lease_expires_at": {"$exists": False}},
+        ],
+        "attempts": {"$not": {"$gte": max_attempts}},
+    }
+
+
+def lease_filter(worker_id, now):
+    """Documents that are free to take over: not leased, leased by worker_id, or with an expired lease."""
+    return {"$or": [{"worker_id": {"$in": [None, worker_id]}}, {"lease_expires_at": {"$lt": now}}]}
+
+
+def claim_fields(worker_id, now, lease_seconds):
+    return {
+        "status": "processing",
+        "worker_id": worker_id,
+        "lease_expires_at": now + timedelta(seconds=lease_seconds),
+        "claimed_at": now,
+    }
+
+
+def to_claimed_file(document):
+    """Converts a claimed call document to the file_info handed to the pipeline, with its claim attached."""
+    file_info = document.get("file_info", {})
+    agent_info = document.get("agent_info", {})
+    return {
+        "filename": document.get("filename"),
+        "file_path": file_info.get("file_path"),
+        "blob_name": file_info.get("blob_name"),
+        "agent_info": {
+            "username": agent_info.get("username"),
+            "first_name": agent_info.get("first_name"),
+            "last_name": agent_info.get("last_name"),
+            "project": agent_info.get("project")
+        },
+        "claim": {"document_id": document["_id"], "worker_id": document["worker_id"], "attempts": document.get("attempts", 1)},
+    }
+
+
+def claim_call(worker_id=WORKER_ID, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+    """Atomically claims the oldest claimable call, or returns None if there is none."""
+    now = datetime.utcnow()
+    document = calls_collection().find_one_and_update(
+        claimable_filter(now, max_attempts),
+        {"$set": claim_fields(worker_id, now, lease_seconds), "$inc": {"attempts": 1}},
+        projection=CLAIM_PROJECTION, sort=[("_id", 1)], return_document=ReturnDocument.AFTER
+    )
+    if document is None:
+        return None
+    claimed = to_claimed_file(document)
+    get_lease_keeper().track(claimed["claim"])
+    return claimed
+
+
+def claim_calls(limit=JOB_CLAIM_BATCH_SIZE, worker_id=WORKER_ID, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+    """
+    Claims up to limit calls in three round trips and returns them as claimed file infos.
+
+    Candidates are read first; the update re-checks that each one is still claimable, so a call
+    that another worker claimed in between is skipped rather than taken twice.
+    """
+    collection = calls_collection()
+    fail_exhausted_calls(max_attempts)
+    now = datetime.utcnow()
+    candidates = [
+        document["_id"]
+        for document in collection.find(claimable_filter(now, max_attempts), {"_id": 1}).sort("_id", 1).limit(limit)
+    ]
+    if not candidates:
+        return []
+
+    claim_token = uuid.uuid4().hex
+    fields = claim_fields(worker_id, now, lease_seconds)
+    fields["claim_token"] = claim_token
+    collection.update_many(
+        {"$and": [{"_id": {"$in": candidates}}, claimable_filter(now, max_attempts)]},
+        {"$set": fields, "$inc": {"attempts": 1}}
+    )
+    claimed = [to_claimed_file(document) for document in collection.find({"claim_token": claim_token}, CLAIM_PROJECTION).sort("_id", 1)]
+
+    keeper = get_lease_keeper()
+    for file_info in claimed:
+        keeper.track(file_info["claim"])
+    logging.info(f"Claimed {len(claimed)} of {len(candidates)} calls with status 'to_process' or an expired lease.")
+    return claimed
+
+
+def fail_exhausted_calls(max_attempts=JOB_MAX_ATTEMPTS):
+    """Marks calls whose lease expired after their last allowed attempt as failed."""
+    now = datetime.utcnow()
+    result = calls_collection().update_many(
+        {"status": "processing", "lease_expires_at": {"$lt": now}, "attempts": {"$gte": max_attempts}},
+        # attempts starts over, so setting the call back to to_process retries it
+        {"$set": {"status": "failed", "last_error": "Lease expired on the last attempt", "attempts": 0}, "$unset": LEASE_FIELDS}
+    )
+    if result.modified_count:
+        logging.warning(f"Marked {result.modified_count} calls as failed after {max_attempts} attempts.")
+
+
+def renew_leases(claims, lease_seconds=JOB_LEASE_SECONDS):
+    """Extends the leases of claims still owned by their worker; returns the claims that were lost."""
+    expires_at = datetime.utcnow() + timedelta(seconds=lease_seconds)
+    lost = []
+    by_worker = {}
+    for claim in claims:
+        by_worker.setdefault(claim["worker_id"], []).append(claim)
+    for worker_id, worker_claims in by_worker.items():
+        document_ids = [claim["document_id"] for claim in worker_claims]
+        collection = calls_collection()
+        collection.update_many(
+            {"_id": {"$in": document_ids}, "worker_id": worker_id},
+            {"$set": {"lease_expires_at": expires_at}}
+        )
+        owned = {document["_id"] for document in collection.find({"_id": {"$in": document_ids}, "worker_id": worker_id}, {"_id": 1})}
+        lost.extend(claim for claim in worker_claims if claim["document_id"] not in owned)
+    return lost
+
+
+def fail_call(claim, error, retry=True, max_attempts=JOB_MAX_ATTEMPTS):
+    """Releases a claimed call after a failure: back to to_process while attempts are left, else failed."""
+    get_lease_keeper().release(claim)
+    status = "to_process" if retry and claim["attempts"] < max_attempts else "failed"
+    fields = {"status": status, "last_error": str(error)}
+    if status == "failed":
+        # A failed call that is set back to to_process gets all its attempts again
+        fields["attempts"] = 0
+    result = calls_collection().update_one(
+        {"_id": claim["document_id"], "worker_id": claim["worker_id"]},
+        {"$set": fields, "$unset": LEASE_FIELDS}
+    )
+    if result.matched_count:
+        logging.info(f"Call {claim['document_id']} released as '{status}' after attempt {claim['attempts']}: {error}")
+    else:
+        logging.warning(f"Call {claim['document_id']} was no longer leased by {claim['worker_id']}")
+
+
+def return_call(claim):
+    """Hands back a call that was claimed but never started, without using up an attempt."""
+    get_lease_keeper().release(claim)
+    calls_collection().update_one(
+        {"_id": claim["document_id"], "worker_id": claim["worker_id"]},
+        {"$set": {"status": "to_process"}, "$unset": LEASE_FIELDS, "$inc": {"attempts": -1}}
+    )
+
+
+class LeaseKeeper:
+    """Background thread that renews the leases of the calls in progress every interval seconds."""
+
+    def __init__(self, interval=JOB_HEARTBEAT_INTERVAL, lease_seconds=JOB_LEASE_SECONDS):
+        self.interval = interval
+        self.lease_seconds = lease_seconds
+        self._claims = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-keeper", daemon=True)
+        self._thread.start()
+
+    def track(self, claim):
+        with self._lock:
+            self._claims[(claim["document_id"], claim["worker_id"])] = claim
+
+    def release(self, claim):
+        with self._lock:
+            self._claims.pop((claim["document_id"], claim["worker_id"]), None)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                claims = list(self._claims.values())
+            if not claims:
+                continue
+            try:
+                for claim in renew_leases(claims, self.lease_seconds):
+                    logging.warning(f"Lease on call {claim['document_id']} was taken over by another worker")
+                    self.release(claim)
+            except Exception as e:
+                logging.error(f"Error renewing {len(claims)} call leases: {e}")
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+
+def get_lease_keeper():
+    """Returns the lease keeper of this process, starting it on first use."""
+    global _lease_keeper
+    with _lease_keeper_lock:
+        if _lease_keeper is None:
+            _lease_keeper = LeaseKeeper()
+        return _lease_keeper
@@ -0,0 +1,118 @@
+# modules/keyword_matcher.py
+import re
+import logging
+from collections import deque, OrderedDict
+
+_MATCHER_CACHE_SIZE = 16
+_matcher_cache = OrderedDict()
+
+
+def is_word_char(char):
+    """Mirrors the Unicode definition of \\w used by the re module."""
+    return char.isalnum() or char == "_"
+
+
+def has_word_boundary(text, position):
+    """Mirrors \\b: true where exactly one side of the position is a word character."""
+    before = position > 0 and is_word_char(text[position - 1])
+    after = position < len(text) and is_word_char(text[position])
+    return before != after
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over the word lists of several categories.
+
+    A word is reported for a text exactly when re.search(r'\\b' + re.escape(word) + r'\\b', text)
+    would find it, but all words of all categories are found in a single pass over the text.
+    """
+
+    def __init__(self, categories):
+        self.categories = {name: tuple(words) for name, words in categories.items()}
+        self.words = []
+        self.empty_word_categories = set()
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        word_ids = {}
+        for name, words in self.categories.items():
+            for word in words:
+                if not word:
+                    self.empty_word_categories.add(name)
+                elif word not in word_ids:
+                    word_ids[word] = len(self.words)
+                    self.words.append(word)
+                    self._add_word(word, word_ids[word])
+        self._build_failure_links()
+
+    def _add_word(self, word, word_id):
+        state = 0
+        for char in word:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state].append(word_id)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find_words(self, text):
+        """Returns the set of words that occur in the text between word boundaries."""
+        found = set()
+        goto, fail, output, words = self._goto, self._fail, self._output, self.words
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                end = index + 1
+                if not has_word_boundary(text, end):
+                    continue
+                for word_id in output[state]:
+                    word = words[word_id]
+                    if word not in found and has_word_boundary(text, end - len(word)):
+                        found.add(word)
+        return found
+
+    def scan(self, text, categories=None):
+        """Returns, per category, the words found in the text in the order of the given word lists."""
+        found = self.find_words(text)
+        if self.empty_word_categories and re.search(r'\b\b', text):
+            found.add("")
+        categories = self.categories if categories is None else categories
+        hits = {name: [word for word in words if word in found] for name, words in categories.items()}
+        for name, words in hits.items():
+            logging.debug(f"{name} words found: {words}")
+        return hits
+
+
+def get_keyword_matcher(categories):
+    """Returns a matcher for the categories, reusing the one built for identical word lists."""
+    key = tuple((name, frozenset(words)) for name, words in categories.items())
+    matcher = _matcher_cache.get(key)
+    if matcher is None:
+        matcher = KeywordMatcher(categories)
+        _matcher_cache[key] = matcher
+        if len(_matcher_cache) > _MATCHER_CACHE_SIZE:
+            _matcher_cache.popitem(last=False)
+    else:
+        _matcher_cache.move_to_end(key)
+    return matcher
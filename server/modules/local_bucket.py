@@ -0,0 +1,90 @@
+# modules/local_bucket.py
+import os
+import shutil
+import threading
+from pathlib import Path
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+
+class LocalBlob:
+    """Object of a LocalBucket; implements the parts of google.cloud.storage.Blob the service uses."""
+
+    def __init__(self, bucket, name, chunk_size=None):
+        self.bucket = bucket
+        self.name = name
+        self.chunk_size = chunk_size or 1024 * 1024
+        self.path = bucket.root / name
+
+    @property
+    def public_url(self):
+        # A file:// URL would only be readable on this machine; the object name is what can be downloaded again
+        return self.name
+
+    def exists(self, client=None):
+        return self.path.is_file()
+
+    def make_public(self, client=None):
+        pass
+
+    def upload_from_filename(self, filename, if_generation_match=None, retry=None, **kwargs):
+        with open(filename, "rb") as f:
+            self.upload_from_file(f, if_generation_match=if_generation_match)
+
+    def upload_from_file(self, file_obj, if_generation_match=None, retry=None, **kwargs):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        partial_path = self.path.with_name(f".{self.path.name}.{threading.get_ident()}.upload")
+        with open(partial_path, "wb") as f:
+            shutil.copyfileobj(file_obj, f, self.chunk_size)
+        with self.bucket.lock:
+            # Generation 0 means "only if the object does not exist yet", as in Cloud Storage
+            if if_generation_match == 0 and self.path.exists():
+                os.remove(partial_path)
+                raise PreconditionFailed(f"{self.name} already exists")
+            os.replace(partial_path, self.path)
+
+    def download_to_file(self, file_obj, start=None, end=None, retry=None, **kwargs):
+        if not self.path.is_file():
+            raise NotFound(f"{self.name} does not exist")
+        with open(self.path, "rb") as f:
+            f.seek(start or 0)
+            remaining = None if end is None else end - (start or 0) + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(self.chunk_size if remaining is None else min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                file_obj.write(chunk)
+                if remaining is not None:
+                    remaining -= len(chunk)
+
+    def download_to_filename(self, filename, **kwargs):
+        with open(filename, "wb") as f:
+            self.download_to_file(f, **kwargs)
+
+    def delete(self, **kwargs):
+        if not self.path.is_file():
+            raise NotFound(f"{self.name} does not exist")
+        self.path.unlink()
+
+
+class LocalBucket:
+    """
+    Directory that stands in for the Firebase Storage bucket.
+
+    Selected with STORAGE_EMULATOR_PATH, so uploads and downloads can be exercised without
+    credentials or network access. Object names map to paths below root.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.name = self.root.name
+        self.lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def blob(self, blob_name, chunk_size=None, **kwargs):
+        return LocalBlob(self, blob_name, chunk_size)
+
+    def list_blobs(self, prefix=None, **kwargs):
+        for path in sorted(self.root.rglob("*")):
+            name = path.relative_to(self.root).as_posix()
+            if path.is_file() and not path.name.startswith(".") and (prefix is None or name.startswith(prefix)):
+                yield LocalBlob(self, name)
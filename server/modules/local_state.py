@@ -0,0 +1,115 @@
+# modules/local_state.py
+import os
+import time
+import sqlite3
+import threading
+from .config import AUDIO_PATH, LOCAL_STATE_PATH
+
+
+def connect(path=LOCAL_STATE_PATH):
+    """Opens a SQLite database for local service state, creating its directory; safe to share between threads."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+    # WAL lets readers carry on while a write is in progress and survives crashes mid-write
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+class ProcessedFiles:
+    """
+    Durable set of processed (project, filename) calls.
+
+    Offers the set interface the service already uses (in, add, update), so it can replace the
+    in-memory processed_files set; lookups are served from memory, additions are written through.
+    Calls are keyed by project as well as filename, since two projects can hold files with the same name.
+    """
+
+    def __init__(self, path=LOCAL_STATE_PATH, audio_path=AUDIO_PATH):
+        self._lock = threading.Lock()
+        self._connection = connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS processed_calls "
+            "(project TEXT NOT NULL, filename TEXT NOT NULL, processed_at REAL NOT NULL, PRIMARY KEY (project, filename))"
+        )
+        self._migrate_filenames(audio_path)
+        self._calls = {tuple(row) for row in self._connection.execute("SELECT project, filename FROM processed_calls")}
+
+    def _migrate_filenames(self, audio_path):
+        """
+        Moves the entries of the older table, keyed by filename only, to the projects whose directories hold those files.
+
+        A name found in several projects is kept for all of them, as the older table skipped it in every one.
+        Entries without a local file only ever mattered to the local scan and are dropped.
+        """
+        legacy = self._connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'processed_files'"
+        ).fetchone()
+        if legacy is None:
+            return
+        filenames = {row[0] for row in self._connection.execute("SELECT filename FROM processed_files")}
+        calls = []
+        if filenames and os.path.isdir(audio_path):
+            with os.scandir(audio_path) as projects:
+                for project in projects:
+                    if project.is_dir():
+                        calls.extend((project.name, name) for name in os.listdir(project.path) if name in filenames)
+        now = time.time()
+        self._connection.executemany(
+            "INSERT OR IGNORE INTO processed_calls (project, filename, processed_at) VALUES (?, ?, ?)",
+            [(project, filename, now) for project, filename in calls]
+        )
+        self._connection.execute("DROP TABLE processed_files")
+
+    def __contains__(self, call):
+        return call in self._calls
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._calls))
+
+    def add(self, call):
+        self.update([call])
+
+    def update(self, calls):
+        with self._lock:
+            new = [call for call in set(calls) if call not in self._calls]
+            if not new:
+                return
+            now = time.time()
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO processed_calls (project, filename, processed_at) VALUES (?, ?, ?)",
+                [(project, filename, now) for project, filename in new]
+            )
+            self._calls.update(new)
+
+    def discard(self, call):
+        with self._lock:
+            self._connection.execute("DELETE FROM processed_calls WHERE project = ? AND filename = ?", call)
+            self._calls.discard(call)
+
+
+class DirectoryMarks:
+    """Remembers the modification time of each scanned directory, so unchanged directories are not listed again."""
+
+    def __init__(self, path=LOCAL_STATE_PATH):
+        self._lock = threading.Lock()
+        self._connection = connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS scanned_directories (path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL)"
+        )
+
+    def changed(self, path, mtime_ns):
+        with self._lock:
+            row = self._connection.execute("SELECT mtime_ns FROM scanned_directories WHERE path = ?", (path,)).fetchone()
+        return row is None or row[0] != mtime_ns
+
+    def mark(self, path, mtime_ns):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO scanned_directories (path, mtime_ns) VALUES (?, ?)", (path, mtime_ns)
+            )
@@ -0,0 +1,92 @@
+# modules/model_registry.py
+import os
+import sys
+import time
+import logging
+import threading
+from .config import ASR_MODEL_ID, ASSISTANT_MODEL_ID, SPACY_MODEL, SENTIMENT_MODEL
+from .utils import get_device
+from .models import (
+    load_asr_model, load_assistant_model, load_spacy_model,
+    configure_asr_pipeline, configure_sentiment_pipeline
+)
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# One instance of every model per process, shared across files and poll cycles
+_MODELS = {}
+_MODEL_STATS = {}
+_LOCK = threading.RLock()
+
+
+def get_resident_memory():
+    """Returns the resident memory of the current process in bytes, or None if it cannot be read."""
+    if psutil is not None:
+        return psutil.Process(os.getpid()).memory_info().rss
+    if sys.platform.startswith("linux"):
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    return None
+
+
+def get_model(name, loader):
+    """Returns the model registered under name, loading it with loader on first use."""
+    with _LOCK:
+        if name not in _MODELS:
+            memory_before = get_resident_memory()
+            start_time = time.perf_counter()
+            _MODELS[name] = loader()
+            load_seconds = time.perf_counter() - start_time
+            memory_after = get_resident_memory()
+
+            memory_mb = None
+            if memory_before is not None and memory_after is not None:
+                memory_mb = (memory_after - memory_before) / (1024 * 1024)
+            _MODEL_STATS[name] = {"load_seconds": load_seconds, "resident_memory_mb": memory_mb}
+
+            memory_text = f"{memory_mb:.0f} MB" if memory_mb is not None else "unknown memory"
+            logging.info(f"Loaded {name} in {load_seconds:.1f}s ({memory_text}).")
+        return _MODELS[name]
+
+
+def get_asr_pipeline():
+    """Returns the shared ASR pipeline."""
+    with _LOCK:
+        if "asr_pipeline" in _MODELS:
+            return _MODELS["asr_pipeline"]
+        # Load the models first so the pipeline's own stats do not count their memory twice
+        device = get_device()
+        asr_model, processor = get_model("asr_model", lambda: load_asr_model(ASR_MODEL_ID, device))
+        assistant_model = get_model("assistant_model", lambda: load_assistant_model(ASSISTANT_MODEL_ID, device))
+        return get_model("asr_pipeline", lambda: configure_asr_pipeline(asr_model, processor, device, assistant_model))
+
+
+def get_sentiment_pipeline():
+    """Returns the shared sentiment pipeline."""
+    return get_model("sentiment_pipeline", lambda: configure_sentiment_pipeline(SENTIMENT_MODEL))
+
+
+def get_spacy_model():
+    """Returns the shared SpaCy model."""
+    return get_model("spacy_model", lambda: load_spacy_model(SPACY_MODEL))
+
+
+def get_model_stats():
+    """Returns load time and resident memory per loaded model."""
+    with _LOCK:
+        return {name: dict(stats) for name, stats in _MODEL_STATS.items()}
+
+
+def log_model_stats():
+    """Logs the load time and resident memory of every loaded model, and their totals."""
+    model_stats = get_model_stats()
+    total_seconds = sum(stats["load_seconds"] for stats in model_stats.values())
+    total_memory = sum(stats["resident_memory_mb"] or 0 for stats in model_stats.values())
+    for name, stats in model_stats.items():
+        memory_mb = stats["resident_memory_mb"]
+        memory_text = f"{memory_mb:.0f} MB" if memory_mb is not None else "unknown"
+        logging.info(f"Model {name}: load time {stats['load_seconds']:.1f}s, resident memory {memory_text}")
+    logging.info(f"Model startup total: {total_seconds:.1f}s, {total_memory:.0f} MB")
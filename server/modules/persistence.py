@@ -0,0 +1,240 @@
+# modules/persistence.py
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from .config import PERSIST_BATCH_SIZE, PERSIST_FLUSH_INTERVAL, JOB_LEASE_SECONDS
+from .database import get_collection
+from .job_queue import WORKER_ID, LEASE_FIELDS, lease_filter, get_lease_keeper
+
+DATABASE_NAME = "optima_solutions_services"
+
+
+# Indexes the job queue depends on: register_call relies on the unique index to keep two workers off the same call
+REQUIRED_INDEXES = {
+    "calls": [("filename_1_agent_info.project_1", [("filename", ASCENDING), ("agent_info.project", ASCENDING)], {"unique": True})],
+    "agents": [("username_1_project_1", [("username", ASCENDING), ("project", ASCENDING)], {"unique": True})],
+}
+
+
+def ensure_required_indexes():
+    """Creates the indexes the service cannot run correctly without; returns False if one is missing or different."""
+    ok = True
+    for collection_name, indexes in REQUIRED_INDEXES.items():
+        collection = get_collection(DATABASE_NAME, collection_name)
+        for name, keys, options in indexes:
+            try:
+                collection.create_index(keys, name=name, **options)
+            except OperationFailure as e:
+                logging.error(f"Could not create index {collection_name}.{name}: {e}. Run init_db.py to see the duplicates.")
+                ok = False
+                continue
+            index = collection.index_information().get(name)
+            if index is None or bool(index.get("unique")) != bool(options.get("unique")):
+                logging.error(f"Index {collection_name}.{name} is missing or not unique: {index}")
+                ok = False
+    return ok
+
+
+def agent_upsert(agent_info, project_name):
+    """Write that creates the agent of a project unless it already exists."""
+    return UpdateOne(
+        {"username": agent_info['username'], "project": project_name},
+        {"$setOnInsert": {"first_name": agent_info['first_name'], "last_name": agent_info['last_name']}},
+        upsert=True
+    )
+
+
+def call_registration(filename, firebase_url, final_status, day, audio_duration, agent_info, project_name, phone_number,
+                      worker_id=WORKER_ID, lease_seconds=JOB_LEASE_SECONDS, count_attempt=True, blob_name=None):
+    """
+    Filter and update that create or refresh the document of a call that is about to be processed.
+
+    The document is leased to worker_id; a document leased by another worker does not match, so
+    the upsert then collides with the unique (filename, agent_info.project) index instead.
+    """
+    now = datetime.utcnow()
+    call_filter = {"filename": filename, "agent_info.project": project_name}
+    call_filter.update(lease_filter(worker_id, now))
+    update = {
+        "$set": {
+            "day_processed": datetime.now().strftime("%Y-%m-%d"),
+            "status": "processing",
+            "file_info.duration": audio_duration,
+            "file_info.final_status": final_status if final_status else "",
+            "file_info.day": day if day else "",
+            "file_info.file_path": firebase_url if firebase_url else "",
+            "phone_number": phone_number if phone_number else "",
+            "agent_info.username": agent_info['username'],
+            "agent_info.first_name": agent_info['first_name'],
+            "agent_info.last_name": agent_info['last_name'],
+            "worker_id": worker_id,
+            "lease_expires_at": now + timedelta(seconds=lease_seconds),
+            # The summarization service replaces this once the model has answered
+            "call_summary_status": "pending",
+        },
+        # A reprocessed call must not keep showing the summary of the previous run
+        "$unset": {"call_summary": "", "call_analysis": "", "summary_requeues": ""},
+        "$setOnInsert": {
+            "file_info.extension": os.path.splitext(filename)[1][1:],
+        },
+    }
+    if blob_name:
+        # The object the audio is downloaded from when the call is processed again
+        update["$set"]["file_info.blob_name"] = blob_name
+    if count_attempt:
+        update["$inc"] = {"attempts": 1}
+    return call_filter, update
+
+
+def register_call(filename, firebase_url, final_status, day, audio_duration, agent_info, project_name, phone_number,
+                  worker_id=WORKER_ID, count_attempt=True, blob_name=None):
+    """
+    Upserts the call document in a single round trip and leases it to worker_id.
+
+    Returns the claim on the call, or None if another worker holds a live lease on it.
+    """
+    call_filter, update = call_registration(
+        filename, firebase_url, final_status, day, audio_duration, agent_info, project_name, phone_number,
+        worker_id=worker_id, count_attempt=count_attempt, blob_name=blob_name
+    )
+    collection = get_collection(DATABASE_NAME, "calls")
+    try:
+        document = collection.find_one_and_update(
+            call_filter, update, projection={"_id": 1, "attempts": 1}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        return None
+    claim = {"document_id": document["_id"], "worker_id": worker_id, "attempts": document.get("attempts", 1)}
+    get_lease_keeper().track(claim)
+    return claim
+
+
+def results_update(segments_info, audio_duration, start_time):
+    """Update that stores the results of a call, releases its lease and starts its attempts over for a later reprocess."""
+    results = call_results(segments_info, audio_duration, start_time)
+    results["attempts"] = 0
+    return {"$set": results, "$unset": LEASE_FIELDS}
+
+
+def call_results(segments_info, audio_duration, start_time):
+    """Fields written to the call document once processing is done."""
+    updated_info = {
+        "file_info.duration": audio_duration,
+        "status": "processed",
+        "day_processed": datetime.now().strftime("%Y-%m-%d"),
+        "average_sentiment": segments_info["average_sentiment"],
+        "total_talk_duration": segments_info["total_talk_duration"],
+        "total_dead_air_duration": segments_info["total_dead_air_duration"],
+        "crosstalk_duration": segments_info["crosstalk_duration"],
+        "turn_count": segments_info["turn_count"],
+        "score": segments_info["score"],
+        "flag_deductions": segments_info["flag_deductions"],
+        "impact_result": segments_info["impact_result"],
+        "satisfaction_score": segments_info["satisfaction_score"],
+        "projected_rating": segments_info["projected_rating"],
+        "segments": segments_info["segments"],
+        "processing_time_seconds": time.time() - start_time,
+        # call_summary and call_analysis are written by the summarization service when the model answers
+    }
+    if "key_phrases" in segments_info:
+        updated_info["key_phrases"] = segments_info["key_phrases"]
+    return updated_info
+
+
+class BulkWriter:
+    """
+    Buffers writes per collection and sends them as unordered bulk_write batches.
+
+    A collection is flushed as soon as it has max_operations pending writes, and a background
+    thread flushes whatever has been waiting longer than max_delay seconds. Callbacks passed
+    with a write run once that write has been acknowledged.
+    """
+
+    def __init__(self, database_name=DATABASE_NAME, max_operations=PERSIST_BATCH_SIZE, max_delay=PERSIST_FLUSH_INTERVAL):
+        self.database_name = database_name
+        self.max_operations = max_operations
+        self.max_delay = max_delay
+        self._pending = {}
+        self._oldest = {}
+        self._known_agents = set()
+        self._lock = threading.Lock()
+        # Serializes the flushes so a collection's batches reach MongoDB in the order they were queued
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, name="bulk-writer", daemon=True)
+        self._flusher.start()
+
+    def add(self, collection_name, operation, on_written=None):
+        with self._lock:
+            pending = self._pending.setdefault(collection_name, [])
+            if not pending:
+                self._oldest[collection_name] = time.monotonic()
+            pending.append((operation, on_written))
+            full = len(pending) >= self.max_operations
+        if full:
+            self.flush(collection_name)
+
+    def add_agent(self, agent_info, project_name):
+        """Queues the agent upsert once per agent and project for the lifetime of the writer."""
+        key = (agent_info['username'], project_name)
+        with self._lock:
+            if key in self._known_agents:
+                return
+            self._known_agents.add(key)
+        self.add("agents", agent_upsert(agent_info, project_name))
+
+    def flush(self, collection_name=None):
+        """Sends the pending writes of one collection, or of all collections."""
+        with self._flush_lock:
+            with self._lock:
+                names = [collection_name] if collection_name else list(self._pending)
+                batches = {name: self._pending.pop(name, []) for name in names}
+                for name in names:
+                    self._oldest.pop(name, None)
+            for name, batch in batches.items():
+                if batch:
+                    self._write(name, batch)
+
+    def _write(self, collection_name, batch):
+        collection = get_collection(self.database_name, collection_name)
+        failed = set()
+        try:
+            result = collection.bulk_write([operation for operation, _ in batch], ordered=False)
+            logging.info(
+                f"Bulk write to {collection_name}: {len(batch)} operations, {result.upserted_count} upserted, "
+                f"{result.modified_count} modified"
+            )
+        except BulkWriteError as e:
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            for error in e.details.get("writeErrors", []):
+                logging.error(f"Bulk write to {collection_name} failed for operation {error['index']}: {error.get('errmsg')}")
+            if e.details.get("writeConcernErrors"):
+                logging.error(f"Bulk write to {collection_name} had write concern errors: {e.details['writeConcernErrors']}")
+        except Exception as e:
+            logging.error(f"Bulk write of {len(batch)} operations to {collection_name} failed: {e}")
+            failed = set(range(len(batch)))
+
+        for index, (_, on_written) in enumerate(batch):
+            if on_written and index not in failed:
+                try:
+                    on_written()
+                except Exception as e:
+                    logging.error(f"Error after writing to {collection_name}: {e}")
+
+    def _flush_periodically(self):
+        while not self._closed.wait(min(self.max_delay, 1.0)):
+            now = time.monotonic()
+            with self._lock:
+                due = [name for name, oldest in self._oldest.items() if now - oldest >= self.max_delay]
+            for name in due:
+                self.flush(name)
+
+    def close(self):
+        """Stops the background flusher and writes everything still pending."""
+        self._closed.set()
+        self._flusher.join()
+        self.flush()
@@ -0,0 +1,95 @@
+# modules/prompt_preparation.py
+import re
+import math
+import hashlib
+from functools import lru_cache
+from .config import MODEL_NAME, SUMMARY_PROMPT_VERSION, SUMMARY_TOKEN_BUDGET, SUMMARY_CHARS_PER_TOKEN
+
+TRUNCATION_MARK = " [...] "
+
+
+@lru_cache(maxsize=16)
+def filler_pattern(words_to_remove):
+    """Whole-word, case-insensitive pattern of the filler words; longest first so phrases win over their words."""
+    words = sorted((word for word in words_to_remove if word and word.strip()), key=len, reverse=True)
+    if not words:
+        return None
+    return re.compile(r"\b(?:" + "|".join(map(re.escape, words)) + r")\b", re.IGNORECASE)
+
+
+def remove_filler(text, words_to_remove):
+    pattern = filler_pattern(frozenset(words_to_remove))
+    if pattern is not None:
+        text = pattern.sub(" ", text)
+    # Drops the gaps left behind and the spaces before punctuation
+    return re.sub(r"\s+([,.!?;:])", r"\1", " ".join(text.split())).strip(" ,;:")
+
+
+def compact_segments(texts, words_to_remove=frozenset()):
+    """Removes filler words, then segments left empty and segments repeating an earlier one."""
+    seen = set()
+    compacted = []
+    for text in texts:
+        text = remove_filler(text, words_to_remove)
+        key = re.sub(r"\W+", " ", text.lower()).strip()
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        compacted.append(text)
+    return compacted
+
+
+def estimate_tokens(text, chars_per_token=SUMMARY_CHARS_PER_TOKEN):
+    """Approximate token count; avoids a count_tokens round trip to the API per call."""
+    return math.ceil(len(text) / chars_per_token)
+
+
+def truncate_segments(texts, token_budget=SUMMARY_TOKEN_BUDGET):
+    """
+    Fits the segments into the budget by keeping the start and the end of the call.
+
+    Two thirds of the budget go to the opening segments and the rest to the closing ones,
+    since greetings, the offer and the goodbye are what the summary is most often about.
+    """
+    head_budget = token_budget * 2 // 3
+    head, used = [], 0
+    for text in texts:
+        cost = estimate_tokens(text + " ")
+        if used + cost > head_budget:
+            break
+        head.append(text)
+        used += cost
+    tail, used = [], 0
+    for text in reversed(texts[len(head):]):
+        cost = estimate_tokens(text + " ")
+        if used + cost > token_budget - head_budget:
+            break
+        tail.append(text)
+        used += cost
+    if len(head) + len(tail) == len(texts):
+        return " ".join(texts)
+    return " ".join(head) + TRUNCATION_MARK + " ".join(reversed(tail))
+
+
+def split_segments(texts, token_budget=SUMMARY_TOKEN_BUDGET):
+    """Groups consecutive segments into chunks of at most token_budget tokens, cutting overlong segments."""
+    max_chars = token_budget * SUMMARY_CHARS_PER_TOKEN
+    chunks, current, used = [], [], 0
+    for text in texts:
+        for start in range(0, len(text), max_chars):
+            piece = text[start:start + max_chars]
+            cost = estimate_tokens(piece + " ")
+            if current and used + cost > token_budget:
+                chunks.append(" ".join(current))
+                current, used = [], 0
+            current.append(piece)
+            used += cost
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def summary_key(transcript, analyses=(), model_name=MODEL_NAME, prompt_version=SUMMARY_PROMPT_VERSION):
+    """Cache key of a summary: the compacted transcript, the requested analyses, the model and the prompt version."""
+    requested = ",".join(sorted(analyses))
+    return hashlib.sha256(f"{prompt_version}:{model_name}:{requested}:{transcript}".encode("utf-8")).hexdigest()
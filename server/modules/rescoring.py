@@ -0,0 +1,163 @@
+# modules/rescoring.py
+import time
+import json
+import hashlib
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateOne
+from .config import RESCORE_BATCH_SIZE, RESCORE_PROCESSES, LOCAL_STATE_PATH
+from .database import get_collection
+from .evaluation import collect_agent_text, score_agent_text
+from .local_state import connect
+from .vocabulary import get_project_vocabulary
+
+DATABASE_NAME = "optima_solutions_services"
+
+# Only what is needed to rebuild the agent's text; the rest of the segment stays on the server
+RESCORE_PROJECTION = {"segments.transcription": 1, "segments.type_speaker": 1, "score": 1, "flag_deductions": 1}
+
+# Vocabulary of the pool worker, set once by the pool initializer
+_worker_vocabulary = None
+
+
+def _init_rescore_worker(vocabulary):
+    global _worker_vocabulary
+    _worker_vocabulary = vocabulary
+    # The evaluation logs every category of every call; only problems are of interest here
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def _rescore_batch(batch):
+    """Scores the (document_id, agent_text, old_scores) calls of a batch; returns the ids and scores that changed."""
+    updates = []
+    for document_id, agent_text, old_scores in batch:
+        scores = score_agent_text(agent_text, _worker_vocabulary)
+        if scores != old_scores:
+            updates.append((document_id, scores))
+    return updates
+
+
+def vocabulary_fingerprint(vocabulary):
+    return hashlib.sha256(json.dumps(vocabulary.version, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+class RescoreProgress:
+    """Last call _id rescored per project and vocabulary version, so an interrupted run continues where it stopped."""
+
+    def __init__(self, path=LOCAL_STATE_PATH):
+        self._connection = connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS rescore_progress "
+            "(project TEXT NOT NULL, vocabulary TEXT NOT NULL, last_id TEXT NOT NULL, rescored INTEGER NOT NULL, "
+            "updated_at REAL NOT NULL, PRIMARY KEY (project, vocabulary))"
+        )
+
+    def load(self, project, vocabulary):
+        row = self._connection.execute(
+            "SELECT last_id, rescored FROM rescore_progress WHERE project = ? AND vocabulary = ?", (project, vocabulary)
+        ).fetchone()
+        return (ObjectId(row[0]), row[1]) if row else (None, 0)
+
+    def save(self, project, vocabulary, last_id, rescored):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO rescore_progress (project, vocabulary, last_id, rescored, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (project, vocabulary, str(last_id), rescored, time.time())
+        )
+
+    def reset(self, project=None):
+        if project is None:
+            self._connection.execute("DELETE FROM rescore_progress")
+        else:
+            self._connection.execute("DELETE FROM rescore_progress WHERE project = ?", (project,))
+
+
+def iter_call_batches(collection, project_name, after_id=None, batch_size=RESCORE_BATCH_SIZE):
+    """Streams the processed calls of a project by _id as batches of (document_id, agent_text, (score, flag_deductions))."""
+    query = {"agent_info.project": project_name, "status": "processed"}
+    if after_id is not None:
+        query["_id"] = {"$gt": after_id}
+    cursor = collection.find(query, RESCORE_PROJECTION).sort("_id", 1).batch_size(batch_size)
+    batch = []
+    for document in cursor:
+        scores = (document.get("score"), document.get("flag_deductions"))
+        batch.append((document["_id"], collect_agent_text(document.get("segments") or []), scores))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def rescore_project(project_name, processes=RESCORE_PROCESSES, batch_size=RESCORE_BATCH_SIZE, progress=None):
+    """
+    Recomputes the scores of a project's processed calls from their stored segments.
+
+    Batches are scored in a process pool that receives the project vocabulary once; only scores
+    that changed are written back, in unordered bulk writes. Progress is recorded after each batch
+    in the order the calls were read, so a rerun with the same vocabulary resumes after the last
+    batch written.
+    """
+    progress = progress or RescoreProgress()
+    collection = get_collection(DATABASE_NAME, "calls")
+    vocabulary = get_project_vocabulary(project_name)
+    fingerprint = vocabulary_fingerprint(vocabulary)
+    last_id, rescored = progress.load(project_name, fingerprint)
+    if last_id is not None:
+        logging.info(f"Resuming rescoring of '{project_name}' after call {last_id} ({rescored} calls already rescored).")
+
+    processes = processes or multiprocessing.cpu_count()
+    start_time = time.time()
+    scored, changed = 0, 0
+    pending = deque()
+
+    def write_results(batch, future):
+        nonlocal scored, changed, rescored
+        updates = future.result()
+        if updates:
+            now = datetime.utcnow()
+            collection.bulk_write(
+                [
+                    UpdateOne({"_id": document_id}, {"$set": {"score": score, "flag_deductions": flag_deductions, "rescored_at": now}})
+                    for document_id, (score, flag_deductions) in updates
+                ],
+                ordered=False
+            )
+        scored += len(batch)
+        changed += len(updates)
+        rescored += len(batch)
+        progress.save(project_name, fingerprint, batch[-1][0], rescored)
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(processes, mp_context=context, initializer=_init_rescore_worker, initargs=(vocabulary,)) as pool:
+        for batch in iter_call_batches(collection, project_name, last_id, batch_size):
+            pending.append((batch, pool.submit(_rescore_batch, batch)))
+            # Keeps reading ahead bounded; batches are written in cursor order so the checkpoint never skips one
+            if len(pending) >= processes * 2:
+                write_results(*pending.popleft())
+                elapsed = time.time() - start_time
+                logging.info(f"Rescored {scored} calls of '{project_name}' ({changed} changed), {scored / max(elapsed, 1e-9):.0f} calls/s")
+        while pending:
+            write_results(*pending.popleft())
+
+    elapsed = time.time() - start_time
+    logging.info(f"Rescored {scored} calls of '{project_name}' in {elapsed:.1f}s; {changed} scores changed.")
+    return {"project": project_name, "scored": scored, "changed": changed, "seconds": elapsed}
+
+
+def rescore_calls(project_names=None, processes=RESCORE_PROCESSES, batch_size=RESCORE_BATCH_SIZE, restart=False):
+    """Rescores the processed calls of the given projects, or of every project that has any."""
+    progress = RescoreProgress()
+    if project_names is None:
+        project_names = sorted(
+            name for name in get_collection(DATABASE_NAME, "calls").distinct("agent_info.project", {"status": "processed"}) if name
+        )
+    results = []
+    for project_name in project_names:
+        if restart:
+            progress.reset(project_name)
+        results.append(rescore_project(project_name, processes, batch_size, progress))
+    return results
@@ -0,0 +1,151 @@
+# modules/result_cache.py
+import json
+import time
+import zlib
+import hashlib
+import logging
+import threading
+from . import config
+from .config import RESULT_CACHE_ENABLED, RESULT_CACHE_PATH, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_VERSION
+from .local_state import connect
+
+# Settings that change the transcripts or the NLP output of a call; each one is part of the cache key
+ANALYSIS_SETTINGS = (
+    "ASR_MODEL_ID", "ASSISTANT_MODEL_ID", "SENTIMENT_MODEL", "SPACY_MODEL", "LANGUAGE", "TASK",
+    "TARGET_SAMPLE_RATE", "AUDIO_BUFFER_DTYPE", "RESAMPLE_BLOCK_DURATION", "SEGMENTATION_MODE", "SEGMENT_LENGTH",
+    "VAD_FRAME_DURATION", "VAD_ENERGY_THRESHOLD_DB", "VAD_NOISE_MARGIN_DB", "VAD_NOISE_FLOOR_CAP_DB", "VAD_MIN_SPEECH_DURATION",
+    "VAD_MAX_SEGMENT_DURATION", "VAD_MERGE_GAP", "VAD_PADDING",
+    "KEY_PHRASE_MODE", "KEY_PHRASE_LANGUAGE", "KEY_PHRASE_MAX_NGRAM", "KEY_PHRASE_TOP", "KEY_PHRASE_DEDUP_LIMIT",
+)
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def audio_digest(audio_path, chunk_size=1024 * 1024):
+    """SHA-256 of the audio file contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(audio_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def analysis_fingerprint():
+    """The model ids and analysis settings the cached results depend on."""
+    settings = {name: getattr(config, name) for name in ANALYSIS_SETTINGS}
+    settings["RESULT_CACHE_VERSION"] = RESULT_CACHE_VERSION
+    return json.dumps(settings, sort_keys=True)
+
+
+def result_key(audio_path, digest=None):
+    """Content address of a call: the audio hash, when not given computed from the file, combined with the analysis fingerprint."""
+    digest = digest or audio_digest(audio_path)
+    return hashlib.sha256(f"{digest}:{analysis_fingerprint()}".encode()).hexdigest()
+
+
+def _encode(value):
+    # NumPy scalars that reach the segments are stored as plain numbers
+    return zlib.compress(json.dumps(value, default=lambda item: item.item()).encode("utf-8"))
+
+
+def _decode(data):
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+class ResultCache:
+    """
+    Persistent cache of the transcription and NLP results of a call, keyed by result_key.
+
+    Entries are compressed JSON in SQLite, so they survive restarts and are shared by the worker
+    processes. Once the entries take more than max_bytes, the least recently used are evicted.
+    Other caches of the same kind keep their entries in their own table of the same file.
+    """
+
+    def __init__(self, path=RESULT_CACHE_PATH, max_bytes=RESULT_CACHE_MAX_BYTES, table="results"):
+        self.max_bytes = max_bytes
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = connect(path)
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+
+    def get(self, key):
+        """Returns the cached results for key, or None."""
+        with self._lock:
+            row = self._connection.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            value = None
+            if row is not None:
+                try:
+                    value = _decode(row[0])
+                except Exception as e:
+                    logging.error(f"Discarding unreadable result cache entry {key}: {e}")
+                    self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._connection.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (time.time(), key))
+            return value
+
+    def put(self, key, value):
+        data = _encode(value)
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now)
+            )
+            self._evict()
+
+    def discard(self, key):
+        with self._lock:
+            self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def _evict(self):
+        total_bytes = self._connection.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        while total_bytes > self.max_bytes:
+            oldest = self._connection.execute(f"SELECT key, size FROM {self.table} ORDER BY last_access LIMIT 64").fetchall()
+            if not oldest:
+                return
+            for key, size in oldest:
+                if total_bytes <= self.max_bytes:
+                    break
+                self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                total_bytes -= size
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            entries, total_bytes = self._connection.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": total_bytes,
+            }
+
+    def log_stats(self):
+        stats = self.stats()
+        logging.info(
+            f"Cache {self.table}: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions, "
+            f"{stats['entries']} entries, {stats['bytes'] / 1024 ** 2:.1f} MB"
+        )
+
+
+def get_result_cache():
+    """Returns the result cache of this process, or None when it is disabled."""
+    global _result_cache
+    if not RESULT_CACHE_ENABLED:
+        return None
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache()
+        return _result_cache
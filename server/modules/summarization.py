@@ -0,0 +1,387 @@
+# modules/summarization.py
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .config import (
+    SUMMARY_CONCURRENCY, SUMMARY_REQUESTS_PER_MINUTE, SUMMARY_BURST, SUMMARY_MAX_ATTEMPTS, SUMMARY_BACKOFF_BASE,
+    SUMMARY_BACKOFF_MAX, SUMMARY_BREAKER_THRESHOLD, SUMMARY_BREAKER_RESET, SUMMARY_RETRY_INTERVAL, SUMMARY_MAX_REQUEUES, SUMMARY_TOKEN_BUDGET,
+    SUMMARY_LONG_TRANSCRIPT_MODE, SUMMARY_CACHE_MAX_BYTES, RESULT_CACHE_ENABLED, RESULT_CACHE_PATH, CALL_ANALYSES
+)
+from .database import get_collection
+from .prompt_preparation import compact_segments, estimate_tokens, truncate_segments, split_segments, summary_key
+from .result_cache import ResultCache
+
+_summarization_service = None
+_summarization_service_lock = threading.Lock()
+# Processes that each run a summarization service against the same model quota
+_summary_processes = 1
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the model while the circuit breaker is open."""
+
+
+class TokenBucket:
+    """Allows rate requests per second on average, with bursts of up to capacity requests."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service after failure_threshold consecutive failures.
+
+    While open, requests fail immediately; after reset_timeout seconds a single trial request is
+    let through, which closes the breaker on success or opens it again on failure.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None
+
+    def before_call(self):
+        """Raises CircuitOpenError while open; returns whether the call is the trial request."""
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0 or self._trial_running:
+                raise CircuitOpenError(f"Summarization paused after {self._failures} consecutive failures")
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logging.info("Summarization circuit closed again.")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            trial_failed = self._trial_running
+            self._trial_running = False
+            if trial_failed or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                logging.warning(f"Summarization circuit opened for {self.reset_timeout}s after {self._failures} consecutive failures.")
+
+    def remaining_open_time(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+
+def backoff_delay(attempt, base=SUMMARY_BACKOFF_BASE, maximum=SUMMARY_BACKOFF_MAX):
+    """Exponential backoff with full jitter: a random delay up to base * 2^attempt, capped at maximum."""
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+
+def default_summarize(transcript):
+    from .gemini_ai import request_call_summary
+    return request_call_summary(transcript)
+
+
+def default_analyze(transcript, from_parts=False):
+    from .gemini_ai import analyze_call
+    return analyze_call(transcript, CALL_ANALYSES, from_parts)
+
+
+def default_summary_cache():
+    if not RESULT_CACHE_ENABLED:
+        return None
+    return ResultCache(RESULT_CACHE_PATH, SUMMARY_CACHE_MAX_BYTES, table="summaries")
+
+
+def store_call_summary(document_id, analysis, status):
+    """Writes a finished summary and the other analyses, or the outcome of a failed one, to the call document."""
+    update = {"call_summary_status": status}
+    if analysis is not None:
+        update["call_summary"] = analysis["summary"]
+        other_analyses = {name: value for name, value in analysis.items() if name != "summary"}
+        if other_analyses:
+            update["call_analysis"] = other_analyses
+    get_collection("optima_solutions_services", "calls").update_one({"_id": document_id}, {"$set": update})
+
+
+def claim_failed_summary(max_requeues=SUMMARY_MAX_REQUEUES):
+    """
+    Takes a processed call whose summary failed and marks it pending again.
+
+    Returns (document_id, agent segment texts, words_to_remove), or None if there is no such call.
+    The update is atomic, so several processes retrying failed summaries never take the same call.
+    """
+    from .vocabulary import get_project_vocabulary
+    document = get_collection("optima_solutions_services", "calls").find_one_and_update(
+        {"status": "processed", "call_summary_status": "failed", "summary_requeues": {"$not": {"$gte": max_requeues}}},
+        {"$set": {"call_summary_status": "pending"}, "$inc": {"summary_requeues": 1}},
+        projection={"segments.transcription": 1, "segments.type_speaker": 1, "agent_info.project": 1}
+    )
+    if document is None:
+        return None
+    texts = [segment["transcription"] for segment in document.get("segments") or [] if segment["type_speaker"] == "agent"]
+    vocabulary = get_project_vocabulary(document.get("agent_info", {}).get("project"))
+    return document["_id"], texts, vocabulary.words_to_remove
+
+
+class SummarizationService:
+    """
+    Generates call summaries in the background, so a call is persisted without waiting for the model.
+
+    The summary and the other enabled analyses of a call come from a single analyze request.
+    Transcripts are compacted first: filler words, empty and repeated segments are dropped, and
+    transcripts over token_budget are truncated, or summarized in chunks whose summaries are then
+    analyzed together. The analysis of an identical compacted transcript is taken from the cache
+    instead of the API. Requests are spread over max_workers threads, limited by a token bucket,
+    retried with exponential backoff and jitter, and stopped by a circuit breaker while the model
+    keeps failing. Waiting for the breaker and failed trial requests do not use up attempts. With claim_failed,
+    a background thread takes calls whose summary failed every retry_interval seconds and queues
+    them again. analyze(transcript, from_parts) and summarize(transcript) are the functions that
+    call the model; tests and local runs can pass fake ones. store is called with
+    (document_id, analysis, status) once an analysis is done.
+    """
+
+    def __init__(self, summarize=None, store=store_call_summary, max_workers=SUMMARY_CONCURRENCY,
+                 requests_per_minute=SUMMARY_REQUESTS_PER_MINUTE, burst=SUMMARY_BURST, max_attempts=SUMMARY_MAX_ATTEMPTS,
+                 breaker=None, analyze=None, cache=None, token_budget=SUMMARY_TOKEN_BUDGET,
+                 long_transcript_mode=SUMMARY_LONG_TRANSCRIPT_MODE, analyses=CALL_ANALYSES, backoff_base=SUMMARY_BACKOFF_BASE,
+                 backoff_max=SUMMARY_BACKOFF_MAX, claim_failed=None, retry_interval=SUMMARY_RETRY_INTERVAL):
+        self.summarize = summarize or default_summarize
+        self.analyze = analyze or default_analyze
+        self.analyses = analyses
+        self.store = store
+        self.cache = cache
+        self.token_budget = token_budget
+        self.long_transcript_mode = long_transcript_mode
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.claim_failed = claim_failed
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        self.breaker = breaker or CircuitBreaker(SUMMARY_BREAKER_THRESHOLD, SUMMARY_BREAKER_RESET)
+        self.stats = {"submitted": 0, "succeeded": 0, "failed": 0, "retries": 0, "cached": 0, "requests": 0, "requeued": 0}
+        self._stats_lock = threading.Lock()
+        self._closing = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summarizer")
+        self._retry_thread = None
+        if claim_failed is not None:
+            self._retry_thread = threading.Thread(
+                target=self._requeue_periodically, args=(retry_interval,), name="summary-retry", daemon=True
+            )
+            self._retry_thread.start()
+
+    def submit(self, document_id, texts, words_to_remove=frozenset(), on_summary=None):
+        """Queues the analysis of a call from its agent segment texts; on_summary(analysis) runs after it has been stored."""
+        self._count("submitted")
+        return self._executor.submit(self._run, document_id, list(texts), words_to_remove, on_summary)
+
+    def _run(self, document_id, texts, words_to_remove, on_summary):
+        segments = compact_segments(texts, words_to_remove)
+        if segments:
+            analysis = self._cached_analysis(document_id, segments)
+            status = "done" if analysis is not None else "failed"
+        else:
+            # Nothing the agent said is left to summarize
+            analysis, status = None, "empty"
+        try:
+            self.store(document_id, analysis, status)
+        except Exception as e:
+            logging.error(f"Could not store the summary of call {document_id}: {e}")
+            return None
+        if analysis is not None and on_summary is not None:
+            try:
+                on_summary(analysis)
+            except Exception as e:
+                logging.error(f"Error after summarizing call {document_id}: {e}")
+        return analysis
+
+    def _cached_analysis(self, document_id, segments):
+        transcript = " ".join(segments)
+        key = summary_key(transcript, self.analyses)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._count("cached")
+                self._count("succeeded")
+                return cached
+        analysis = self._analyze_transcript(document_id, segments, transcript)
+        if analysis is not None:
+            self._count("succeeded")
+            if self.cache is not None:
+                try:
+                    self.cache.put(key, analysis)
+                except Exception as e:
+                    logging.error(f"Could not cache the summary of call {document_id}: {e}")
+        else:
+            self._count("failed")
+        return analysis
+
+    def _analyze_transcript(self, document_id, segments, transcript):
+        if estimate_tokens(transcript) <= self.token_budget:
+            return self._with_retries(document_id, self.analyze, transcript)
+        if self.long_transcript_mode == "truncate":
+            return self._with_retries(document_id, self.analyze, truncate_segments(segments, self.token_budget))
+
+        chunks = split_segments(segments, self.token_budget)
+        logging.info(f"Summarizing call {document_id} in {len(chunks)} parts.")
+        partial_summaries = []
+        for chunk in chunks:
+            partial_summary = self._with_retries(document_id, self.summarize, chunk)
+            if partial_summary is None:
+                return None
+            partial_summaries.append(partial_summary)
+        parts = "\n\n".join(f"Partea {index + 1}: {summary}" for index, summary in enumerate(partial_summaries))
+        return self._with_retries(document_id, lambda text: self.analyze(text, from_parts=True), parts)
+
+    def _with_retries(self, document_id, request, prompt_input):
+        attempt = 0
+        while attempt < self.max_attempts:
+            try:
+                trial = self.breaker.before_call()
+            except CircuitOpenError as e:
+                # Not an attempt: the model was not asked, so an outage alone never fails a summary
+                logging.warning(f"Summary of call {document_id} delayed: {e}")
+                delay = max(self.breaker.remaining_open_time(), self._backoff(1))
+                if self._closing.wait(delay):
+                    logging.warning(f"Summary of call {document_id} not requested before shutdown.")
+                    return None
+                continue
+            if attempt:
+                self._count("retries")
+            self.bucket.acquire()
+            self._count("requests")
+            try:
+                result = request(prompt_input)
+            except Exception as e:
+                self.breaker.record_failure()
+                if trial:
+                    # The trial only showed the model is still down; the call waits for the next one
+                    logging.warning(f"Trial summary of call {document_id} failed: {e}")
+                    continue
+                attempt += 1
+                if attempt < self.max_attempts:
+                    delay = self._backoff(attempt - 1)
+                    logging.warning(f"Summary of call {document_id} failed on attempt {attempt}: {e}. Retrying in {delay:.1f}s.")
+                    if self._closing.wait(delay):
+                        logging.warning(f"Summary of call {document_id} not retried before shutdown.")
+                        return None
+                continue
+            self.breaker.record_success()
+            return result
+        logging.error(f"Giving up on the summary of call {document_id} after {self.max_attempts} attempts.")
+        return None
+
+    def _backoff(self, attempt):
+        return backoff_delay(attempt, self.backoff_base, self.backoff_max)
+
+    def requeue_failed(self, limit=None):
+        """Queues the calls whose summary failed again; returns how many were queued."""
+        if self.claim_failed is None or self.breaker.is_open:
+            return 0
+        queued = 0
+        while limit is None or queued < limit:
+            claimed = self.claim_failed()
+            if claimed is None:
+                break
+            document_id, texts, words_to_remove = claimed
+            self.submit(document_id, texts, words_to_remove)
+            queued += 1
+        if queued:
+            self._count("requeued", queued)
+            logging.info(f"Queued {queued} failed summaries again.")
+        return queued
+
+    def _requeue_periodically(self, interval):
+        while not self._closing.wait(interval):
+            try:
+                self.requeue_failed(limit=self.bucket.capacity * 10)
+            except Exception as e:
+                logging.error(f"Error queueing failed summaries again: {e}")
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def close(self, wait=True):
+        """
+        Stops accepting summaries; with wait, returns once the queued ones are done.
+
+        Summaries waiting for the circuit breaker are not held up: they are stored as failed and
+        queued again by the next retry pass.
+        """
+        self._closing.set()
+        if self._retry_thread is not None:
+            self._retry_thread.join()
+        self._executor.shutdown(wait=wait)
+        logging.info(
+            f"Summarization: {self.stats['submitted']} submitted, {self.stats['succeeded']} succeeded "
+            f"({self.stats['cached']} from the cache), {self.stats['failed']} failed, {self.stats['requests']} requests, "
+            f"{self.stats['retries']} retries, {self.stats['requeued']} failed summaries queued again"
+        )
+
+
+def share_summary_limits(processes):
+    """
+    Splits the summary limits between processes that each run their own service, e.g. the workers of a fleet.
+
+    Each process gets 1/processes of SUMMARY_REQUESTS_PER_MINUTE, SUMMARY_BURST and SUMMARY_CONCURRENCY,
+    so together they stay within the configured quota. Burst and concurrency are at least 1 per
+    process, so with more processes than SUMMARY_CONCURRENCY up to one request per process is in flight.
+    Must be called before the service of this process is started.
+    """
+    global _summary_processes
+    _summary_processes = max(1, processes)
+
+
+def get_summarization_service():
+    """Returns the summarization service of this process, starting it on first use."""
+    global _summarization_service
+    with _summarization_service_lock:
+        if _summarization_service is None:
+            _summarization_service = SummarizationService(
+                cache=default_summary_cache(), claim_failed=claim_failed_summary,
+                max_workers=max(1, SUMMARY_CONCURRENCY // _summary_processes),
+                requests_per_minute=SUMMARY_REQUESTS_PER_MINUTE / _summary_processes,
+                burst=max(1, SUMMARY_BURST // _summary_processes)
+            )
+        return _summarization_service
+
+
+def close_summarization_service():
+    """Waits for the summaries still in progress in this process."""
+    global _summarization_service
+    with _summarization_service_lock:
+        service, _summarization_service = _summarization_service, None
+    if service is not None:
+        service.close()
@@ -1,13 +1,17 @@
 # modules/text_processing.py
 import yake
 import logging
+import threading
 from .config import (
     COMMON_WORDS, POSITIVE_WORDS, NEGATIVE_WORDS, GREETINGS_WORDS,
     COMPANIES_NAMES, WORDS_TO_REMOVE, AVAILABILITY_WORDS, FROM_WHAT_COMPANY,
-    GOOD_BYE_WORDS, DYNAMIC_FLAGS, SCORE
+    GOOD_BYE_WORDS, DYNAMIC_FLAGS, SCORE, NLP_BATCH_SIZE, SPACY_DISABLED_COMPONENTS, SENTIMENT_BATCH_SIZE,
+    KEY_PHRASE_LANGUAGE, KEY_PHRASE_MAX_NGRAM, KEY_PHRASE_TOP, KEY_PHRASE_DEDUP_LIMIT
 )
 import re
 
+# YAKE extractors keep internal caches, so each thread gets its own instance per language
+_keyword_extractors = threading.local()
 
 
 def lemmatize_text(nlp, text):
@@ -20,12 +24,51 @@ def extract_entities(nlp, text):
     return [(ent.text, ent.label_) for ent in doc.ents]
 
 
-def extract_key_phrases(text):
-    kw_extractor = yake.KeywordExtractor()
-    keywords = kw_extractor.extract_keywords(text)
+def analyze_texts(nlp, texts, batch_size=NLP_BATCH_SIZE, disabled_components=SPACY_DISABLED_COMPONENTS):
+    """Lemmatizes and extracts entities from all texts in one nlp.pipe pass, reusing each Doc for both."""
+    disable = [name for name in disabled_components if name in nlp.pipe_names]
+    return [
+        (" ".join([token.lemma_ for token in doc]), [(ent.text, ent.label_) for ent in doc.ents])
+        for doc in nlp.pipe(texts, batch_size=batch_size, disable=disable)
+    ]
+
+
+def classify_sentiments(sentiment_pipe, texts, batch_size=SENTIMENT_BATCH_SIZE):
+    """Classifies the sentiment of all texts in one batched pipeline call."""
+    if not texts:
+        return []
+    return sentiment_pipe(list(texts), batch_size=batch_size, truncation=True)
+
+
+def get_keyword_extractor(language=KEY_PHRASE_LANGUAGE):
+    """Returns this thread's YAKE extractor for the language, configuring it on first use."""
+    extractors = getattr(_keyword_extractors, "by_language", None)
+    if extractors is None:
+        extractors = _keyword_extractors.by_language = {}
+    if language not in extractors:
+        extractors[language] = yake.KeywordExtractor(
+            lan=language, n=KEY_PHRASE_MAX_NGRAM, top=KEY_PHRASE_TOP, dedup_lim=KEY_PHRASE_DEDUP_LIMIT
+        )
+    return extractors[language]
+
+
+def extract_key_phrases(text, language=KEY_PHRASE_LANGUAGE):
+    keywords = get_keyword_extractor(language).extract_keywords(text)
     return [keyword for keyword, score in keywords]
 
 
+def extract_key_phrases_batch(texts, language=KEY_PHRASE_LANGUAGE):
+    """Extracts key phrases from each text with the same configured extractor."""
+    kw_extractor = get_keyword_extractor(language)
+    return [[keyword for keyword, score in kw_extractor.extract_keywords(text)] for text in texts]
+
+
+def extract_call_key_phrases(texts, language=KEY_PHRASE_LANGUAGE):
+    """Extracts key phrases once from the joined transcript of a call."""
+    # Keep segment boundaries as sentence boundaries so n-grams do not span two turns
+    return extract_key_phrases(". ".join(text.rstrip(".!? ") for text in texts), language)
+
+
 def extract_and_combine_words(project_config):
     global GREETINGS_WORDS, COMPANIES_NAMES, AVAILABILITY_WORDS, FROM_WHAT_COMPANY, POSITIVE_WORDS, NEGATIVE_WORDS, COMMON_WORDS, WORDS_TO_REMOVE, GOOD_BYE_WORDS, DYNAMIC_FLAGS
 
@@ -0,0 +1,178 @@
+# modules/upload_manifest.py
+import os
+import time
+import logging
+import threading
+from .config import AUDIO_PATH, LOCAL_STATE_PATH, STORAGE_MAX_WORKERS
+from .firebase_storage import blob_path, transfer_files, upload_file_to_firebase
+from .local_state import connect
+from .result_cache import audio_digest
+
+_upload_manifest = None
+_upload_manifest_lock = threading.Lock()
+
+
+class UploadManifest:
+    """
+    Local record of the files already uploaded to Firebase Storage.
+
+    A file whose path, size and modification time match an entry is known to be uploaded without
+    reading it; a changed or new file is hashed, and if a file with the same content was uploaded
+    before, under any name, its object is reused instead of uploading the same recording again.
+    """
+
+    def __init__(self, path=LOCAL_STATE_PATH):
+        self._lock = threading.Lock()
+        self._connection = connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS uploaded_files "
+            "(path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, sha256 TEXT NOT NULL, "
+            "url TEXT NOT NULL, uploaded_at REAL NOT NULL, blob_name TEXT)"
+        )
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(uploaded_files)")}
+        if "blob_name" not in columns:
+            # Entries written before the object was recorded are uploaded again on first use
+            self._connection.execute("ALTER TABLE uploaded_files ADD COLUMN blob_name TEXT")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS uploaded_files_sha256 ON uploaded_files (sha256)")
+
+    def lookup(self, path, size, mtime_ns):
+        """Returns the (url, sha256, blob_name) of an unchanged uploaded file, or None."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT url, sha256, blob_name FROM uploaded_files "
+                "WHERE path = ? AND size = ? AND mtime_ns = ? AND blob_name IS NOT NULL", (path, size, mtime_ns)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def uploaded_object(self, sha256):
+        """Returns the (url, blob_name) of an uploaded file with this content, or None."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT url, blob_name FROM uploaded_files WHERE sha256 = ? AND blob_name IS NOT NULL LIMIT 1", (sha256,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def record(self, path, size, mtime_ns, sha256, url, blob_name):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO uploaded_files (path, size, mtime_ns, sha256, url, uploaded_at, blob_name) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, sha256, url, time.time(), blob_name)
+            )
+
+
+def get_upload_manifest():
+    """Returns the upload manifest of this process, opening it on first use."""
+    global _upload_manifest
+    with _upload_manifest_lock:
+        if _upload_manifest is None:
+            _upload_manifest = UploadManifest()
+        return _upload_manifest
+
+
+def upload_local_file(local_file_path, remote_file_name, project_name, folder="calls", manifest=None, sha256=None):
+    """
+    Uploads a local file unless the manifest shows it, or a file with the same content, is already uploaded.
+
+    Returns (url, sha256, blob_name), where blob_name is the object that holds the content, which
+    for a duplicate is the object of the first file; url is None if the upload failed. A sha256
+    already computed by the caller is not computed again.
+    """
+    manifest = manifest or get_upload_manifest()
+    path = os.path.abspath(local_file_path)
+    stat = os.stat(path)
+    known = manifest.lookup(path, stat.st_size, stat.st_mtime_ns)
+    if known:
+        return known
+
+    sha256 = sha256 or audio_digest(path)
+    uploaded = manifest.uploaded_object(sha256)
+    if uploaded:
+        url, blob_name = uploaded
+        logging.info(f"{remote_file_name} has the same content as {blob_name}; reusing it")
+    else:
+        blob_name = blob_path(project_name, remote_file_name, folder)
+        url = upload_file_to_firebase(path, remote_file_name, project_name, folder)
+        if url is None:
+            return None, sha256, None
+    manifest.record(path, stat.st_size, stat.st_mtime_ns, sha256, url, blob_name)
+    return url, sha256, blob_name
+
+
+def local_audio_files(audio_path=AUDIO_PATH):
+    """Yields (project_name, path) of the files in the project directories of audio_path."""
+    if not os.path.isdir(audio_path):
+        return
+    with os.scandir(audio_path) as projects:
+        for project in projects:
+            if not project.is_dir():
+                continue
+            with os.scandir(project.path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        yield project.name, os.path.abspath(entry.path)
+
+
+def reconcile_uploads(audio_path=AUDIO_PATH, max_workers=STORAGE_MAX_WORKERS, manifest=None):
+    """
+    Brings the manifest up to date with every file under audio_path, uploading the missing ones.
+
+    Files the manifest already knows cost a stat only; the others are hashed and uploaded on a
+    thread pool. Files with the same content share one upload: the first of them is uploaded
+    and the rest reuse its object. A file that disappears or cannot be read while this runs is
+    counted as failed and left for the next reconcile.
+    """
+    manifest = manifest or get_upload_manifest()
+    start_time = time.time()
+    pending = []
+    known = 0
+    unreadable = 0
+    for project_name, path in local_audio_files(audio_path):
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            logging.warning(f"Could not read {path}: {e}")
+            unreadable += 1
+            continue
+        if manifest.lookup(path, stat.st_size, stat.st_mtime_ns):
+            known += 1
+        else:
+            pending.append((project_name, path))
+
+    def digest(path):
+        try:
+            return audio_digest(path)
+        except OSError as e:
+            logging.warning(f"Could not read {path}: {e}")
+            return None
+
+    # Hashes the new files first, so duplicates among them are uploaded once
+    digests = transfer_files(digest, [(path,) for _, path in pending], max_workers)
+    by_digest = {}
+    for (project_name, path), sha256 in zip(pending, digests):
+        if sha256 is None:
+            unreadable += 1
+        else:
+            by_digest.setdefault(sha256, []).append((project_name, path))
+    hashed = sum(len(group) for group in by_digest.values())
+
+    def upload(project_name, path, sha256):
+        try:
+            return upload_local_file(path, os.path.basename(path), project_name, manifest=manifest, sha256=sha256)[0]
+        except OSError as e:
+            logging.warning(f"Could not upload {path}: {e}")
+            return None
+
+    def upload_group(sha256, group):
+        # The first file of a group is uploaded; the others find its object in the manifest
+        return [upload(project_name, path, sha256) for project_name, path in group]
+
+    results = transfer_files(upload_group, by_digest.items(), max_workers)
+
+    outcomes = [url for group in results for url in group]
+    failed = unreadable + outcomes.count(None)
+    logging.info(
+        f"Reconciled {known + len(pending)} files under {audio_path} in {time.time() - start_time:.1f}s: {known} already uploaded, "
+        f"{hashed - outcomes.count(None)} uploaded or deduplicated ({hashed - len(by_digest)} duplicates), {failed} failed."
+    )
+    return {"known": known, "new": len(pending), "duplicates": hashed - len(by_digest), "failed": failed}
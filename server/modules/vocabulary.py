@@ -0,0 +1,167 @@
+# modules/vocabulary.py
+import time
+import json
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import FrozenSet, Tuple, Any
+from .config import VOCABULARY_CHECK_INTERVAL
+from .database import get_collection
+from .keyword_matcher import KeywordMatcher
+
+# Collections of word_database and the matching list fields of a project document
+WORD_CATEGORIES = (
+    "common_words", "positive_words", "negative_words", "greetings_words", "companies_names",
+    "words_to_remove", "availability_words", "from_what_company", "good_bye_words"
+)
+
+# Evaluation category names used in the logs, mapped to the vocabulary field they read
+EVALUATION_CATEGORIES = {
+    "Greetings": "greetings_words",
+    "Companies": "companies_names",
+    "Goodbyes": "good_bye_words",
+    "Availability": "availability_words",
+    "Company Inquiry": "from_what_company",
+    "Positive": "positive_words",
+    "Negative": "negative_words",
+    "Common": "common_words",
+}
+
+FLAG_PREFIX = "flag:"
+
+
+@dataclass(frozen=True)
+class DynamicFlag:
+    name: str
+    keywords: FrozenSet[str]
+    score: Any
+
+
+@dataclass(frozen=True)
+class Vocabulary:
+    """Immutable snapshot of the general and project-specific word lists of one project."""
+    project_name: str
+    version: Tuple
+    common_words: FrozenSet[str] = frozenset()
+    positive_words: FrozenSet[str] = frozenset()
+    negative_words: FrozenSet[str] = frozenset()
+    greetings_words: FrozenSet[str] = frozenset()
+    companies_names: FrozenSet[str] = frozenset()
+    words_to_remove: FrozenSet[str] = frozenset()
+    availability_words: FrozenSet[str] = frozenset()
+    from_what_company: FrozenSet[str] = frozenset()
+    good_bye_words: FrozenSet[str] = frozenset()
+    dynamic_flags: Tuple[DynamicFlag, ...] = ()
+    matcher: KeywordMatcher = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # The keyword index is built once, together with the snapshot
+        object.__setattr__(self, "matcher", KeywordMatcher(self.categories()))
+
+    def categories(self):
+        """Returns every word list used to evaluate an agent, keyed by category."""
+        categories = {name: getattr(self, attribute) for name, attribute in EVALUATION_CATEGORIES.items()}
+        for flag in self.dynamic_flags:
+            categories[FLAG_PREFIX + flag.name] = flag.keywords
+        return categories
+
+
+@dataclass
+class _CachedVocabulary:
+    vocabulary: Vocabulary
+    checked_at: float
+
+
+_vocabulary_cache = {}
+_vocabulary_lock = threading.Lock()
+
+
+def fetch_general_version():
+    """Cheap fingerprint of word_database: document count and newest _id of every collection."""
+    version = []
+    for collection_name in WORD_CATEGORIES:
+        collection = get_collection("word_database", collection_name)
+        newest = collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        version.append((collection_name, collection.estimated_document_count(), str(newest["_id"]) if newest else None))
+    return tuple(version)
+
+
+def fetch_project_document(project_name):
+    projection = {field_name: 1 for field_name in WORD_CATEGORIES}
+    projection.update({"analyze_flags": 1, "updated_at": 1})
+    projects_collection = get_collection("optima_solutions_services", "projects")
+    return projects_collection.find_one({"project_name": project_name}, projection)
+
+
+def project_version(project):
+    """Version of the project word lists: its updated_at field, or a hash of the lists when it has none."""
+    if not project:
+        return None
+    if project.get("updated_at"):
+        return str(project["updated_at"])
+    content = {key: value for key, value in project.items() if key not in ("_id", "updated_at")}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def load_general_words(collection_name):
+    collection = get_collection("word_database", collection_name)
+    return {document["word"] for document in collection.find({}, {"word": 1, "_id": 0}) if document.get("word")}
+
+
+def build_vocabulary(project_name, version, project):
+    """Reads the word lists from MongoDB and freezes them into a Vocabulary."""
+    words = {}
+    for collection_name in WORD_CATEGORIES:
+        category_words = load_general_words(collection_name)
+        if project:
+            category_words.update(word for word in project.get(collection_name, []) if word)
+        words[collection_name] = frozenset(category_words)
+
+    dynamic_flags = ()
+    if project:
+        dynamic_flags = tuple(
+            DynamicFlag(flag["flag"], frozenset(flag["keywords"]), flag["score"])
+            for flag in project.get("analyze_flags", [])
+        )
+    else:
+        logging.warning(f"Project '{project_name}' not found in the database. Only general words loaded.")
+
+    vocabulary = Vocabulary(project_name=project_name, version=version, dynamic_flags=dynamic_flags, **words)
+    counts = ", ".join(f"{name}: {len(words[name])}" for name in WORD_CATEGORIES)
+    logging.info(f"Loaded vocabulary for project '{project_name}' ({counts}, flags: {len(dynamic_flags)}).")
+    return vocabulary
+
+
+def get_project_vocabulary(project_name, check_interval=VOCABULARY_CHECK_INTERVAL):
+    """
+    Returns the vocabulary snapshot of a project.
+
+    Snapshots are cached per project and rebuilt only when the version of the general
+    word lists or of the project document changes. The version itself is checked at most
+    once every check_interval seconds.
+    """
+    with _vocabulary_lock:
+        cached = _vocabulary_cache.get(project_name)
+        now = time.monotonic()
+        if cached and now - cached.checked_at < check_interval:
+            return cached.vocabulary
+
+        project = fetch_project_document(project_name)
+        version = (fetch_general_version(), project_version(project))
+        if cached and cached.vocabulary.version == version:
+            cached.checked_at = now
+            return cached.vocabulary
+
+        vocabulary = build_vocabulary(project_name, version, project)
+        _vocabulary_cache[project_name] = _CachedVocabulary(vocabulary, now)
+        return vocabulary
+
+
+def invalidate_vocabulary(project_name=None):
+    """Forces the next lookup of a project, or of every project, to check the version again."""
+    with _vocabulary_lock:
+        if project_name is None:
+            _vocabulary_cache.clear()
+        else:
+            _vocabulary_cache.pop(project_name, None)
@@ -0,0 +1,280 @@
+# modules/workers.py
+import os
+import queue
+import signal
+import logging
+import threading
+import multiprocessing
+from .config import POLL_MIN_INTERVAL, WORKER_SHUTDOWN_TIMEOUT, JOB_CLAIM_BATCH_SIZE
+
+
+def default_threads_per_worker(num_workers):
+    """Splits the available cores evenly between the workers."""
+    return max(1, (os.cpu_count() or 1) // max(1, num_workers))
+
+
+def set_worker_thread_environment(threads):
+    """
+    Caps the OpenMP, MKL and OpenBLAS thread pools of the worker processes started after this call.
+
+    The libraries read these variables once, when numpy and torch are first imported, and a worker
+    imports them while unpickling its target, before worker_main runs. Setting them in the parent
+    means every spawned worker has them in its environment from the start.
+    """
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+
+
+def configure_worker_threads(threads):
+    """Caps the intra-op thread pools so N workers do not oversubscribe the CPU."""
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only allowed before any parallel work has started in this process
+        pass
+
+
+def load_worker_models():
+    """Loads the models and builds the pipelines once for the lifetime of a worker."""
+    from .model_registry import get_asr_pipeline, get_sentiment_pipeline, get_spacy_model, log_model_stats
+
+    asr_pipe, sentiment_pipe, nlp = get_asr_pipeline(), get_sentiment_pipeline(), get_spacy_model()
+    log_model_stats()
+    return asr_pipe, sentiment_pipe, nlp
+
+
+def worker_main(worker_index, job_queue, done_queue, stop_event, threads, num_workers=1):
+    """Entry point of a worker process: loads the models once, then pulls calls until told to stop."""
+    # The parent owns shutdown; workers finish the call in hand and exit on the sentinel or stop event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - worker-{worker_index} - %(levelname)s - %(message)s'
+    )
+    configure_worker_threads(threads)
+
+    from .call_processing import process_single_file, call_started
+    from .summarization import close_summarization_service, share_summary_limits
+
+    # Every worker summarizes its own calls; together they keep to the configured summary quota
+    share_summary_limits(num_workers)
+
+    asr_pipe, sentiment_pipe, nlp = load_worker_models()
+    logging.info(f"Worker {worker_index} ready with {threads} threads.")
+    done_queue.put(("ready", worker_index))
+
+    while not stop_event.is_set():
+        try:
+            job = job_queue.get(timeout=1)
+        except queue.Empty:
+            continue
+        if job is None:
+            break
+
+        file_info, project_name, force_process = job["file_info"], job["project_name"], job["force_process"]
+        # Lets the parent hand the call back if this process dies while working on it
+        done_queue.put(("taken", worker_index, (project_name, file_info["filename"])))
+        processed_files = set()
+        started = False
+        try:
+            call = process_single_file(file_info, project_name, asr_pipe, sentiment_pipe, nlp, processed_files, force_process)
+            started = call_started(call)
+        except Exception as e:
+            logging.error(f"Worker {worker_index} failed on {file_info['filename']}: {e}", exc_info=True)
+        done_queue.put(("done", worker_index, (project_name, file_info["filename"]), (project_name, file_info["filename"]) in processed_files, started))
+
+    close_summarization_service()
+    logging.info(f"Worker {worker_index} exiting.")
+
+
+def discover_jobs(processed_files, in_flight, claim_limit=JOB_CLAIM_BATCH_SIZE, ingestion=None):
+    """Claims the calls waiting to be processed, or lists new local files, skipping those already queued or done."""
+    from .job_queue import claim_calls
+    from .ingestion import Ingestion
+
+    jobs = []
+    to_process_files = claim_calls(claim_limit)
+    if to_process_files:
+        for file_info in to_process_files:
+            project_name = file_info["agent_info"]["project"]
+            jobs.append({"file_info": file_info, "project_name": project_name, "force_process": True})
+    else:
+        ingestion = ingestion or Ingestion(processed_files)
+        for file_info, project_name, force_process in ingestion.collect_local_calls(in_flight):
+            jobs.append({"file_info": file_info, "project_name": project_name, "force_process": force_process})
+
+    # A call requeued while a worker still has it is left to that worker; its lease is the same one
+    return [job for job in jobs if (job["project_name"], job["file_info"]["filename"]) not in in_flight]
+
+
+def run_worker_fleet(num_workers, threads_per_worker=None, poll_interval=POLL_MIN_INTERVAL):
+    """
+    Runs N worker processes fed from a shared queue until SIGINT or SIGTERM.
+
+    A worker that dies, e.g. killed for running out of memory, has its call handed back to the queue
+    as a failed attempt and is started again. A worker that dies before its models are loaded is not
+    restarted, as the next one would fail the same way; once no workers are left the fleet stops.
+    """
+    from .job_queue import get_lease_keeper, fail_call, return_call
+    from .local_state import ProcessedFiles
+    from .ingestion import Ingestion
+
+    threads = threads_per_worker or default_threads_per_worker(num_workers)
+    set_worker_thread_environment(threads)
+    processed_files = ProcessedFiles()
+    ingestion = Ingestion(processed_files)
+    context = multiprocessing.get_context("spawn")
+    job_queue = context.Queue(maxsize=num_workers * 2)
+    done_queue = context.Queue()
+    stop_event = context.Event()
+    shutdown_requested = threading.Event()
+
+    def request_shutdown(sig, frame):
+        logging.info(f"Signal {sig} received. Finishing in-flight calls and stopping workers...")
+        shutdown_requested.set()
+        stop_event.set()
+        ingestion.wake_up()
+
+    signal.signal(signal.SIGINT, request_shutdown)
+    signal.signal(signal.SIGTERM, request_shutdown)
+
+    def start_worker(index):
+        worker = context.Process(target=worker_main, args=(index, job_queue, done_queue, stop_event, threads, num_workers), name=f"worker-{index}")
+        worker.start()
+        return worker
+
+    workers = {index: start_worker(index) for index in range(num_workers)}
+    logging.info(f"Started {num_workers} workers with {threads} threads each.")
+    ingestion.start()
+
+    # (project, filename) -> claim of the calls queued or in progress; claims stay leased by this process
+    in_flight = {}
+    # Worker index -> the (project, filename) call it is working on, and the workers that loaded their models
+    taken = {}
+    ready = set()
+    # Calls the workers started since the fleet last went idle
+    started = 0
+
+    def drain_done_queue():
+        """Settles the calls the workers finished and notes which worker took which call."""
+        nonlocal started
+        while True:
+            try:
+                kind, worker_index, *details = done_queue.get_nowait()
+            except queue.Empty:
+                return
+            if kind == "ready":
+                ready.add(worker_index)
+                continue
+            if kind == "taken":
+                taken[worker_index] = details[0]
+                continue
+            key, tracked, call_started = details
+            taken.pop(worker_index, None)
+            claim = in_flight.pop(key, None)
+            if claim:
+                get_lease_keeper().release(claim)
+            # Workers only report a call as tracked once its results are stored, or once it needs no further pass
+            if tracked:
+                processed_files.add(key)
+            started += call_started
+
+    def replace_dead_workers():
+        """Hands back the calls of the workers that died and restarts them; stops the fleet once none are left."""
+        # Whatever a worker reported before it died is settled first
+        drain_done_queue()
+        for index, worker in list(workers.items()):
+            if worker.is_alive():
+                continue
+            reason = f"{worker.name} exited with code {worker.exitcode}"
+            key = taken.pop(index, None)
+            if key:
+                logging.error(f"{reason} while processing {key[1]}.")
+                # A call that keeps killing its worker uses up its attempts and ends up failed
+                claim = in_flight.pop(key, None)
+                if claim:
+                    fail_call(claim, reason)
+            else:
+                logging.error(f"{reason}.")
+            if index in ready:
+                ready.discard(index)
+                workers[index] = start_worker(index)
+                logging.info(f"Restarted {worker.name}.")
+            else:
+                logging.error(f"{worker.name} died before its models were loaded; it is not restarted.")
+                del workers[index]
+        if not workers and not shutdown_requested.is_set():
+            logging.error("No workers are left. Stopping.")
+            shutdown_requested.set()
+            stop_event.set()
+
+    try:
+        while not shutdown_requested.is_set():
+            replace_dead_workers()
+            claim_limit = max(0, num_workers * 2 - len(in_flight))
+            jobs = discover_jobs(processed_files, in_flight, claim_limit, ingestion) if claim_limit else []
+            for index, job in enumerate(jobs):
+                key = (job["project_name"], job["file_info"]["filename"])
+                while not shutdown_requested.is_set():
+                    try:
+                        job_queue.put(job, timeout=1)
+                        in_flight[key] = job["file_info"].get("claim")
+                        break
+                    except queue.Full:
+                        replace_dead_workers()
+                if shutdown_requested.is_set():
+                    # Claimed but never queued: hand them back for another worker
+                    for unqueued in jobs[index:]:
+                        if unqueued["file_info"].get("claim"):
+                            return_call(unqueued["file_info"]["claim"])
+                    break
+            if shutdown_requested.is_set():
+                break
+            if in_flight:
+                # Workers are busy; check back soon so freed capacity is refilled
+                shutdown_requested.wait(poll_interval)
+            else:
+                # Idle: look again right away only if the calls handed out were started, not skipped or failed early
+                ingestion.wait(found_work=started > 0)
+                started = 0
+    finally:
+        ingestion.stop()
+        for job in stop_workers(list(workers.values()), job_queue, stop_event):
+            if job["file_info"].get("claim"):
+                return_call(job["file_info"]["claim"])
+
+
+def stop_workers(workers, job_queue, stop_event, timeout=WORKER_SHUTDOWN_TIMEOUT):
+    """
+    Asks every worker to exit after its current call and terminates the ones that do not.
+
+    Returns the jobs that were still queued and never started.
+    """
+    stop_event.set()
+    for _ in workers:
+        try:
+            job_queue.put_nowait(None)
+        except queue.Full:
+            break
+
+    for worker in workers:
+        worker.join(timeout)
+        if worker.is_alive():
+            logging.warning(f"{worker.name} did not stop within {timeout} seconds. Terminating.")
+            worker.terminate()
+            worker.join()
+    logging.info("All workers stopped.")
+
+    unstarted = []
+    while True:
+        try:
+            job = job_queue.get_nowait()
+        except (queue.Empty, OSError, ValueError):
+            break
+        if job is not None:
+            unstarted.append(job)
+    return unstarted
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from modules.conversation_metrics import (
+    ConversationMetrics, compute_conversation_metrics, compute_metrics_incremental, compute_metrics_vectorized
+)
+
+AGENT, CLIENT = "SPEAKER_00", "SPEAKER_01"
+
+
+def segment(speaker, start, end):
+    return {"speaker": speaker, "time_range": {"start": start, "end": end}}
+
+
+# (segments, talk, dead air, crosstalk, turns), worked out by hand
+TIMELINES = {
+    "overlapping": (
+        [segment(AGENT, 0, 4), segment(CLIENT, 3, 6)],
+        {AGENT: 4, CLIENT: 3}, {AGENT: 0, CLIENT: 3}, 1, {AGENT: 1, CLIENT: 1},
+    ),
+    "nested": (
+        [segment(AGENT, 0, 10), segment(CLIENT, 2, 5), segment(AGENT, 11, 12)],
+        {AGENT: 11, CLIENT: 3}, {AGENT: 1, CLIENT: 2}, 3, {AGENT: 2, CLIENT: 1},
+    ),
+    "touching": (
+        [segment(AGENT, 0, 2), segment(CLIENT, 2, 4), segment(AGENT, 4, 5)],
+        {AGENT: 3, CLIENT: 2}, {AGENT: 2, CLIENT: 2}, 0, {AGENT: 2, CLIENT: 1},
+    ),
+    "same speaker overlap": (
+        [segment(AGENT, 0, 3), segment(AGENT, 2, 5), segment(CLIENT, 4, 6)],
+        {AGENT: 6, CLIENT: 2}, {AGENT: 0, CLIENT: 4}, 1, {AGENT: 1, CLIENT: 1},
+    ),
+    "dead air and late start": (
+        [segment(CLIENT, 1, 2), segment(AGENT, 3, 4), segment(CLIENT, 6, 7)],
+        {AGENT: 1, CLIENT: 2}, {AGENT: 3, CLIENT: 5}, 0, {AGENT: 1, CLIENT: 2},
+    ),
+}
+
+
+@pytest.mark.parametrize("compute", [compute_metrics_incremental, compute_metrics_vectorized])
+@pytest.mark.parametrize("name", list(TIMELINES))
+def test_known_timelines(compute, name):
+    segments, talk, dead_air, crosstalk, turns = TIMELINES[name]
+    result = compute(segments)
+    assert result["total_talk_duration"] == pytest.approx(talk)
+    assert result["total_dead_air_duration"] == pytest.approx(dead_air)
+    assert result["crosstalk_duration"] == pytest.approx(crosstalk)
+    assert result["turn_count"] == turns
+
+
+def random_segments(rng, count):
+    segments, start = [], 0.0
+    for _ in range(count):
+        start += rng.uniform(0, 3)
+        segments.append(segment(rng.choice([AGENT, CLIENT]), round(start, 2), round(start + rng.uniform(0.1, 6), 2)))
+    rng.shuffle(segments)
+    return segments
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_incremental_and_vectorized_agree(seed):
+    segments = random_segments(random.Random(seed), 200)
+    incremental = compute_metrics_incremental(segments)
+    vectorized = compute_metrics_vectorized(segments)
+    assert vectorized["total_talk_duration"] == pytest.approx(incremental["total_talk_duration"])
+    assert vectorized["total_dead_air_duration"] == pytest.approx(incremental["total_dead_air_duration"])
+    assert vectorized["crosstalk_duration"] == pytest.approx(incremental["crosstalk_duration"])
+    assert vectorized["turn_count"] == incremental["turn_count"]
+
+
+def test_vectorized_path_is_used_for_long_calls():
+    segments = random_segments(random.Random(0), 50)
+    assert compute_conversation_metrics(segments, vectorize_min_segments=10) == compute_metrics_vectorized(segments)
+    assert compute_conversation_metrics(segments, vectorize_min_segments=100) == compute_metrics_incremental(segments)
+
+
+def test_out_of_order_add_is_rejected():
+    metrics = ConversationMetrics()
+    metrics.add(AGENT, 5, 6)
+    with pytest.raises(ValueError):
+        metrics.add(CLIENT, 4, 7)
@@ -0,0 +1,41 @@
+import wave
+
+import numpy as np
+import pytest
+import torch
+
+from modules.audio_processing import load_and_preprocess_audio, open_streaming_audio, probe_audio
+
+
+def write_call(path, sample_rate, sample_width, seconds=25):
+    """Writes a two-channel WAV of a tone and noise, long enough to span several resampling blocks."""
+    rng = np.random.default_rng(sample_rate)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    signal = np.stack([np.sin(2 * np.pi * 220 * t), rng.normal(0, 0.3, len(t))], axis=1) * 0.8
+    if sample_width == 1:
+        samples = (signal * 127 + 128).astype(np.uint8)
+    else:
+        samples = (signal * 32767).astype("<i2")
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(sample_width)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+
+
+@pytest.mark.parametrize("sample_rate,sample_width", [(8000, 1), (16000, 2), (22050, 1), (44100, 2), (48000, 2), (48000, 1)])
+def test_streamed_slices_match_the_loaded_buffer(tmp_path, sample_rate, sample_width):
+    path = tmp_path / "call.wav"
+    write_call(path, sample_rate, sample_width)
+    info = probe_audio(str(path))
+    loaded, loaded_rate = load_and_preprocess_audio(str(path), info)
+    streamed, streamed_rate = open_streaming_audio(str(path), info)
+    assert loaded_rate == streamed_rate
+
+    rng = np.random.default_rng(0)
+    for channel_index in range(2):
+        assert len(streamed[channel_index]) == len(loaded[channel_index])
+        for _ in range(50):
+            start = int(rng.integers(0, len(loaded[channel_index])))
+            stop = start + int(rng.integers(0, 12 * loaded_rate))
+            assert torch.equal(streamed[channel_index][start:stop], loaded[channel_index][start:stop])
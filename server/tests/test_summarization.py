@@ -0,0 +1,156 @@
+import threading
+import time
+
+import pytest
+
+from modules.summarization import CircuitBreaker, CircuitOpenError, SummarizationService, TokenBucket, backoff_delay
+
+
+class FakeModel:
+    """Stands in for the model: fails while down, otherwise answers with a summary of the transcript."""
+
+    def __init__(self, failures=0, down_for=0.0):
+        self.failures = failures
+        self.down_until = time.monotonic() + down_for
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def analyze(self, transcript, from_parts=False):
+        with self._lock:
+            self.calls.append(time.monotonic())
+            if self.failures > 0 or time.monotonic() < self.down_until:
+                self.failures -= 1
+                raise RuntimeError("model unavailable")
+        return {"summary": f"summary of {transcript}"}
+
+
+class Store:
+    def __init__(self):
+        self.results = {}
+
+    def __call__(self, document_id, analysis, status):
+        self.results[document_id] = (status, analysis)
+
+
+def make_service(model, store, **options):
+    settings = {
+        "analyze": model.analyze, "store": store, "max_workers": 4, "requests_per_minute": 6000, "burst": 10,
+        "max_attempts": 3, "backoff_base": 0.01, "backoff_max": 0.05,
+        "breaker": CircuitBreaker(failure_threshold=3, reset_timeout=0.1),
+    }
+    settings.update(options)
+    return SummarizationService(**settings)
+
+
+def test_token_bucket_limits_the_rate():
+    bucket = TokenBucket(rate=20, capacity=2)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # Two requests go out at once, the other four wait 1/20 s each
+    assert time.monotonic() - start >= 0.19
+
+
+@pytest.mark.parametrize("attempt", range(8))
+def test_backoff_delay_is_bounded(attempt):
+    for _ in range(50):
+        assert 0 <= backoff_delay(attempt, base=1.0, maximum=10.0) <= min(10.0, 2 ** attempt)
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()  # the trial request
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # only one trial at a time
+    breaker.record_failure()
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_success()
+    assert not breaker.is_open
+    breaker.before_call()
+
+
+def test_failed_requests_are_retried():
+    model, store = FakeModel(failures=2), Store()
+    service = make_service(model, store)
+    service.submit("call", ["Bună ziua"]).result()
+    service.close()
+    assert store.results["call"] == ("done", {"summary": "summary of Bună ziua"})
+    assert service.stats["retries"] == 2
+
+
+def test_summary_fails_after_max_attempts():
+    model, store = FakeModel(failures=10), Store()
+    service = make_service(model, store, breaker=CircuitBreaker(failure_threshold=100, reset_timeout=0.1))
+    service.submit("call", ["Bună ziua"]).result()
+    service.close()
+    assert store.results["call"] == ("failed", None)
+    assert len(model.calls) == 3
+
+
+def test_outage_does_not_fail_summaries():
+    model, store = FakeModel(down_for=0.5), Store()
+    service = make_service(model, store)
+    futures = [service.submit(f"call {index}", [f"text {index}"]) for index in range(12)]
+    for future in futures:
+        future.result(timeout=10)
+    service.close()
+    assert all(status == "done" for status, _ in store.results.values())
+    assert len(store.results) == 12
+    # The open breaker kept the calls away from the model instead of spending their attempts
+    assert len(model.calls) < 12 * 3
+
+
+def test_failed_summaries_are_queued_again():
+    model, store = FakeModel(failures=3), Store()
+    failed = [("call", ["Bună ziua"], frozenset())]
+    service = make_service(
+        model, store, breaker=CircuitBreaker(failure_threshold=100, reset_timeout=0.1),
+        claim_failed=lambda: failed.pop() if failed else None, retry_interval=3600
+    )
+    service.submit("call", ["Bună ziua"]).result()
+    assert store.results["call"][0] == "failed"
+    assert service.requeue_failed() == 1
+    service.close()
+    assert store.results["call"][0] == "done"
+
+
+def test_close_does_not_wait_for_an_open_breaker():
+    model, store = FakeModel(failures=3), Store()
+    service = make_service(model, store, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+    future = service.submit("call", ["Bună ziua"])
+    time.sleep(0.1)
+    start = time.monotonic()
+    service.close()
+    assert time.monotonic() - start < 5
+    assert future.result() is None
+    assert store.results["call"] == ("failed", None)
+
+
+def test_close_does_not_wait_for_a_retry_backoff():
+    model, store = FakeModel(failures=10), Store()
+    service = make_service(
+        model, store, breaker=CircuitBreaker(failure_threshold=100, reset_timeout=0.1),
+        max_attempts=10, backoff_base=60, backoff_max=60
+    )
+    future = service.submit("call", ["Bună ziua"])
+    time.sleep(0.1)
+    start = time.monotonic()
+    service.close()
+    assert time.monotonic() - start < 5
+    assert future.result() is None
+    assert store.results["call"] == ("failed", None)
+    # Shutdown ends the retries instead of running through the remaining attempts
+    assert len(model.calls) < 10
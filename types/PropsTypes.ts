@@ -28,6 +28,7 @@ export interface CallDetails {
     duration: number;
     day: string;
     file_path: string;
+    blob_name?: string; // Storage object of the audio, written by the processing server
   };
   segments: Segment[];
   day_processed?: string | Date; // Consider using Date if this is a date
@@ -41,8 +42,24 @@ export interface CallDetails {
     SPEAKER_00: number;
     SPEAKER_01: number;
   };
+  turn_count?: {
+    SPEAKER_00: number;
+    SPEAKER_01: number;
+  };
+  flag_deductions?: number;
   status: 'completed' | 'to_process' | 'failed' | 'new' | 'processing'; // Added 'new' status
   call_summary: string;
+  call_summary_status?: 'pending' | 'done' | 'failed' | 'empty';
+  call_analysis?: {
+    coaching_tips?: string[];
+    performance?: {
+      positives: string[];
+      negatives: string[];
+      recommendations: string[];
+    };
+    knowledge_base_articles?: string[];
+    follow_up_email?: string;
+  };
 }
 
 // Define the WordCount interface